@@ -1,5 +1,58 @@
 from __future__ import absolute_import
 
-from .capturelog import *
-from .msg_util import *
-from .spot_monitor import *
+# standard
+import importlib
+import sys
+import types
+
+
+# public names, by the module that defines them. a module is only imported when one of its
+# names is first used, so importing the package (e.g., for the command line) doesn't pull
+# in boto, numpy or smtplib.
+_EXPORTS = {
+    'backtest': ['BACKTEST_STRATEGIES', 'Backtest', 'load_history'],
+    'batch': ['MutationBatch'],
+    'capture_buffer': ['CaptureBuffer'],
+    'capturelog': ['CaptureLog'],
+    'events': ['DEBUG', 'ERROR', 'INFO', 'WARNING', 'EventLog', 'JsonlSink', 'TextSink', 'parse_level'],
+    'fleet': ['FleetMonitor'],
+    'hooks': ['HookExecutor'],
+    'journal': ['Journal'],
+    'mailer': ['MailQueue', 'get_mail_queue'],
+    'metrics': ['InstrumentedConnection', 'Registry', 'REGISTRY', 'serve_metrics'],
+    'msg_util': ['create_plaintext_msg', 'open_smtp', 'send_plaintext_msg'],
+    'notices': ['InterruptionWatcher', 'serve_notices'],
+    'placement': ['Placement', 'PlacementOptimizer', 'request_zone'],
+    'price_history': ['PriceHistory', 'PriceSeries', 'parse_timestamp'],
+    'price_stats': ['PriceStats', 'STATS_STRATEGIES', 'batch_stats', 'compute_stats',
+                    'strategy_price', 'time_above', 'to_arrays'],
+    'query': ['ACTIVE_INSTANCE_STATES', 'get_spot_instances', 'get_spot_requests'],
+    'scheduler': ['PollScheduler'],
+    'throttle': ['ACTIONABLE_CODES', 'RETRYABLE_CODES', 'ThrottledConnection', 'TokenBucket', 'classify'],
+    'spot_monitor': ['AwsSpotMonitor', 'connect'],
+}
+
+_MODULES = dict((name, module) for module, names in _EXPORTS.items() for name in names)
+
+__all__ = sorted(_MODULES)
+
+
+class _Package(types.ModuleType):
+    """The package module; imports the module behind a public name on first use."""
+    def __getattr__(self, name):
+        module = _MODULES.get(name)
+        if module is None:
+            raise AttributeError("'module' object has no attribute '{0}'".format(name))
+        value = getattr(importlib.import_module('.' + module, __name__), name)
+        setattr(self, name, value)
+        return value
+
+    def __dir__(self):
+        return sorted(set(self.__dict__) | set(_MODULES))
+
+
+_package = _Package(__name__, __doc__)
+_package.__dict__.update((k, v) for k, v in globals().items() if k != '_package')
+# keep this module alive: python 2 clears a module's globals when it's collected.
+_package._module = sys.modules[__name__]
+sys.modules[__name__] = _package
@@ -0,0 +1,328 @@
+"""Backtests bid strategies against recorded spot-price history.
+
+usage: python -m awsspotmonitor.backtest <history-file> [--zone ZONE] [--instance-type TYPE]
+           [--product-description DESC] [--strategies high,average-high,average,random]
+           [--days 1,5,10] [--factors 1.05] [--check-secs 180]
+
+The history file is CSV (with a header row) or JSON lines, with a timestamp (ISO 8601 or
+seconds since the epoch), a price and, optionally, the availability zone, instance type and
+product description of each sample, e.g., as recorded from describe-spot-price-history.
+Column and key names are matched loosely: 'Timestamp', 'SpotPrice', 'AvailabilityZone',
+'availability_zone', ... all work.
+"""
+from __future__ import absolute_import
+from __future__ import print_function
+
+# standard
+from array import array
+import argparse
+from calendar import timegm
+import csv
+import itertools
+import json
+import mmap
+import os
+import sys
+
+# pypi
+import numpy as np
+
+# package
+from .price_stats import STATS_STRATEGIES, strategy_price
+
+
+__all__ = ['BACKTEST_STRATEGIES', 'Backtest', 'load_history']
+
+
+# the strategies a backtest can replay: those that only need the low, high and average.
+BACKTEST_STRATEGIES = ('high', 'average-high', 'average', 'random')
+
+# normalized column/key name -> field.
+_FIELDS = {
+    'timestamp': 'timestamp', 'time': 'timestamp',
+    'price': 'price', 'spotprice': 'price',
+    'availabilityzone': 'zone', 'zone': 'zone',
+    'instancetype': 'instance_type',
+    'productdescription': 'product_description'
+}
+
+
+def _field(name):
+    return _FIELDS.get(name.strip().lower().replace('_', '').replace('-', ''))
+
+
+def _parse_time(s):
+    """Converts seconds since the epoch, or an ISO 8601 UTC timestamp, to seconds since the epoch.
+
+    Faster than strptime(), which matters for histories of millions of samples.
+    """
+    try:
+        return float(s)
+    except ValueError:
+        return float(timegm((int(s[0:4]), int(s[5:7]), int(s[8:10]),
+                             int(s[11:13]), int(s[14:16]), int(s[17:19]))))
+
+
+def _records(lines):
+    """Yields dicts of fields from CSV or JSON lines."""
+    first = next(lines, '')
+    if first.lstrip().startswith('{'):
+        for line in itertools.chain([first], lines):
+            if line.strip():
+                yield dict((_field(k), v) for k, v in json.loads(line).items())
+    else:
+        fields = [_field(name) for name in next(csv.reader([first]))]
+        for row in csv.reader(lines):
+            if row:
+                yield dict(zip(fields, row))
+
+
+def load_history(path, availability_zone=None, instance_type=None, product_description=None):
+    """Loads spot-price history for a market from a CSV or JSON-lines file.
+
+    The file is memory-mapped and streamed, and only the samples that match the filters are
+    kept, so histories much larger than memory can be loaded one market at a time.
+
+    :param path: the path of the history file.
+    :param availability_zone: only load samples for this zone (default: None, all zones).
+    :param instance_type: only load samples for this instance type (default: None, all).
+    :param product_description: only load samples for this product (default: None, all).
+    :return: dict of zone -> (times, prices) arrays, in ascending time order.
+    """
+    times = {}
+    prices = {}
+    if not os.path.getsize(path):
+        return {}
+    with open(path, 'rb') as f:
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            for record in _records(iter(mm.readline, '')):
+                zone = record.get('zone')
+                if (availability_zone and zone != availability_zone) or \
+                        (instance_type and record.get('instance_type') != instance_type) or \
+                        (product_description and record.get('product_description') != product_description):
+                    continue
+                if zone not in times:
+                    times[zone] = array('d')
+                    prices[zone] = array('d')
+                times[zone].append(_parse_time(str(record['timestamp'])))
+                prices[zone].append(float(record['price']))
+        finally:
+            mm.close()
+
+    result = {}
+    for zone in times:
+        t = np.frombuffer(times[zone], dtype=np.float64)
+        order = np.argsort(t, kind='mergesort')
+        result[zone] = (t[order], np.frombuffer(prices[zone], dtype=np.float64)[order])
+    return result
+
+
+class Backtest(object):
+    """Replays one market's price history through bid strategies.
+
+    The replay follows the monitor: it bids for one instance with a strategy's price over
+    the last days of history. A bid is fulfilled as soon as the price is at or below it; if
+    that doesn't happen within check_secs, the request is cancelled and the strategy bids
+    again, at least factor times higher. A running instance pays the market price, and is
+    interrupted as soon as the price rises above its bid, when the strategy bids again for
+    a replacement.
+
+    Every (strategy, days, factor) combination is a lane, and all lanes are replayed
+    together with array operations: each step submits one bid in every lane that's still
+    going. The next time the price crosses a bid (down for fulfillment, up for interruption)
+    is found with a binary search over sparse tables of range minimums and maximums, in
+    O(log n) per bid, and window lows, highs and averages come from the same tables and a
+    cumulative sum, in O(1).
+    """
+    def __init__(self, times, prices):
+        self.times = np.asarray(times, dtype=np.float64)
+        self.prices = np.asarray(prices, dtype=np.float64)
+        n = len(self.prices)
+        if not n:
+            raise ValueError('no price history')
+
+        # sparse tables: level k holds the min/max of prices[i:i+2**k] (clipped at the end).
+        self._mins = [self.prices]
+        self._maxs = [self.prices]
+        k = 1
+        while k < n:
+            idx = np.minimum(np.arange(n) + k, n - 1)
+            self._mins.append(np.minimum(self._mins[-1], self._mins[-1][idx]))
+            self._maxs.append(np.maximum(self._maxs[-1], self._maxs[-1][idx]))
+            k *= 2
+
+        self._sums = np.concatenate(([0.0], np.cumsum(self.prices)))
+        # cost (price * seconds) accumulated up to each sample's timestamp.
+        self._areas = np.concatenate(([0.0], np.cumsum(self.prices[:-1]*np.diff(self.times))))
+
+    def run(self, strategies=BACKTEST_STRATEGIES, days=(1, 5), factors=(1.05,), check_secs=180,
+            start=None, end=None, seed=0):
+        """Replays the history for every combination of strategy, days and factor.
+
+        :param strategies: the strategies to replay (see BACKTEST_STRATEGIES).
+        :param days: the window lengths, in days, for the strategies' price stats.
+        :param factors: how much to raise a bid that wasn't fulfilled (default: (1.05,)).
+        :param check_secs: seconds between checks, i.e., how long a bid is left holding.
+        :param start: when to start bidding (default: the longest window after the first sample).
+        :param end: when to stop (default: the last sample).
+        :param seed: seed for the 'random' strategy (default: 0).
+        :return: list of dicts, one per lane: strategy, days, factor, bids, fills,
+            interruptions, hours (running), cost, avg_price, availability (fraction of the
+            time running), mean_latency_secs and max_latency_secs (from needing an instance
+            to its bid being fulfilled), interruption_rate (interruptions per fill).
+        """
+        for strategy in strategies:
+            if strategy in STATS_STRATEGIES or strategy not in BACKTEST_STRATEGIES:
+                raise ValueError('strategy {0} cannot be backtested; use one of {1}'
+                                 .format(strategy, ', '.join(BACKTEST_STRATEGIES)))
+        lanes = list(itertools.product(strategies, days, factors))
+        start = self.times[0] + max(days)*24*3600 if start is None else start
+        end = self.times[-1] if end is None else end
+        if start >= end:
+            raise ValueError('not enough price history for a {0}-day window'.format(max(days)))
+
+        m = len(lanes)
+        strategy_ids = np.array([strategies.index(lane[0]) for lane in lanes])
+        windows = np.array([lane[1]*24*3600.0 for lane in lanes])
+        lane_factors = np.array([lane[2] for lane in lanes], dtype=np.float64)
+        rng = np.random.RandomState(seed)
+
+        t = np.full(m, float(start))
+        needed = t.copy()
+        recent = np.zeros(m)
+        bids = np.zeros(m, dtype=np.int64)
+        fills = np.zeros(m, dtype=np.int64)
+        interruptions = np.zeros(m, dtype=np.int64)
+        running = np.zeros(m)
+        cost = np.zeros(m)
+        latency = np.zeros(m)
+        max_latency = np.zeros(m)
+
+        while True:
+            a = np.flatnonzero(t < end)
+            if not len(a):
+                break
+            ta = t[a]
+
+            # bid with each lane's strategy, over its window.
+            i = np.searchsorted(self.times, ta, 'right') - 1
+            lo = np.minimum(np.searchsorted(self.times, ta - windows[a], 'left'), i)
+            low, high = self._range(lo, i)
+            avg = (self._sums[i + 1] - self._sums[lo])/(i - lo + 1)
+            bid = np.empty(len(a))
+            for sid, strategy in enumerate(strategies):
+                s = strategy_ids[a] == sid
+                if s.any():
+                    bid[s] = strategy_price(strategy, low[s], high[s], avg[s],
+                                            recent_price=recent[a][s], factor=lane_factors[a][s],
+                                            rand=rng.random_sample(s.sum()))
+            bids[a] += 1
+
+            # fulfilled once the price is at or below the bid, if that's before the next check.
+            j = self._first(i, bid, below=True)
+            filled_at = np.maximum(ta, self.times[np.minimum(j, len(self.times) - 1)])
+            filled = (j < len(self.times)) & (filled_at <= np.minimum(ta + check_secs, end))
+
+            held = a[~filled]
+            recent[held] = bid[~filled]
+            t[held] = ta[~filled] + check_secs
+
+            f = a[filled]
+            tf = filled_at[filled]
+            fills[f] += 1
+            wait = tf - needed[f]
+            latency[f] += wait
+            max_latency[f] = np.maximum(max_latency[f], wait)
+
+            # interrupted once the price rises above the bid.
+            k = self._first(j[filled], bid[filled], below=False)
+            interrupted = k < len(self.times)
+            tk = np.where(interrupted, self.times[np.minimum(k, len(self.times) - 1)], end)
+            interrupted &= tk < end
+            tk = np.minimum(tk, end)
+            running[f] += tk - tf
+            cost[f] += self._area(tk) - self._area(tf)
+            interruptions[f] += interrupted
+            t[f] = np.where(interrupted, tk, end)
+            needed[f] = tk
+            recent[f] = 0
+
+        results = []
+        for n, (strategy, window, factor) in enumerate(lanes):
+            results.append(dict(
+                strategy=strategy, days=window, factor=factor,
+                bids=int(bids[n]), fills=int(fills[n]), interruptions=int(interruptions[n]),
+                hours=running[n]/3600, cost=cost[n]/3600,
+                avg_price=cost[n]/running[n] if running[n] else float('nan'),
+                availability=running[n]/(end - start),
+                mean_latency_secs=latency[n]/fills[n] if fills[n] else float('nan'),
+                max_latency_secs=max_latency[n],
+                interruption_rate=float(interruptions[n])/fills[n] if fills[n] else float('nan')))
+        return results
+
+    def _area(self, t):
+        """Returns the cost (price * seconds) accumulated up to times t."""
+        i = np.searchsorted(self.times, t, 'right') - 1
+        return self._areas[i] + self.prices[i]*(t - self.times[i])
+
+    def _first(self, start, bid, below):
+        """Returns the first index at or after start where the price is at or below the bid
+        (below=True) or above it (below=False), or len(prices) if there's none."""
+        n = len(self.prices)
+        pos = np.array(start, dtype=np.int64)
+        tables = self._mins if below else self._maxs
+        for level in reversed(range(len(tables))):
+            step = 1 << level
+            block = tables[level][np.minimum(pos, n - 1)]
+            # skip whole blocks that don't cross the bid.
+            skip = (pos + step <= n) & ((block > bid) if below else (block <= bid))
+            pos += step*skip
+        return pos
+
+    def _range(self, lo, hi):
+        """Returns the min and max prices over [lo, hi] (inclusive)."""
+        level = np.floor(np.log2(hi - lo + 1)).astype(np.int64)
+        low = np.empty(len(lo))
+        high = np.empty(len(lo))
+        for k in np.unique(level):
+            s = level == k
+            other = hi[s] - (1 << k) + 1
+            low[s] = np.minimum(self._mins[k][lo[s]], self._mins[k][other])
+            high[s] = np.maximum(self._maxs[k][lo[s]], self._maxs[k][other])
+        return low, high
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Backtests bid strategies against recorded spot-price history.')
+    parser.add_argument('history', help='CSV or JSON-lines price history file')
+    parser.add_argument('--zone', help='availability zone (default: each zone in the file)')
+    parser.add_argument('--instance-type')
+    parser.add_argument('--product-description')
+    parser.add_argument('--strategies', default=','.join(BACKTEST_STRATEGIES))
+    parser.add_argument('--days', default='1,5')
+    parser.add_argument('--factors', default='1.05')
+    parser.add_argument('--check-secs', type=float, default=180)
+    args = parser.parse_args(argv)
+
+    history = load_history(args.history, args.zone, args.instance_type, args.product_description)
+    if not history:
+        print('no matching price history', file=sys.stderr)
+        return 1
+
+    columns = ('zone', 'strategy', 'days', 'factor', 'bids', 'interruptions', 'hours', 'cost',
+               'avg_price', 'availability', 'mean_latency_secs', 'interruption_rate')
+    print(' '.join('{0:>14}'.format(c) for c in columns))
+    for zone, (times, prices) in sorted(history.items()):
+        results = Backtest(times, prices).run(
+            args.strategies.split(','), [float(d) for d in args.days.split(',')],
+            [float(f) for f in args.factors.split(',')], args.check_secs)
+        for result in results:
+            result['zone'] = zone
+            print(' '.join('{0:>14.4f}'.format(result[c]) if isinstance(result[c], float)
+                           else '{0:>14}'.format(result[c]) for c in columns))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
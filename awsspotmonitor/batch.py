@@ -0,0 +1,79 @@
+from __future__ import absolute_import
+
+# standard
+from collections import OrderedDict
+
+
+__all__ = ['MutationBatch']
+
+
+# errors that say nothing about individual IDs; retrying ID-by-ID would only make them worse.
+_BATCH_ERRORS = ('RequestLimitExceeded', 'Throttling', 'ServiceUnavailable', 'Unavailable',
+                 'InternalError')
+
+
+class MutationBatch(object):
+    """Collects tag and cancel mutations and sends them as bulk EC2 calls.
+
+    Tags are grouped by their key/value pairs and sent with one create_tags() call per group,
+    and cancellations with one cancel_spot_instance_requests() call, each split into chunks
+    of at most chunk_size IDs. If a chunk fails with an error that could be due to one of
+    its IDs, its IDs are retried one at a time so the failure can be pinned on the right ID.
+
+    flush() returns the failures as a dict of ID -> error message.
+    """
+    def __init__(self, conn, chunk_size=500):
+        self.conn = conn
+        self.chunk_size = chunk_size
+        self._tags = OrderedDict()
+        self._cancels = []
+
+    def __len__(self):
+        return len(self._tags) + len(self._cancels)
+
+    def cancel(self, request_id):
+        """Queues the cancellation of a spot-instance request."""
+        self._cancels.append(request_id)
+
+    def flush(self):
+        """Sends all queued mutations.
+
+        :return: dict of ID -> error message for the mutations that failed (may be empty).
+        """
+        failures = {}
+
+        groups = OrderedDict()
+        for id, tags in self._tags.items():
+            groups.setdefault(tuple(sorted(tags.items())), []).append(id)
+        for tags, ids in groups.items():
+            self._send(lambda chunk: self.conn.create_tags(chunk, dict(tags)), ids, failures)
+
+        def cancel(chunk):
+            result = self.conn.cancel_spot_instance_requests(chunk)
+            cancelled = set(r.id for r in result or [])
+            for id in chunk:
+                if id not in cancelled:
+                    failures[id] = 'not cancelled'
+        self._send(cancel, self._cancels, failures)
+
+        self._tags = OrderedDict()
+        self._cancels = []
+        return failures
+
+    def tag(self, resource_id, key, value=''):
+        """Queues a tag for a resource (spot-instance request, instance, ...)."""
+        self._tags.setdefault(resource_id, {})[key] = value
+
+    def _send(self, fn, ids, failures):
+        from boto.exception import EC2ResponseError
+        for i in range(0, len(ids), self.chunk_size):
+            chunk = ids[i:i+self.chunk_size]
+            try:
+                fn(chunk)
+            except EC2ResponseError as e:
+                if len(chunk) == 1 or e.error_code in _BATCH_ERRORS:
+                    for id in chunk:
+                        failures[id] = '{0}: {1}'.format(e.error_code, e.error_message)
+                else:
+                    for id in chunk:
+                        self._send(fn, [id], failures)
@@ -0,0 +1,118 @@
+from __future__ import absolute_import
+
+# standard
+from collections import deque
+import gzip
+import os
+from StringIO import StringIO
+import tempfile
+
+
+__all__ = ['CaptureBuffer']
+
+
+class CaptureBuffer(object):
+    """A file-like text buffer with bounded memory use.
+
+    The first head_bytes written are kept in memory, as are the most recent tail_bytes (in a
+    ring buffer). Whatever falls out of the ring buffer is streamed to a gzip-compressed
+    segment file in spill_dir (default: the system temp directory), so the middle of a long
+    capture costs disk, not memory.
+
+    After close(), excerpt() gives the head and tail with a marker where the middle was
+    left out, and compressed() gives the whole text gzip-compressed, e.g., for a mail
+    attachment.
+    """
+    def __init__(self, max_bytes=256*1024, spill_dir=None):
+        self.head_bytes = max_bytes//4
+        self.tail_bytes = max_bytes - self.head_bytes
+        self.spill_dir = spill_dir
+        self.bytes = 0
+        self.lines = 0
+        self.spilled_bytes = 0
+        self.spilled_lines = 0
+        self._head = []
+        self._head_size = 0
+        self._tail = deque()
+        self._tail_size = 0
+        self._spill = None
+        self._spill_file = None
+        self._spill_path = None
+
+    @property
+    def spilled(self):
+        return self.spilled_bytes > 0
+
+    def close(self):
+        if self._spill is not None:
+            self._spill.close()
+            self._spill_file.close()
+            self._spill = self._spill_file = None
+
+    def compressed(self):
+        """Returns the whole captured text, gzip-compressed, and removes the segment file.
+
+        The result is a multi-member gzip stream (head, middle, tail) that decompresses to
+        the captured text.
+
+        :return: str
+        """
+        self.close()
+        parts = [self._gzip(''.join(self._head))]
+        if self._spill_path:
+            with open(self._spill_path, 'rb') as f:
+                parts.append(f.read())
+            self.discard()
+        parts.append(self._gzip(''.join(self._tail)))
+        return ''.join(parts)
+
+    def discard(self):
+        """Removes the segment file, if any."""
+        self.close()
+        if self._spill_path:
+            os.remove(self._spill_path)
+            self._spill_path = None
+
+    def excerpt(self):
+        """Returns the head and tail of the captured text, marking where the middle was."""
+        if not self.spilled:
+            return ''.join(self._head) + ''.join(self._tail)
+        return '{0}\n[... {1} lines, {2} bytes omitted ...]\n\n{3}'.format(
+            ''.join(self._head), self.spilled_lines, self.spilled_bytes, ''.join(self._tail))
+
+    def getvalue(self):
+        return self.excerpt()
+
+    def write(self, s):
+        if isinstance(s, unicode):
+            s = s.encode('utf-8')
+        self.bytes += len(s)
+        self.lines += s.count('\n')
+
+        if self._head_size < self.head_bytes:
+            self._head.append(s)
+            self._head_size += len(s)
+            return
+
+        self._tail.append(s)
+        self._tail_size += len(s)
+        while self._tail_size > self.tail_bytes and len(self._tail) > 1:
+            chunk = self._tail.popleft()
+            self._tail_size -= len(chunk)
+            self._write_spill(chunk)
+
+    def _gzip(self, text):
+        buf = StringIO()
+        with gzip.GzipFile(fileobj=buf, mode='wb') as f:
+            f.write(text)
+        return buf.getvalue()
+
+    def _write_spill(self, chunk):
+        if self._spill is None:
+            fd, self._spill_path = tempfile.mkstemp(prefix='capture-', suffix='.log.gz',
+                                                    dir=self.spill_dir)
+            self._spill_file = os.fdopen(fd, 'wb')
+            self._spill = gzip.GzipFile(fileobj=self._spill_file, mode='wb')
+        self._spill.write(chunk)
+        self.spilled_bytes += len(chunk)
+        self.spilled_lines += chunk.count('\n')
@@ -3,11 +3,14 @@ from __future__ import print_function
 
 # standard
 from datetime import datetime
-from StringIO import StringIO
 import sys
 
 # package.
-from .msg_util import *
+from .capture_buffer import CaptureBuffer
+from .events import INFO, parse_level
+
+
+__all__ = ['CaptureLog']
 
 
 class CaptureLog(object):
@@ -18,6 +21,16 @@ class CaptureLog(object):
     also written to stdout, and they're also stored internally. When capturing is ended,
     the stored log is (optionally) emailed to a specified recipient before it's deleted.
 
+    Mail is sent through a MailQueue, so capturing never waits on the mail relay; bursts of
+    logs are merged into digests.
+
+    A capture holds at most max_bytes of text in memory (its head and tail); the middle of
+    a longer capture is spilled to a compressed file in spill_dir. The mail for such a
+    capture has a summary and the head and tail in its body, and the whole log attached.
+
+    A CaptureLog is also the plain-text sink of an EventLog: emit() renders events at or
+    above its level as lines of text.
+
     Mail configuration, if specified, is a dictionary like that used with send_msg() and
     with these additional keys:
         subject: the subject for the log message (string)
@@ -29,43 +42,58 @@ class CaptureLog(object):
     def capturing(self):
         return self._log is not None
 
-    def __init__(self, mail_config=None):
+    def __init__(self, mail_config=None, mailer=None, max_bytes=256*1024, spill_dir=None, level=INFO):
+        self.level = parse_level(level)
         self._log = None
         self._mail_cfg = mail_config
+        self._mailer = mailer
+        self._max_bytes = max_bytes
+        self._spill_dir = spill_dir
 
     def end_capture(self):
         if not self._log:
             return
 
         self.write('---------- LOG ENDED AT: {0} UTC'.format(datetime.utcnow().isoformat()))
-        text = self._log.getvalue()
-        self._log = None
-        if self._mail_cfg:
-            send_plaintext_msg(
-                self._mail_cfg,
-                *create_plaintext_msg(
-                    self._mail_cfg['subject'],
-                    self._mail_cfg['sender'],
-                    self._mail_cfg['recipients'],
-                    text))
+        log, self._log = self._log, None
+        log.close()
+        if not self._mail_cfg:
+            log.discard()
+            return
+        if not log.spilled:
+            self._send(log.excerpt())
+            return
+
+        summary = 'Capture log: {0} lines, {1} bytes; {2} lines omitted below (see attachment).'\
+            .format(log.lines, log.bytes, log.spilled_lines)
+        self._send('{0}\n\n{1}'.format(summary, log.excerpt()),
+                   [('capture-{0}.log.gz'.format(datetime.utcnow().strftime('%Y%m%dT%H%M%S')),
+                     log.compressed())])
+
+    def emit(self, event):
+        self.write(event.text())
 
     def file(self):
         return self._log if self._log else sys.stdout
 
     def start_capture(self):
-        if self._mail_cfg:
-            send_plaintext_msg(
-                self._mail_cfg
-                *create_plaintext_msg(
-                    self._mail_cfg['subject'],
-                    self._mail_cfg['sender'],
-                    self._mail_cfg['recipients'],
-                    'Capture log opened at: {0} UTC'.format(datetime.utcnow().isoformat())))
-
-        self._log = StringIO()
+        self._send('Capture log opened at: {0} UTC'.format(datetime.utcnow().isoformat()))
+
+        self._log = CaptureBuffer(self._max_bytes, self._spill_dir)
         self.write('---------- LOG STARTED AT: {0} UTC'.format(datetime.utcnow().isoformat()))
 
     def write(self, *args, **kwargs):
         print(*args, **kwargs)
         if self.capturing:
             print(*args, file=self.file(), **kwargs)
+
+    def _send(self, text, attachments=None):
+        if not self._mail_cfg:
+            return
+        if self._mailer is None:
+            from .mailer import get_mail_queue
+            self._mailer = get_mail_queue(self._mail_cfg)
+        self._mailer.send(self._mail_cfg['subject'],
+                          self._mail_cfg['sender'],
+                          self._mail_cfg['recipients'],
+                          text, attachments)
@@ -0,0 +1,164 @@
+"""Command-line interface: awsspotmonitor <command> <config-file> [options].
+
+Commands:
+    run     monitor the pool(s) until interrupted.
+    once    check the pool(s) once, e.g., from cron; exits 1 if a check failed.
+    status  show each pool's requests and instances: from its journal if it has one,
+            otherwise from EC2 (or always from EC2, with --live).
+    price   show each pool's low, high and average price, and the bid its strategy suggests.
+
+The config file is JSON: either one pool's configuration (see AwsSpotMonitor.DEFAULT_CONFIG),
+or {"pools": [config, ...]}. Either form may have a "mail" key with the mail configuration
+(see CaptureLog).
+"""
+from __future__ import absolute_import
+from __future__ import print_function
+
+# standard
+import argparse
+from collections import Counter
+from datetime import datetime
+import json
+import os
+import sys
+
+# package. only the commands that need them import the monitor and EC2 modules.
+
+
+__all__ = ['load_config', 'main']
+
+
+def load_config(path):
+    """Loads a config file.
+
+    :param path: the path of the JSON config file.
+    :return: tuple: (list of pool configs, mail config or None)
+    """
+    with open(path) as f:
+        dct = json.load(f)
+    mail_config = dct.pop('mail', None)
+    pools = dct['pools'] if 'pools' in dct else [dct]
+    return pools, mail_config
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='awsspotmonitor',
+                                     description='Simple AWS spot-instance monitoring and management.')
+    commands = parser.add_subparsers(dest='command')
+
+    run = commands.add_parser('run', help='monitor the pool(s) until interrupted')
+    run.add_argument('--wait', type=float, default=180, help='longest wait between checks (secs)')
+    run.add_argument('--min-wait', type=float, default=10, help='shortest wait between checks (secs)')
+
+    once = commands.add_parser('once', help='check the pool(s) once')
+
+    status = commands.add_parser('status', help="show the pools' requests and instances")
+    status.add_argument('--live', action='store_true', help='query EC2, even if there is a journal')
+
+    price = commands.add_parser('price', help="show the pools' prices and suggested bids")
+    price.add_argument('--days', type=int, default=5, help='days of price history (default: 5)')
+
+    for command in (run, once, status, price):
+        command.add_argument('config', help='JSON config file')
+
+    args = parser.parse_args(argv)
+    pools, mail_config = load_config(args.config)
+    command = dict(run=_run, once=_once, status=_status, price=_price)[args.command]
+    return command(args, pools, mail_config) or 0
+
+
+def _monitor(config, mail_config=None, read_only=False):
+    """Returns a pool's monitor. A read-only monitor (for commands that only look) keeps no
+    journal, event log or price-history file: opening the journal for writing would
+    compact it under a running monitor, which would then append to the replaced file."""
+    from .spot_monitor import AwsSpotMonitor
+    if read_only:
+        config = dict(config, journal_path=None, event_log_path=None, price_history_path=None)
+    return AwsSpotMonitor(config, mail_config)
+
+
+def _name(config):
+    from .spot_monitor import AwsSpotMonitor
+    dct = dict(AwsSpotMonitor.DEFAULT_CONFIG, **config)
+    return dct['pool_name'] or '{0}/{1}/{2}'.format(dct['region_name'], dct['availability_zone'] or '*',
+                                                     dct['instance_type'])
+
+
+def _once(args, pools, mail_config):
+    failed = 0
+    for config in pools:
+        try:
+            monitor = _monitor(config, mail_config)
+            monitor.check_requests()
+            # process_fulfilled() runs on worker threads: wait for it, so its requests are
+            # tagged before the process exits, but not for longer than a call may run.
+            monitor.drain(monitor.config['hook_timeout_secs'] or 600)
+        except Exception as e:
+            print('{0}: check failed: {1}'.format(_name(config), e), file=sys.stderr)
+            failed += 1
+    return 1 if failed else 0
+
+
+def _price(args, pools, mail_config):
+    from .price_stats import STATS_STRATEGIES, strategy_price
+    for config in pools:
+        monitor = _monitor(config, read_only=True)
+        strategy = monitor.config['price_strategy']
+        stats = None
+        if strategy in STATS_STRATEGIES:
+            stats = monitor.get_price_stats(args.days)
+            low, high, avg = stats.low, stats.high, stats.mean
+        else:
+            low, high, avg = monitor.get_price_info(args.days)
+        print('{0}: low={1:.4f} high={2:.4f} average={3:.4f} bid={4:.4f} ({5})'.format(
+            monitor.name, low, high, avg, strategy_price(strategy, low, high, avg, stats), strategy))
+        if stats is not None:
+            print('    ' + ' '.join('{0}={1:.4f}'.format(k, v) for k, v in zip(stats._fields, stats)))
+
+
+def _print_counts(label, counts):
+    items = ', '.join('{0}={1}'.format(k, v) for k, v in sorted(counts.items()))
+    print('    {0}: {1}'.format(label, items or 'none'))
+
+
+def _run(args, pools, mail_config):
+    if len(pools) == 1:
+        _monitor(pools[0], mail_config).loop(args.wait, args.min_wait)
+    else:
+        from .fleet import FleetMonitor
+        FleetMonitor(pools, mail_config).loop(args.wait)
+
+
+def _status(args, pools, mail_config):
+    for config in pools:
+        path = config.get('journal_path')
+        if path and os.path.exists(path) and not args.live:
+            _status_journal(_name(config), path)
+        else:
+            _status_live(_monitor(config, read_only=True))
+
+
+def _status_journal(name, path):
+    from .journal import Journal
+    # read-only: the monitor may have the journal open.
+    journal = Journal(path, read_only=True)
+    checkpoint = datetime.utcfromtimestamp(journal.checkpoint).isoformat() + ' UTC' \
+        if journal.checkpoint is not None else 'never'
+    print('{0}: journal of {1}'.format(name, checkpoint))
+    _print_counts('requests', Counter(r['code'] for r in journal.requests.values()))
+    _print_counts('instances', Counter(journal.instances.values()))
+
+
+def _status_live(monitor):
+    from .query import get_spot_instances, get_spot_requests
+    from .spot_monitor import Request
+    requests = get_spot_requests(monitor.conn, status_codes=Request.LIVE_STATUS_CODES,
+                                 tag=monitor.config['monitor_tag'])
+    instances = get_spot_instances(monitor.conn, [r.instance_id for r in requests if r.instance_id])
+    print('{0}: live'.format(monitor.name))
+    _print_counts('requests', Counter(r.status.code for r in requests))
+    _print_counts('instances', Counter(i.state for i in instances))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
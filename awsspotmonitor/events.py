@@ -0,0 +1,154 @@
+from __future__ import absolute_import
+from __future__ import print_function
+
+# standard
+import json
+import sys
+import threading
+import time
+import traceback
+
+
+__all__ = ['DEBUG', 'ERROR', 'INFO', 'WARNING', 'Event', 'EventLog', 'JsonlSink', 'TextSink',
+           'parse_level']
+
+
+DEBUG = 10
+INFO = 20
+WARNING = 30
+ERROR = 40
+
+_LEVEL_NAMES = {DEBUG: 'debug', INFO: 'info', WARNING: 'warning', ERROR: 'error'}
+
+
+def parse_level(level):
+    """Returns a level number for a level name ('debug', 'info', ...) or number."""
+    if isinstance(level, basestring):
+        for number, name in _LEVEL_NAMES.items():
+            if name == level.lower():
+                return number
+        raise ValueError('unknown log level: {0}'.format(level))
+    return level
+
+
+class Event(object):
+    """A structured log event: a name, a level, a message template and its fields.
+
+    The message is only formatted (with str.format() and the fields) when text() is called,
+    i.e., by a sink that renders text.
+    """
+    __slots__ = ('time', 'level', 'name', 'message', 'fields')
+
+    def __init__(self, level, name, message, fields, time=None):
+        self.time = time
+        self.level = level
+        self.name = name
+        self.message = message
+        self.fields = fields
+
+    def record(self):
+        """Returns the event as a JSON-serializable dict (fields are rendered with str() if need be)."""
+        record = dict(self.fields)
+        record.update(ts=self.time, level=_LEVEL_NAMES.get(self.level, self.level), event=self.name)
+        return record
+
+    def text(self):
+        return self.message.format(**self.fields)
+
+
+class EventLog(object):
+    """Dispatches structured events to sinks.
+
+    Events are emitted with debug(), info(), warning() and error(), each with an event name,
+    a message template and keyword fields, e.g.,
+    log.info('submitted', 'submitted request: {id}, price={price}', id=..., price=...).
+    An event below every sink's level is dropped after a single comparison, before an Event
+    is even created, so debug events are almost free unless a sink wants them. Nothing is
+    formatted unless a sink renders text.
+
+    A sink has a level attribute and an emit(event) method; see TextSink, JsonlSink and
+    CaptureLog (which renders events as plain text for stdout and mail).
+    """
+    def __init__(self, sinks=()):
+        self._sinks = []
+        self.level = ERROR + 1
+        for sink in sinks:
+            self.add_sink(sink)
+
+    def add_sink(self, sink):
+        self._sinks.append(sink)
+        self.level = min(self.level, parse_level(sink.level))
+
+    def debug(self, name, message, **fields):
+        if DEBUG >= self.level:
+            self.emit(DEBUG, name, message, fields)
+
+    def emit(self, level, name, message, fields):
+        event = Event(level, name, message, fields, time.time())
+        for sink in self._sinks:
+            if level >= sink.level:
+                sink.emit(event)
+
+    def enabled(self, level):
+        """Returns True if any sink wants events at a level, e.g., to skip computing fields."""
+        return level >= self.level
+
+    def error(self, name, message, **fields):
+        if ERROR >= self.level:
+            self.emit(ERROR, name, message, fields)
+
+    def exception(self, name, message, **fields):
+        """Emits an error event with the current exception's traceback appended to the message."""
+        if ERROR >= self.level:
+            fields['traceback'] = traceback.format_exc().rstrip()
+            self.emit(ERROR, name, message + '\n{traceback}', fields)
+
+    def flush(self):
+        for sink in self._sinks:
+            flush = getattr(sink, 'flush', None)
+            if flush is not None:
+                flush()
+
+    def info(self, name, message, **fields):
+        if INFO >= self.level:
+            self.emit(INFO, name, message, fields)
+
+    def warning(self, name, message, **fields):
+        if WARNING >= self.level:
+            self.emit(WARNING, name, message, fields)
+
+
+class JsonlSink(object):
+    """Appends events to a JSON-lines file, one compact record per event.
+
+    Records are written to a buffered file and flushed by flush() (the monitor flushes once
+    per check) and close().
+    """
+    def __init__(self, path, level=DEBUG):
+        self.path = path
+        self.level = parse_level(level)
+        self._file = open(path, 'a')
+        self._lock = threading.Lock()
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+    def emit(self, event):
+        line = json.dumps(event.record(), separators=(',', ':'), default=str)
+        with self._lock:
+            self._file.write(line + '\n')
+
+    def flush(self):
+        with self._lock:
+            self._file.flush()
+
+
+class TextSink(object):
+    """Prints events' messages to a stream (default: stdout)."""
+    def __init__(self, stream=None, level=INFO):
+        self.stream = stream
+        self.level = parse_level(level)
+
+    def emit(self, event):
+        print(event.text(), file=self.stream or sys.stdout)
@@ -0,0 +1,380 @@
+from __future__ import absolute_import
+
+# standard
+from collections import Counter, OrderedDict, deque
+import copy
+from datetime import datetime
+from functools import wraps
+import itertools
+import random
+import time
+
+# pypi
+from boto.exception import EC2ResponseError
+
+# package
+from .price_history import parse_timestamp
+
+
+__all__ = ['FakeEC2Connection']
+
+
+def _api(fn):
+    """Decorates a FakeEC2Connection method that stands in for an EC2 API call.
+
+    Each call is counted, can be throttled, and can be slowed down to simulate network
+    latency. Time spent inside the fake is accumulated in server_secs, so benchmarks can
+    tell the monitor's own cost from the simulated server's, and each call's (name, start,
+    end) is kept in spans, so tests can tell which calls overlapped.
+    """
+    @wraps(fn)
+    def wrapper(self, *args, **kwargs):
+        self.calls[fn.__name__] += 1
+        if self.throttle_rate and self._rng.random() < self.throttle_rate:
+            self.throttled[fn.__name__] += 1
+            raise self.error(503, 'RequestLimitExceeded', 'Request limit exceeded.')
+        called = time.time()
+        if self.latency:
+            time.sleep(self.latency)
+        start = time.time()
+        try:
+            return fn(self, *args, **kwargs)
+        finally:
+            end = time.time()
+            self.server_secs += end - start
+            self.spans.append((fn.__name__, called, end))
+    return wrapper
+
+
+def _isoformat(ts):
+    return datetime.utcfromtimestamp(ts).strftime('%Y-%m-%dT%H:%M:%S.000Z')
+
+
+class _Object(object):
+    def __init__(self, **kwargs):
+        self.__dict__.update(kwargs)
+
+
+class _Status(_Object):
+    def __repr__(self):
+        return '<Status: {0}>'.format(self.code)
+
+
+class FakeSpotRequest(_Object):
+    def add_tag(self, key, value=''):
+        self.connection.create_tags([self.id], {key: value})
+
+    def cancel(self):
+        self.connection.cancel_spot_instance_requests([self.id])
+
+
+class FakeInstance(_Object):
+    def add_tag(self, key, value=''):
+        self.connection.create_tags([self.id], {key: value})
+
+
+class FakeEC2Connection(object):
+    """An in-process stand-in for boto's EC2Connection.
+
+    Implements the calls the monitor uses (spot requests, instances, tags, price history
+    and cancellation) against an in-memory model of one region, and simulates the market:
+    step() advances the clock, walks the spot price in each zone, fulfills open requests
+    that bid at or above the market price, and interrupts instances whose bid has fallen
+    below it (they're first marked for termination, then terminated on the next step).
+
+    Objects returned by the API calls are copies, as they would be from EC2, so holding on
+    to one doesn't reveal later changes.
+
+    :param zones: the availability zones in the region.
+    :param base_price: the starting spot price in every zone.
+    :param volatility: the relative size of each random price move.
+    :param price_interval: seconds between price samples in the generated history.
+    :param history_days: days of price history generated up front.
+    :param capacity: optional maximum number of running instances per zone (default: None).
+    :param interruption_rate: probability per step that a running instance is interrupted
+                              even if its bid is high enough.
+    :param throttle_rate: probability that any API call fails with RequestLimitExceeded.
+    :param latency: seconds each API call takes.
+    :param seed: seed for the simulation's random numbers.
+    """
+    def __init__(self, region_name='us-east-1', zones=('us-east-1a', 'us-east-1b', 'us-east-1c'),
+                 base_price=0.02, volatility=0.05, price_interval=3600, history_days=5,
+                 capacity=None, interruption_rate=0.0, throttle_rate=0.0, latency=0.0,
+                 seed=None):
+        self.region_name = region_name
+        self.zones = list(zones)
+        self.volatility = volatility
+        self.capacity = capacity
+        self.interruption_rate = interruption_rate
+        self.throttle_rate = throttle_rate
+        self.latency = latency
+        self.now = time.time()
+        self.calls = Counter()
+        self.throttled = Counter()
+        self.server_secs = 0.0
+        self.spans = deque(maxlen=1000)
+        self.requests = OrderedDict()
+        self.instances = OrderedDict()
+        self._rng = random.Random(seed)
+        self._ids = itertools.count(1)
+        self._live = set()
+
+        # prices: zone -> list of (timestamp, price), oldest first.
+        self.prices = {}
+        for zone in self.zones:
+            ts = self.now - history_days*24*3600
+            price = base_price
+            samples = self.prices[zone] = []
+            while ts <= self.now:
+                samples.append((ts, price))
+                price = self._walk(price, base_price)
+                ts += price_interval
+
+    # ----- simulation
+
+    def error(self, status, code, message):
+        return EC2ResponseError(status, code,
+            '<Response><Errors><Error><Code>{0}</Code><Message>{1}</Message></Error></Errors>'
+            '<RequestID>fake</RequestID></Response>'.format(code, message))
+
+    def interrupt(self, instance_id):
+        """Marks an instance's spot request for termination, as EC2 does before reclaiming it."""
+        instance = self.instances[instance_id]
+        req = self.requests[instance.spot_instance_request_id]
+        req.status.code = 'marked-for-termination'
+
+    def market_price(self, zone):
+        return self.prices[zone][-1][1]
+
+    def populate(self, count, live=0, price=None):
+        """Adds requests to the account.
+
+        Adds count requests: live of them fulfilled (with running instances), the rest
+        closed or cancelled long ago, as in an account with years of history.
+
+        :param count: the total number of requests to add.
+        :param live: how many of them are fulfilled and running (default: 0).
+        :param price: the bid price (default: twice the current price in the first zone).
+        :return: None
+        """
+        price = price if price is not None else 2*self.market_price(self.zones[0])
+        for i in range(count):
+            zone = self.zones[i % len(self.zones)]
+            req = self._new_request(price, 'm1.small', zone, self.now - 30*24*3600)
+            if i < live:
+                self._fulfill(req, zone)
+            else:
+                self._live.discard(req.id)
+                req.state = 'cancelled' if i % 2 else 'closed'
+                req.status.code = 'canceled-before-fulfillment' if i % 2 else 'instance-terminated-by-user'
+
+    def set_price(self, zone, price):
+        self.prices[zone].append((self.now, price))
+
+    def step(self, secs=60):
+        """Advances the simulation by secs seconds.
+
+        :param secs: the number of seconds to advance (default: 60).
+        :return: None
+        """
+        self.now += secs
+        for zone in self.zones:
+            samples = self.prices[zone]
+            if self.volatility:
+                samples.append((self.now, self._walk(samples[-1][1], samples[0][1])))
+
+        for id in list(self._live):
+            req = self.requests[id]
+            code = req.status.code
+            if code == 'marked-for-termination':
+                self._terminate(req, 'instance-terminated-by-price')
+            elif req.state == 'active':
+                instance = self.instances[req.instance_id]
+                if instance.state == 'pending':
+                    instance.state = 'running'
+                zone = instance.placement
+                if req.price < self.market_price(zone) or \
+                        (self.interruption_rate and self._rng.random() < self.interruption_rate):
+                    req.status.code = 'marked-for-termination'
+            elif req.state == 'open':
+                zone = req.launch_specification.placement or min(self.zones, key=self.market_price)
+                if req.price < self.market_price(zone):
+                    req.status.code = 'price-too-low'
+                elif self.capacity is not None and self._running(zone) >= self.capacity:
+                    req.status.code = 'capacity-not-available'
+                else:
+                    self._fulfill(req, zone)
+
+    def terminate(self, instance_id):
+        """Terminates an instance as if its owner did."""
+        instance = self.instances[instance_id]
+        self._terminate(self.requests[instance.spot_instance_request_id],
+                        'instance-terminated-by-user')
+
+    # ----- EC2 API
+
+    @_api
+    def cancel_spot_instance_requests(self, request_ids):
+        result = []
+        for id in request_ids:
+            req = self.requests.get(id)
+            if req is None:
+                raise self.error(400, 'InvalidSpotInstanceRequestID.NotFound',
+                                 "The spot instance request ID '{0}' does not exist".format(id))
+            if req.state in ('open', 'active'):
+                if req.state == 'active':
+                    req.status.code = 'request-canceled-and-instance-running'
+                else:
+                    req.status.code = 'canceled-before-fulfillment'
+                    self._live.discard(id)
+                req.state = 'cancelled'
+            result.append(_Object(id=id, state=req.state))
+        return result
+
+    @_api
+    def create_tags(self, resource_ids, tags):
+        for id in resource_ids:
+            obj = self.requests.get(id) or self.instances.get(id)
+            if obj is None:
+                raise self.error(400, 'InvalidID', "The ID '{0}' is not valid".format(id))
+        for id in resource_ids:
+            obj = self.requests.get(id) or self.instances.get(id)
+            obj.tags.update(tags)
+        return True
+
+    @_api
+    def get_all_instances(self, instance_ids=None, filters=None):
+        if instance_ids:
+            missing = [id for id in instance_ids if id not in self.instances]
+            if missing:
+                raise self.error(400, 'InvalidInstanceID.NotFound',
+                                 "The instance ID '{0}' does not exist".format(missing[0]))
+            candidates = [self.instances[id] for id in instance_ids]
+        else:
+            candidates = self.instances.values()
+
+        match = self._matcher(filters, {
+            'instance-lifecycle': lambda i: 'spot',
+            'instance-state-name': lambda i: i.state,
+            'availability-zone': lambda i: i.placement
+        })
+        instances = [self._copy(i) for i in candidates if match(i)]
+        return [_Object(id='r-fake', instances=instances)] if instances else []
+
+    @_api
+    def get_all_spot_instance_requests(self, request_ids=None, filters=None):
+        if request_ids:
+            candidates = [self.requests[id] for id in request_ids if id in self.requests]
+        else:
+            candidates = self.requests.values()
+
+        match = self._matcher(filters, {
+            'state': lambda r: r.state,
+            'status-code': lambda r: r.status.code,
+            'launched-availability-zone': lambda r: r.launched_availability_zone,
+            'instance-id': lambda r: r.instance_id
+        })
+        return [self._copy(r) for r in candidates if match(r)]
+
+    @_api
+    def get_all_zones(self, zones=None, filters=None):
+        return [_Object(name=zone, state='available', region_name=self.region_name)
+                for zone in self.zones if not zones or zone in zones]
+
+    @_api
+    def get_spot_price_history(self, start_time=None, end_time=None, instance_type=None,
+                               product_description=None, availability_zone=None):
+        start = parse_timestamp(start_time) if start_time else float('-inf')
+        end = parse_timestamp(end_time) if end_time else float('inf')
+        result = []
+        for zone in self.zones:
+            if availability_zone and zone != availability_zone:
+                continue
+            samples = self.prices[zone]
+            for i, (ts, price) in enumerate(samples):
+                # include the sample in effect at start_time.
+                in_effect = ts < start and (i+1 == len(samples) or samples[i+1][0] > start)
+                if (start <= ts <= end) or in_effect:
+                    result.append(_Object(timestamp=_isoformat(ts), price=price,
+                                          availability_zone=zone, instance_type=instance_type,
+                                          product_description=product_description))
+        result.sort(key=lambda item: item.timestamp, reverse=True)
+        return result
+
+    @_api
+    def request_spot_instances(self, price, image_id, count=1, type='one-time', key_name=None,
+                               security_groups=None, instance_type='m1.small', placement=None,
+                               **kwargs):
+        if float(price) <= 0:
+            raise self.error(400, 'InvalidParameterValue', 'Invalid spot price.')
+        return [self._copy(self._new_request(float(price), instance_type, placement, self.now))
+                for _ in range(count)]
+
+    @_api
+    def terminate_instances(self, instance_ids=None):
+        for id in instance_ids or []:
+            self.terminate(id)
+        return [self._copy(self.instances[id]) for id in instance_ids or []]
+
+    # ----- helpers
+
+    def _copy(self, obj):
+        obj = copy.copy(obj)
+        obj.tags = dict(obj.tags)
+        if hasattr(obj, 'status'):
+            obj.status = copy.copy(obj.status)
+        return obj
+
+    def _fulfill(self, req, zone):
+        instance = FakeInstance(
+            id='i-{0:08x}'.format(next(self._ids)), state='pending', placement=zone,
+            instance_type=req.launch_specification.instance_type, spot_instance_request_id=req.id,
+            launch_time=_isoformat(self.now), tags={}, connection=self)
+        self.instances[instance.id] = instance
+        req.state = 'active'
+        req.status.code = 'fulfilled'
+        req.instance_id = instance.id
+        req.launched_availability_zone = zone
+
+    def _matcher(self, filters, getters):
+        tests = []
+        for name, values in (filters or {}).items():
+            values = set(values) if isinstance(values, (list, tuple, set)) else set([values])
+            if name.startswith('tag:'):
+                key = name[4:]
+                tests.append(lambda obj, key=key, values=values: obj.tags.get(key) in values)
+            elif name in getters:
+                tests.append(lambda obj, get=getters[name], values=values: get(obj) in values)
+            else:
+                raise self.error(400, 'InvalidParameterValue',
+                                 "The filter '{0}' is invalid".format(name))
+        return lambda obj: all(test(obj) for test in tests)
+
+    def _new_request(self, price, instance_type, placement, create_time):
+        req = FakeSpotRequest(
+            id='sir-{0:08x}'.format(next(self._ids)), price=price, type='one-time', state='open',
+            status=_Status(code='pending-evaluation'), instance_id=None, tags={},
+            create_time=_isoformat(create_time), launched_availability_zone=None,
+            launch_specification=_Object(instance_type=instance_type, placement=placement),
+            connection=self)
+        self.requests[req.id] = req
+        self._live.add(req.id)
+        return req
+
+    def _running(self, zone):
+        return sum(1 for id in self._live
+                   if self.requests[id].state == 'active' and
+                   self.requests[id].launched_availability_zone == zone)
+
+    def _terminate(self, req, code):
+        instance = self.instances.get(req.instance_id)
+        if instance is not None:
+            instance.state = 'terminated'
+        req.state = 'closed'
+        req.status.code = code
+        self._live.discard(req.id)
+
+    def _walk(self, price, base_price):
+        # a random walk that drifts back toward the base price.
+        price *= 1 + self._rng.gauss(0, self.volatility)
+        return max(0.001, price + 0.1*(base_price - price))
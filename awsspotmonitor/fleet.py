@@ -0,0 +1,139 @@
+from __future__ import absolute_import
+from __future__ import print_function
+
+# standard
+from concurrent.futures import ThreadPoolExecutor, wait
+import threading
+import time
+
+# package
+from .metrics import REGISTRY
+from .spot_monitor import AwsSpotMonitor, connect
+from .throttle import ThrottledConnection
+
+
+__all__ = ['FleetMonitor']
+
+
+class FleetMonitor(object):
+    """Monitors many spot pools, across regions, from one process.
+
+    Each pool is an AwsSpotMonitor with its own configuration (region, availability zone,
+    instance type, AMI, ...). Pools in the same region share one EC2 connection, and its
+    rate limits. Each cycle, every pool's check_requests() runs on a bounded worker pool, so
+    a cycle takes about as long as its slowest pool.
+
+    Pools are isolated from each other: an exception in one pool is logged to that pool's
+    log and recorded in errors, and a pool whose previous check is still running (e.g., a
+    slow region) is skipped rather than waited for.
+
+    All pools record metrics in one registry; if metrics_port is given, loop() serves them
+    over HTTP. If notice_port is given, loop() also receives interruption notices (see
+    notices.py) for all pools, and starts a cycle as soon as one arrives.
+    """
+    def __init__(self, configs, mail_config=None, max_workers=8, monitor_class=AwsSpotMonitor,
+                 metrics=REGISTRY, metrics_port=None, notice_port=None, notice_host='127.0.0.1',
+                 notice_token=None):
+        self._conns = {}
+        self._conn_lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers)
+        self._running = {}
+        self.errors = {}
+        self.metrics = metrics
+        self.metrics_port = metrics_port
+        self.notice_port = notice_port
+        self.notice_host = notice_host
+        self.notice_token = notice_token
+        self._wake = threading.Event()
+        self.monitors = []
+        for config in configs:
+            region_name = config.get('region_name', monitor_class.DEFAULT_CONFIG['region_name'])
+            self.monitors.append(monitor_class(config, mail_config, conn=self.connection(region_name),
+                                               metrics=metrics))
+
+    def check_all(self, timeout=None):
+        """Runs check_requests() for every pool concurrently.
+
+        :param timeout: seconds to wait for the pools to finish (default: None, no limit).
+        :return: list of names of pools that failed this cycle.
+        """
+        with self._conn_lock:
+            for conn in self._conns.values():
+                conn.new_cycle()
+        for monitor in self.monitors:
+            if monitor not in self._running:
+                self._running[monitor] = self._executor.submit(_check, monitor)
+
+        wait(list(self._running.values()), timeout=timeout)
+
+        failed = []
+        for monitor, future in list(self._running.items()):
+            if not future.done():
+                monitor.events.warning('check_running', 'pool {pool}: check still running', pool=monitor.name)
+                continue
+            del self._running[monitor]
+            error = future.exception()
+            if error is not None:
+                self.errors[monitor.name] = error
+                failed.append(monitor.name)
+            else:
+                self.errors.pop(monitor.name, None)
+        return failed
+
+    def connection(self, region_name):
+        """Returns the shared EC2 connection for a region, connecting if necessary.
+
+        EC2 throttles per account and region, so the connection is rate-limited once, for
+        all the region's pools (see ThrottledConnection); its retry budget is reset every
+        cycle.
+        """
+        with self._conn_lock:
+            conn = self._conns.get(region_name)
+            if conn is None:
+                config = AwsSpotMonitor.DEFAULT_CONFIG
+                conn = self._conns[region_name] = ThrottledConnection(
+                    connect(region_name), config['ec2_rate'], config['ec2_burst'],
+                    rates=config['ec2_rates'], max_retries=config['ec2_max_retries'],
+                    budget=config['ec2_retry_budget'], registry=self.metrics, region=region_name)
+            return conn
+
+    def loop(self, wait_secs=180):
+        """Periodically checks every pool.
+
+        :param wait_secs: seconds between the start of each cycle (default: 180).
+        :return: None
+        """
+        if self.metrics_port:
+            from .metrics import serve_metrics
+            serve_metrics(self.metrics, self.metrics_port)
+        if self.notice_port:
+            from .notices import serve_notices
+            serve_notices(self.notice, self.notice_port, self.notice_host, self.notice_token)
+        try:
+            while True:
+                start = time.time()
+                self.check_all(timeout=wait_secs)
+                self._wake.wait(max(0, wait_secs - (time.time() - start)))
+                self._wake.clear()
+        except KeyboardInterrupt:
+            print('...got CTRL+C; exiting loop')
+        finally:
+            self.shutdown()
+
+    def notice(self, instance_id, action=None, when=None):
+        """Passes an interruption notice to every pool (only its owner acts on it), and
+        starts the next cycle now."""
+        for monitor in self.monitors:
+            monitor.notice(instance_id, action, when)
+        self._wake.set()
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False)
+
+
+def _check(monitor):
+    try:
+        monitor.check_requests()
+    except Exception:
+        monitor.events.exception('check_failed', 'pool {pool}: check failed', pool=monitor.name)
+        raise
@@ -0,0 +1,158 @@
+from __future__ import absolute_import
+
+# standard
+import time
+
+# pypi: concurrent.futures is imported when the first hook is submitted.
+
+
+__all__ = ['HookExecutor']
+
+
+class HookExecutor(object):
+    """Runs a hook (e.g., AwsSpotMonitor.process_fulfilled) on a bounded pool of threads.
+
+    Each call is submitted under a key (e.g., a request ID), and a key has at most one call
+    in flight (or waiting to be retried) at a time. Calls are collected by poll(), which the
+    caller runs regularly, e.g., once per check: a call that raised, or ran for longer than
+    timeout seconds, is retried up to retries times, retry_delay seconds after the failure
+    (doubling with each retry), and is then given up.
+
+    A thread can't be stopped, so a call that times out is abandoned rather than cancelled:
+    its thread is busy until the call returns, and its result is ignored. Once every worker
+    is busy with an abandoned call, the pool is replaced by a fresh one (the calls waiting
+    for a worker move to it), so stuck calls hold threads, but never hold up new calls:
+    workers is the number of stuck calls a pool absorbs, and each replacement can leave up
+    to workers threads behind until their calls return.
+
+    submit() and poll() are meant to be called from one thread (the poll loop's).
+
+    :param fn: the hook: called as fn(*args) with the args given to submit().
+    :param workers: the most calls run at once, and the most stuck (abandoned) calls a pool
+                    absorbs before it's replaced.
+    :param timeout: seconds a call may run before it's treated as failed (None: no limit).
+    :param retries: how many times a failed call is retried.
+    :param retry_delay: seconds from a failure to the first retry.
+    :param on_done: optional callable, called (on the worker thread) when a call returns
+                    or raises, e.g., to wake the poll loop.
+    """
+    def __init__(self, fn, workers=4, timeout=600, retries=2, retry_delay=30, on_done=None):
+        self.abandoned = 0
+        self._fn = fn
+        self._workers = workers
+        self._timeout = timeout
+        self._retries = retries
+        self._retry_delay = retry_delay
+        self._on_done = on_done
+        self._executor = None
+        self._stuck = []      # futures of abandoned calls still running on the current pool
+        self._running = {}    # key -> (future, args, attempt, [start time])
+        self._waiting = {}    # key -> (due, args, attempt)
+
+    def __contains__(self, key):
+        return key in self._running or key in self._waiting
+
+    def __len__(self):
+        return len(self._running) + len(self._waiting)
+
+    def poll(self, now=None):
+        """Collects finished calls, and retries (or gives up on) failed and timed-out ones.
+
+        :param now: the current time (default: time.time()).
+        :return: tuple: (keys whose call succeeded,
+                         [(key, error)] of failed calls that will be retried,
+                         [(key, error)] of calls given up)
+        """
+        from concurrent.futures import TimeoutError
+        now = time.time() if now is None else now
+        succeeded, retrying, failed = [], [], []
+        for key, (future, args, attempt, started) in list(self._running.items()):
+            if future.done():
+                error = future.exception()
+                if error is None:
+                    del self._running[key]
+                    succeeded.append(key)
+                    continue
+            elif self._timeout is not None and started[0] is not None and now - started[0] > self._timeout:
+                error = TimeoutError('hook ran for more than {0} secs'.format(self._timeout))
+                self.abandoned += 1
+                self._stuck.append(future)
+            else:
+                continue
+
+            del self._running[key]
+            if attempt < self._retries:
+                self._waiting[key] = (now + self._retry_delay*2**attempt, args, attempt + 1)
+                retrying.append((key, error))
+            else:
+                failed.append((key, error))
+
+        self._stuck = [future for future in self._stuck if not future.done()]
+        if self._stuck and len(self._stuck) >= self._workers:
+            self._replace()
+
+        for key, (due, args, attempt) in list(self._waiting.items()):
+            if due <= now:
+                del self._waiting[key]
+                self._start(key, args, attempt)
+        return succeeded, retrying, failed
+
+    def shutdown(self, wait=False):
+        """Stops the worker threads, once their calls return; a later call starts new ones."""
+        if self._executor is not None:
+            self._executor, executor = None, self._executor
+            executor.shutdown(wait=wait)
+
+    def submit(self, key, *args):
+        """Starts fn(*args) under key, unless a call for key is already in flight.
+
+        :return: True if the call was started.
+        """
+        if key in self:
+            return False
+        self._start(key, args, 0)
+        return True
+
+    def wait(self, timeout=None):
+        """Waits until a running call finishes, times out, or a retry is due, for at most timeout secs.
+
+        :param timeout: the longest wait, in secs (default: None, no limit).
+        :return: None
+        """
+        now = time.time()
+        dues = [entry[0] for entry in self._waiting.values()]
+        if self._timeout is not None:
+            dues.extend(entry[3][0] + self._timeout for entry in self._running.values()
+                        if entry[3][0] is not None)
+        if dues:
+            due = max(0, min(dues) - now)
+            timeout = due if timeout is None else min(timeout, due)
+        futures = [entry[0] for entry in self._running.values()]
+        if futures:
+            from concurrent.futures import FIRST_COMPLETED, wait
+            wait(futures, timeout, FIRST_COMPLETED)
+        elif timeout:
+            time.sleep(timeout)
+
+    def _call(self, started, args):
+        started[0] = time.time()
+        return self._fn(*args)
+
+    def _replace(self):
+        """Replaces a pool whose workers are all stuck, moving the calls queued on it."""
+        self._executor, executor = None, self._executor
+        self._stuck = []
+        for key, (future, args, attempt, started) in list(self._running.items()):
+            if future.cancel():
+                self._start(key, args, attempt)
+        executor.shutdown(wait=False)
+
+    def _start(self, key, args, attempt):
+        if self._executor is None:
+            from concurrent.futures import ThreadPoolExecutor
+            self._executor = ThreadPoolExecutor(max_workers=self._workers)
+        started = [None]
+        future = self._executor.submit(self._call, started, args)
+        if self._on_done is not None:
+            future.add_done_callback(lambda f: self._on_done())
+        self._running[key] = (future, args, attempt, started)
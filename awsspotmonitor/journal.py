@@ -0,0 +1,168 @@
+from __future__ import absolute_import
+
+# standard
+import json
+import os
+import time
+
+
+__all__ = ['Journal']
+
+
+class Journal(object):
+    """A local, append-only record of the monitor's view of EC2.
+
+    The journal keeps the last-seen status code, instance ID and price of each live spot
+    request, the last-seen state of each instance, and which requests have been processed
+    (process_fulfilled() called and tagged). Each change is appended to a JSON-lines file as
+    it's recorded and flushed by commit(), once per check; when the file has grown to
+    compact_every records more than its live contents, it's rewritten as a snapshot. The
+    journal is also compacted when it's loaded, which drops any torn last line.
+
+    Loading the journal after a restart gives back the monitor's view as it was when it
+    stopped, so the first check only has to apply the differences.
+
+    Records are dicts with a type 't':
+        {'t': 'req', 'id': ..., 'code': ..., 'iid': ..., 'price': ...}
+        {'t': 'inst', 'id': ..., 'state': ...}
+        {'t': 'done', 'id': ...}        request processed
+        {'t': 'gone', 'id': ...}        request (and its instance) no longer live
+        {'t': 'ckpt', 'ts': ...}        commit time
+
+    A read_only journal is loaded without being compacted, and can't be written, so it can
+    be inspected while a monitor has it open.
+    """
+    def __init__(self, path, compact_every=1000, read_only=False):
+        self.path = path
+        self.compact_every = compact_every
+        self.read_only = read_only
+        self.requests = {}
+        self.instances = {}
+        self.processed = set()
+        self.checkpoint = None
+        self._records = 0
+        self._file = None
+        if os.path.exists(path):
+            self._load()
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def commit(self, checkpoint=None):
+        """Marks a consistent point (the end of a check), and flushes the journal.
+
+        :param checkpoint: the checkpoint time (default: time.time()).
+        :return: None
+        """
+        self.checkpoint = checkpoint if checkpoint is not None else time.time()
+        self._append(dict(t='ckpt', ts=self.checkpoint))
+        if self._records > self.compact_every + self._size():
+            self.compact()
+        else:
+            self._file.flush()
+
+    def compact(self):
+        """Rewrites the journal as a snapshot of its current contents."""
+        if self.read_only:
+            raise IOError('journal is read-only: {0}'.format(self.path))
+        self.close()
+        tmp = self.path + '.tmp'
+        with open(tmp, 'w') as f:
+            for record in self._snapshot():
+                f.write(json.dumps(record, separators=(',', ':')) + '\n')
+        os.rename(tmp, self.path)
+        self._records = self._size()
+
+    def forget(self, request_id):
+        """Records that a request is no longer live; its instance is forgotten with it."""
+        req = self.requests.pop(request_id, None)
+        if req is None:
+            return
+        self.processed.discard(request_id)
+        self.instances.pop(req.get('iid'), None)
+        self._append(dict(t='gone', id=request_id))
+
+    def is_processed(self, request_id):
+        return request_id in self.processed
+
+    def record_instance(self, instance_id, state):
+        """Records an instance's state, if it changed."""
+        if self.instances.get(instance_id) != state:
+            self.instances[instance_id] = state
+            self._append(dict(t='inst', id=instance_id, state=state))
+
+    def record_processed(self, request_id):
+        """Records that a request has been processed; flushed at once, as it's an action taken."""
+        if request_id not in self.processed:
+            self.processed.add(request_id)
+            self._append(dict(t='done', id=request_id))
+            self._file.flush()
+
+    def record_request(self, request_id, code, instance_id=None, price=None):
+        """Records a request's status code, instance ID and price, if any of them changed.
+
+        :return: the previously recorded dict for the request, or None if it's new.
+        """
+        previous = self.requests.get(request_id)
+        current = dict(code=code, iid=instance_id, price=price)
+        if previous != current:
+            self.requests[request_id] = current
+            record = dict(t='req', id=request_id)
+            record.update(current)
+            self._append(record)
+        return previous
+
+    def _append(self, record):
+        if self.read_only:
+            raise IOError('journal is read-only: {0}'.format(self.path))
+        if self._file is None:
+            self._file = open(self.path, 'a')
+        self._file.write(json.dumps(record, separators=(',', ':')) + '\n')
+        self._records += 1
+
+    def _apply(self, record):
+        t = record['t']
+        if t == 'req':
+            self.requests[record['id']] = dict(code=record['code'], iid=record['iid'],
+                                               price=record['price'])
+        elif t == 'inst':
+            self.instances[record['id']] = record['state']
+        elif t == 'done':
+            self.processed.add(record['id'])
+        elif t == 'gone':
+            req = self.requests.pop(record['id'], None)
+            self.processed.discard(record['id'])
+            if req is not None:
+                self.instances.pop(req.get('iid'), None)
+        elif t == 'ckpt':
+            self.checkpoint = record['ts']
+
+    def _load(self):
+        # records are appended as things happen, so everything up to a torn last line (from
+        # a crash mid-write) is valid, even after the last checkpoint.
+        with open(self.path) as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    break
+                self._records += 1
+                self._apply(record)
+        if not self.read_only:
+            self.compact()
+
+    def _size(self):
+        return len(self.requests) + len(self.instances) + len(self.processed) + 1
+
+    def _snapshot(self):
+        for id, req in sorted(self.requests.items()):
+            record = dict(t='req', id=id)
+            record.update(req)
+            yield record
+        for id, state in sorted(self.instances.items()):
+            yield dict(t='inst', id=id, state=state)
+        for id in sorted(self.processed):
+            yield dict(t='done', id=id)
+        yield dict(t='ckpt', ts=self.checkpoint)
@@ -0,0 +1,178 @@
+from __future__ import absolute_import
+from __future__ import print_function
+
+# standard
+import atexit
+from Queue import Empty, Queue
+import smtplib
+import socket
+import threading
+import time
+import traceback
+
+# package
+from .msg_util import create_plaintext_msg, open_smtp
+
+
+__all__ = ['MailQueue', 'get_mail_queue']
+
+
+_queues = {}
+_queues_lock = threading.Lock()
+
+
+def get_mail_queue(config):
+    """Returns the shared MailQueue for an SMTP host and account, creating it if necessary.
+
+    Monitors that mail through the same host and account share one queue, and so one
+    connection and one digest.
+
+    :param config: a mail configuration dictionary (see send_plaintext_msg()).
+    :return: MailQueue
+    """
+    key = tuple(config.get(k) for k in ('host', 'port', 'use_ssl', 'use_tls', 'username'))
+    with _queues_lock:
+        queue = _queues.get(key)
+        if queue is None:
+            queue = _queues[key] = MailQueue(config)
+            atexit.register(queue.close, 10)
+        return queue
+
+
+class MailQueue(object):
+    """Sends plaintext mail from a background thread.
+
+    send() only queues a message, so callers never wait on the mail relay. The sender thread
+    keeps one authenticated SMTP connection open between messages (checking it with NOOP,
+    and reconnecting when needed), and retries failed deliveries with exponential backoff.
+
+    Bursts are merged into digests: once a message is queued the sender waits digest_secs
+    for more, and never sends to the same recipients more often than every min_interval
+    seconds. Messages for the same sender and recipients that are queued in the meantime go
+    out as one mail.
+
+    The mail configuration is a dictionary like that used with send_plaintext_msg(), with
+    this optional additional key:
+        idle_secs: seconds an unused connection is kept open (default: 300).
+    """
+    def __init__(self, config, digest_secs=10, min_interval=60, retries=5, backoff=2.0):
+        self.config = config
+        self.digest_secs = digest_secs
+        self.min_interval = min_interval
+        self.retries = retries
+        self.backoff = backoff
+        self._queue = Queue()
+        self._smtp = None
+        self._last_sent = {}
+        self._thread = threading.Thread(target=self._run, name='MailQueue')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def close(self, timeout=None):
+        """Sends anything still queued, then stops the sender thread.
+
+        :param timeout: seconds to wait for the sender thread (default: None, no limit).
+        :return: None
+        """
+        if self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join(timeout)
+
+    def send(self, subject, sender, recipients, text, attachments=None):
+        """Queues a plaintext message; returns immediately.
+
+        :param subject: the message subject.
+        :param sender: address of the sender (string or tuple).
+        :param recipients: email address(es) to whom the mail should be sent.
+        :param text: the message text.
+        :param attachments: optional list of (filename, data) tuples (default: None).
+        :return: None
+        """
+        if isinstance(recipients, basestring):
+            recipients = [recipients]
+        self._queue.put((time.time(), subject, sender, tuple(recipients), text, attachments or []))
+
+    def _deliver(self, key, items):
+        sender, recipients = key
+        if len(items) == 1:
+            subject, text = items[0][1], items[0][4]
+        else:
+            subject = '{0} ({1} messages)'.format(items[0][1], len(items))
+            text = '\n\n'.join('===== {0}\n\n{1}'.format(item[1], item[4]) for item in items)
+        attachments = [a for item in items for a in item[5]]
+        sender, recipients, msg = create_plaintext_msg(subject, sender, list(recipients), text,
+                                                       attachments)
+
+        delay = 1.0
+        for attempt in range(self.retries + 1):
+            try:
+                self._connection().sendmail(sender, recipients, msg.as_string())
+                return True
+            except (smtplib.SMTPException, socket.error):
+                traceback.print_exc()
+                self._disconnect()
+                if attempt < self.retries:
+                    time.sleep(delay)
+                    delay *= self.backoff
+        print('giving up on mail: {0}'.format(subject))
+        return False
+
+    def _connection(self):
+        if self._smtp is not None:
+            try:
+                if self._smtp.noop()[0] == 250:
+                    return self._smtp
+            except (smtplib.SMTPException, socket.error):
+                pass
+            self._disconnect()
+        self._smtp = open_smtp(self.config)
+        return self._smtp
+
+    def _disconnect(self):
+        smtp, self._smtp = self._smtp, None
+        if smtp is not None:
+            try:
+                smtp.quit()
+            except (smtplib.SMTPException, socket.error):
+                pass
+
+    def _run(self):
+        pending = []
+        stopping = False
+        while not (stopping and not pending):
+            if pending:
+                # wait until the earliest digest is due, collecting whatever else arrives.
+                due = min(self._due(item) for item in pending)
+                timeout = max(0, due - time.time())
+            else:
+                timeout = self.config.get('idle_secs', 300) if self._smtp else None
+
+            try:
+                item = self._queue.get(timeout=timeout) if timeout is None or timeout > 0 \
+                    else self._queue.get_nowait()
+                if item is None:
+                    stopping = True
+                else:
+                    pending.append(item)
+                    continue
+            except Empty:
+                if not pending:
+                    self._disconnect()
+                    continue
+
+            now = time.time()
+            groups = {}
+            for item in pending:
+                groups.setdefault((item[2], item[3]), []).append(item)
+            pending = []
+            for key, items in groups.items():
+                if stopping or min(self._due(item) for item in items) <= now:
+                    self._deliver(key, items)
+                    self._last_sent[key] = time.time()
+                else:
+                    pending.extend(items)
+        self._disconnect()
+
+    def _due(self, item):
+        return max(item[0] + self.digest_secs,
+                   self._last_sent.get((item[2], item[3]), 0) + self.min_interval)
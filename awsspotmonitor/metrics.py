@@ -0,0 +1,232 @@
+from __future__ import absolute_import
+
+# standard
+from contextlib import contextmanager
+import json
+import threading
+import time
+
+
+__all__ = ['InstrumentedConnection', 'Registry', 'REGISTRY', 'serve_metrics']
+
+
+# help text for the monitor's metrics.
+_HELP = {
+    'awsspotmonitor_ec2_calls_total': 'EC2 API calls, by action and outcome.',
+    'awsspotmonitor_ec2_call_seconds': 'EC2 API call latency, by action.',
+    'awsspotmonitor_phase_seconds': 'Time spent in each phase of a check.',
+    'awsspotmonitor_requests': 'Spot requests in each state, as of the last check.',
+    'awsspotmonitor_instances': 'Running instances (less marked), as of the last check.',
+    'awsspotmonitor_request_retries_total': 'Spot-request submissions retried.',
+    'awsspotmonitor_check_failures_total': 'Checks ended by an EC2 error.',
+    'awsspotmonitor_ec2_throttled_total': 'EC2 API calls that failed with a retryable (throttling) error, by action.',
+    'awsspotmonitor_ec2_retries_total': 'EC2 API calls retried after backoff, by action.',
+    'awsspotmonitor_ec2_throttle_wait_seconds_total': 'Time spent waiting for the client-side rate limit, by action.',
+    'awsspotmonitor_notices_total': 'Interruption notices received.',
+    'awsspotmonitor_hook_failures_total': 'process_fulfilled() calls given up after retries.',
+    'awsspotmonitor_replacement_seconds': 'Time from detecting too few instances to having enough again.'
+}
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join('{0}="{1}"'.format(k, str(v).replace('\\', '\\\\').replace('"', '\\"'))
+                          for k, v in labels) + '}'
+
+
+class _Metric(object):
+    def __init__(self, name, help, kind):
+        self.name = name
+        self.help = help
+        self.kind = kind
+        self.values = {}
+        self.lock = threading.Lock()
+
+
+class Registry(object):
+    """A thread-safe collection of counters, gauges and histograms.
+
+    Metrics are identified by name and a dict of labels, e.g.,
+    registry.inc('awsspotmonitor_cycles_total', pool='web'). render() returns the metrics
+    in the Prometheus text exposition format, and snapshot() as a JSON-serializable dict.
+    """
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+        self._help = dict(_HELP)
+
+    def describe(self, name, help):
+        """Sets the help text for a metric."""
+        self._help[name] = help
+
+    def dump_jsonl(self, path):
+        """Appends a snapshot of all metrics to a JSON-lines file."""
+        with open(path, 'a') as f:
+            f.write(json.dumps(self.snapshot(), separators=(',', ':')) + '\n')
+
+    def get(self, name, **labels):
+        """Returns a counter or gauge value (or a histogram's [buckets, sum, count]), or None."""
+        metric = self._metrics.get(name)
+        return metric.values.get(tuple(sorted(labels.items()))) if metric else None
+
+    def inc(self, name, amount=1, **labels):
+        metric = self._metric(name, 'counter')
+        key = tuple(sorted(labels.items()))
+        with metric.lock:
+            metric.values[key] = metric.values.get(key, 0) + amount
+
+    def observe(self, name, value, buckets=DEFAULT_BUCKETS, **labels):
+        metric = self._metric(name, 'histogram')
+        metric.buckets = getattr(metric, 'buckets', buckets)
+        key = tuple(sorted(labels.items()))
+        with metric.lock:
+            counts = metric.values.get(key)
+            if counts is None:
+                counts = metric.values[key] = [[0]*len(metric.buckets), 0.0, 0]
+            for i, bound in enumerate(metric.buckets):
+                if value <= bound:
+                    counts[0][i] += 1
+            counts[1] += value
+            counts[2] += 1
+
+    def render(self):
+        """Returns all metrics in the Prometheus text exposition format."""
+        lines = []
+        for name in sorted(self._metrics):
+            metric = self._metrics[name]
+            if metric.help:
+                lines.append('# HELP {0} {1}'.format(name, metric.help))
+            lines.append('# TYPE {0} {1}'.format(name, metric.kind))
+            with metric.lock:
+                values = sorted(metric.values.items())
+            for key, value in values:
+                if metric.kind != 'histogram':
+                    lines.append('{0}{1} {2}'.format(name, _format_labels(key), value))
+                    continue
+                counts, total, count = value
+                for bound, n in zip(metric.buckets, counts):
+                    lines.append('{0}_bucket{1} {2}'.format(
+                        name, _format_labels(key + (('le', bound),)), n))
+                lines.append('{0}_bucket{1} {2}'.format(name, _format_labels(key + (('le', '+Inf'),)), count))
+                lines.append('{0}_sum{1} {2}'.format(name, _format_labels(key), total))
+                lines.append('{0}_count{1} {2}'.format(name, _format_labels(key), count))
+        return '\n'.join(lines) + '\n'
+
+    def set(self, name, value, **labels):
+        metric = self._metric(name, 'gauge')
+        with metric.lock:
+            metric.values[tuple(sorted(labels.items()))] = value
+
+    def snapshot(self):
+        """Returns all metrics as a dict: {'time': ..., 'metrics': [{name, labels, value}, ...]}."""
+        items = []
+        for name in sorted(self._metrics):
+            metric = self._metrics[name]
+            with metric.lock:
+                values = sorted(metric.values.items())
+            for key, value in values:
+                if metric.kind == 'histogram':
+                    value = dict(sum=value[1], count=value[2])
+                items.append(dict(name=name, labels=dict(key), value=value))
+        return dict(time=time.time(), metrics=items)
+
+    @contextmanager
+    def timer(self, name, **labels):
+        """Context manager that observes its duration, in seconds, in a histogram."""
+        start = time.time()
+        try:
+            yield
+        finally:
+            self.observe(name, time.time() - start, **labels)
+
+    def _metric(self, name, kind):
+        metric = self._metrics.get(name)
+        if metric is None:
+            with self._lock:
+                metric = self._metrics.get(name)
+                if metric is None:
+                    metric = self._metrics[name] = _Metric(name, self._help.get(name), kind)
+        return metric
+
+
+# the registry used when none is given.
+REGISTRY = Registry()
+
+
+class InstrumentedConnection(object):
+    """Wraps an EC2 connection, timing and counting every API call.
+
+    Calls are counted in awsspotmonitor_ec2_calls_total (labelled with the action and an
+    outcome: 'ok' or the EC2 error code) and timed in awsspotmonitor_ec2_call_seconds.
+    Attributes that aren't methods are passed through.
+    """
+    def __init__(self, conn, registry=REGISTRY, **labels):
+        self._conn = conn
+        self._registry = registry
+        self._labels = labels
+
+    def __getattr__(self, name):
+        attr = getattr(self._conn, name)
+        if not callable(attr) or name.startswith('_'):
+            return attr
+
+        # the wrapped connection is a boto connection (or a stand-in), so boto's loaded.
+        from boto.exception import EC2ResponseError
+        registry, labels = self._registry, self._labels
+
+        def call(*args, **kwargs):
+            outcome = 'ok'
+            start = time.time()
+            try:
+                return attr(*args, **kwargs)
+            except EC2ResponseError as e:
+                outcome = e.error_code or 'error'
+                raise
+            except Exception:
+                outcome = 'error'
+                raise
+            finally:
+                registry.observe('awsspotmonitor_ec2_call_seconds', time.time() - start,
+                                 action=name, **labels)
+                registry.inc('awsspotmonitor_ec2_calls_total', action=name, outcome=outcome, **labels)
+
+        # cache the wrapper, so later lookups don't come through __getattr__.
+        setattr(self, name, call)
+        return call
+
+
+def serve_metrics(registry=REGISTRY, port=9108, host='127.0.0.1'):
+    """Serves a registry's metrics over HTTP (GET /metrics) from a background thread.
+
+    :param registry: the registry to serve (default: REGISTRY).
+    :param port: the port to listen on; 0 picks a free port (default: 9108).
+    :param host: the address to listen on (default: '127.0.0.1').
+    :return: the HTTPServer; call shutdown() to stop it.
+    """
+    # the http modules are only needed here; importing them with the package slows startup.
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split('?')[0] not in ('/', '/metrics'):
+                self.send_error(404)
+                return
+            body = self.server.registry.render()
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = HTTPServer((host, port), Handler)
+    server.registry = registry
+    thread = threading.Thread(target=server.serve_forever, name='metrics')
+    thread.daemon = True
+    thread.start()
+    return server
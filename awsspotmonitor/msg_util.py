@@ -1,6 +1,8 @@
 from __future__ import absolute_import
 
 # standard
+from email.mime.application import MIMEApplication
+from email.mime.multipart import MIMEMultipart
 from email.mime.text import MIMEText
 from email.utils import formatdate, make_msgid
 import smtplib
@@ -8,8 +10,25 @@ import socket
 import traceback
 
 
-def create_plaintext_msg(subject, sender, recipients, msg_text):
+__all__ = ['create_plaintext_msg', 'open_smtp', 'send_plaintext_msg']
+
+
+def create_plaintext_msg(subject, sender, recipients, msg_text, attachments=None):
+    """Creates a plaintext email message, with optional attachments.
+
+    :param attachments: optional list of (filename, data) tuples; each is attached as
+                        application/octet-stream (or application/gzip if the name ends
+                        with '.gz').
+    :return: tuple: (sender, recipients, msg)
+    """
     msg = MIMEText(msg_text, _subtype='plain', _charset='utf-8')
+    if attachments:
+        body, msg = msg, MIMEMultipart()
+        msg.attach(body)
+        for filename, data in attachments:
+            part = MIMEApplication(data, 'gzip' if filename.endswith('.gz') else 'octet-stream')
+            part.add_header('Content-Disposition', 'attachment', filename=filename)
+            msg.attach(part)
 
     if isinstance(sender, tuple):
         sender = '%s <%s>' % sender
@@ -46,22 +65,7 @@ def send_plaintext_msg(config, sender, recipients, msg):
     """
     host = None
     try:
-        host = config.get('host', 'localhost')
-        port = config.get('port', 25)
-        if config.get('use_ssl', False):
-            host = smtplib.SMTP_SSL(host, port)
-        else:
-            host = smtplib.SMTP(host, port)
-
-        host.set_debuglevel(int(config.get('debug', 0)))
-        if config.get('use_tls', False):
-            host.starttls()
-
-        username = config.get('username', None)
-        password = config.get('password', None)
-        if username and password:
-            host.login(username, password)
-
+        host = open_smtp(config)
         host.sendmail(sender, recipients, msg.as_string())
     except socket.error:
         traceback.print_exc()
@@ -70,3 +74,25 @@ def send_plaintext_msg(config, sender, recipients, msg):
             host.quit()
 
 
+def open_smtp(config):
+    """Opens an SMTP connection and logs in, using a configuration like send_plaintext_msg()'s.
+
+    :param config: the mail configuration dictionary.
+    :return: smtplib.SMTP (or SMTP_SSL) instance.
+    """
+    host = config.get('host', 'localhost')
+    port = config.get('port', 25)
+    if config.get('use_ssl', False):
+        host = smtplib.SMTP_SSL(host, port)
+    else:
+        host = smtplib.SMTP(host, port)
+
+    host.set_debuglevel(int(config.get('debug', 0)))
+    if config.get('use_tls', False):
+        host.starttls()
+
+    username = config.get('username', None)
+    password = config.get('password', None)
+    if username and password:
+        host.login(username, password)
+    return host
@@ -0,0 +1,143 @@
+from __future__ import absolute_import
+from __future__ import print_function
+
+# standard
+from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+import json
+import sys
+import threading
+import time
+import urllib2
+
+
+__all__ = ['InterruptionWatcher', 'serve_notices']
+
+
+METADATA_URL = 'http://169.254.169.254/latest'
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        if self.path.split('?')[0] != '/notice':
+            self.send_error(404)
+            return
+        if self.server.token and self.headers.get('X-Notice-Token') != self.server.token:
+            self.send_error(403)
+            return
+        try:
+            body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))))
+            instance_id = body['instance_id']
+        except (ValueError, KeyError, TypeError):
+            self.send_error(400)
+            return
+        self.server.callback(instance_id, body.get('action'), body.get('time'))
+        self.send_response(204)
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve_notices(callback, port=9109, host='127.0.0.1', token=None):
+    """Receives interruption notices over HTTP from a background thread.
+
+    Agents POST a JSON notice to /notice: {"instance_id": ..., "action": ..., "time": ...},
+    where action and time are as given by the instance metadata, e.g., 'terminate' and
+    '2015-01-05T18:02:00Z'. Each notice is passed to callback(instance_id, action, time).
+
+    :param callback: called, on the server thread, for each notice.
+    :param port: the port to listen on; 0 picks a free port (default: 9109).
+    :param host: the address to listen on; agents on other hosts need a reachable address,
+        e.g., '0.0.0.0' (default: '127.0.0.1').
+    :param token: optional shared secret; if given, notices must carry it in an
+        X-Notice-Token header (default: None).
+    :return: the HTTPServer; call shutdown() to stop it.
+    """
+    server = HTTPServer((host, port), _Handler)
+    server.callback = callback
+    server.token = token
+    thread = threading.Thread(target=server.serve_forever, name='notices')
+    thread.daemon = True
+    thread.start()
+    return server
+
+
+class InterruptionWatcher(object):
+    """Agent that runs on a spot instance and forwards its interruption notice.
+
+    EC2 gives a spot instance about two minutes' notice before it's interrupted, through the
+    instance metadata (spot/instance-action). The watcher polls the metadata every interval
+    seconds and, when a notice appears, POSTs it once to the monitor's notice URL, e.g.,
+    'http://monitor:9109/notice'. Session tokens (IMDSv2) are used when the metadata service
+    gives them, and plain requests otherwise.
+
+    Run it on an instance with: python -m awsspotmonitor.notices <notice_url> [token]
+    """
+    def __init__(self, notice_url, token=None, metadata_url=METADATA_URL, interval=5, timeout=2):
+        self.notice_url = notice_url
+        self.token = token
+        self.metadata_url = metadata_url.rstrip('/')
+        self.interval = interval
+        self.timeout = timeout
+        self._session = None
+
+    def check(self):
+        """Checks for an interruption notice.
+
+        :return: dict: {'instance_id': ..., 'action': ..., 'time': ...}, or None.
+        """
+        try:
+            action = json.loads(self._metadata('meta-data/spot/instance-action'))
+        except urllib2.HTTPError as e:
+            if e.code == 404:
+                return None
+            raise
+        return dict(instance_id=self._metadata('meta-data/instance-id'),
+                    action=action.get('action'), time=action.get('time'))
+
+    def run(self):
+        """Polls until a notice is forwarded.
+
+        :return: the forwarded notice.
+        """
+        while True:
+            try:
+                notice = self.check()
+                if notice is not None:
+                    self.send(notice)
+                    return notice
+            except (urllib2.URLError, ValueError) as e:
+                print('interruption watcher: {0}'.format(e), file=sys.stderr)
+            time.sleep(self.interval)
+
+    def send(self, notice):
+        """POSTs a notice to the monitor."""
+        req = urllib2.Request(self.notice_url, json.dumps(notice),
+                              {'Content-Type': 'application/json'})
+        if self.token:
+            req.add_header('X-Notice-Token', self.token)
+        urllib2.urlopen(req, timeout=self.timeout).read()
+
+    def _metadata(self, path):
+        req = urllib2.Request('{0}/{1}'.format(self.metadata_url, path))
+        token = self._session_token()
+        if token:
+            req.add_header('X-aws-ec2-metadata-token', token)
+        return urllib2.urlopen(req, timeout=self.timeout).read()
+
+    def _session_token(self):
+        if self._session is None or self._session[1] < time.time():
+            req = urllib2.Request('{0}/api/token'.format(self.metadata_url), '',
+                                  {'X-aws-ec2-metadata-token-ttl-seconds': '21600'})
+            req.get_method = lambda: 'PUT'
+            try:
+                self._session = (urllib2.urlopen(req, timeout=self.timeout).read(),
+                                 time.time() + 21000)
+            except urllib2.URLError:
+                # no IMDSv2: use plain requests, and don't ask again for a while.
+                self._session = ('', time.time() + 21000)
+        return self._session[0]
+
+
+if __name__ == '__main__':
+    InterruptionWatcher(*sys.argv[1:3]).run()
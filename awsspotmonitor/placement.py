@@ -0,0 +1,123 @@
+from __future__ import absolute_import
+
+# standard
+from collections import namedtuple
+import time
+
+# package
+from .price_stats import STATS_STRATEGIES, batch_stats, strategy_price, to_arrays
+
+
+__all__ = ['Placement', 'PlacementOptimizer', 'request_zone']
+
+
+Placement = namedtuple('Placement', 'zone, price, score')
+
+
+def request_zone(req):
+    """Returns the availability zone a spot request launched (or was placed) in, or None."""
+    zone = getattr(req, 'launched_availability_zone', None)
+    if not zone:
+        spec = getattr(req, 'launch_specification', None)
+        zone = getattr(spec, 'placement', None)
+    return zone if isinstance(zone, basestring) else None
+
+
+class PlacementOptimizer(object):
+    """Ranks the availability zones of a region for spot bids.
+
+    Price history for all zones is fetched with one query (no availability zone) through
+    a shared PriceHistory, then split by zone and summarized in one batch_stats() pass.
+    Each zone is scored by the bid its strategy suggests, raised by its price volatility
+    (relative to its mean price) and by the requests it recently left holding, e.g., with
+    capacity-not-available. Lower scores are better.
+
+    Outcomes are recorded with record(); a holding request adds holding_penalty to the
+    zone's penalty, which halves every penalty_halflife seconds, and a fulfilled request
+    halves it at once. Zone statistics are cached for ttl seconds, and the ranking itself
+    until a new outcome is recorded.
+    """
+    def __init__(self, prices, strategy='average-high', halflife=6*3600, zones=None, ttl=300,
+                 volatility_weight=1.0, holding_penalty=0.5, penalty_halflife=3600):
+        self.prices = prices
+        self.strategy = strategy
+        self.halflife = halflife
+        self.zones = zones
+        self.ttl = ttl
+        self.volatility_weight = volatility_weight
+        self.holding_penalty = holding_penalty
+        self.penalty_halflife = penalty_halflife
+        self._penalties = {}
+        self._stats = None
+        self._ranking = None
+
+    def penalty(self, zone, now=None):
+        """Returns a zone's current outcome penalty (0 for no recent holding requests)."""
+        now = time.time() if now is None else now
+        value, ts = self._penalties.get(zone, (0.0, now))
+        return value*2**(-(now - ts)/float(self.penalty_halflife))
+
+    def rank(self, conn, instance_type, product_description, days=5, recent_price=0, now=None):
+        """Returns the availability zones with price history, best first.
+
+        :param conn: the EC2 connection used to fetch new price samples.
+        :param instance_type: the instance type.
+        :param product_description: the product description, e.g., 'Linux/UNIX'.
+        :param days: the number of days of price history to consider (default: 5).
+        :param recent_price: a recent bid price that was not fulfilled (default: 0).
+        :param now: the current time, in seconds since the epoch (default: time.time()).
+        :return: list of Placement(zone, price, score); empty if there's no price history.
+        """
+        now = time.time() if now is None else now
+        key = (instance_type, product_description, days, recent_price)
+        if self._ranking is not None and self._ranking[0] == key and self._ranking[1] > now:
+            return self._ranking[2]
+
+        ranking = []
+        for zone, stats in self._zone_stats(conn, instance_type, product_description, days, now):
+            price = strategy_price(self.strategy, stats.low, stats.high, stats.mean,
+                                   stats if self.strategy in STATS_STRATEGIES else None,
+                                   recent_price)
+            relative = stats.volatility/stats.mean if stats.mean > 0 else 0.0
+            score = price*(1 + self.volatility_weight*relative)*(1 + self.penalty(zone, now))
+            ranking.append(Placement(zone, price, score))
+        ranking.sort(key=lambda p: (p.score, p.zone))
+
+        self._ranking = (key, self._stats[1], ranking)
+        return ranking
+
+    def record(self, zone, held, now=None):
+        """Records the outcome of a request placed in a zone.
+
+        :param zone: the availability zone (ignored if None).
+        :param held: True if the request was left holding, False if it was fulfilled.
+        :param now: the current time, in seconds since the epoch (default: time.time()).
+        :return: None
+        """
+        if zone is None:
+            return
+        now = time.time() if now is None else now
+        value = self.penalty(zone, now)
+        value = value + self.holding_penalty if held else value/2
+        self._penalties[zone] = (value, now)
+        self._ranking = None
+
+    def _zone_stats(self, conn, instance_type, product_description, days, now):
+        """Returns [(zone, PriceStats)] for zones with price history, cached for ttl."""
+        key = (instance_type, product_description, days)
+        if self._stats is not None and self._stats[0] == key and self._stats[1] > now:
+            return self._stats[2]
+
+        series = self.prices.update(conn, None, instance_type, product_description, now)
+        since = now - days*24*3600
+        by_zone = {}
+        for sample in series.since(since):
+            if sample[2] and (not self.zones or sample[2] in self.zones):
+                by_zone.setdefault(sample[2], []).append(sample)
+
+        zones = sorted(by_zone)
+        stats = batch_stats([to_arrays(by_zone[zone], now) for zone in zones], now,
+                            halflife=self.halflife)
+        result = [(zone, s) for zone, s in zip(zones, stats) if s is not None]
+        self._stats = (key, now + self.ttl, result)
+        return result
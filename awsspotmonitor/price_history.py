@@ -0,0 +1,265 @@
+from __future__ import absolute_import
+
+# standard
+from calendar import timegm
+from collections import deque
+from datetime import datetime
+import json
+import os
+import time
+
+
+__all__ = ['PriceHistory', 'PriceSeries', 'parse_timestamp']
+
+
+def parse_timestamp(s):
+    """Converts an EC2 timestamp string to seconds since the epoch (UTC).
+
+    EC2 reports price-history timestamps like '2013-08-12T18:53:29.000Z'; the fractional
+    seconds and zone designator are ignored.
+
+    :param s: the timestamp string.
+    :return: float
+    """
+    return float(timegm(datetime.strptime(s[:19], '%Y-%m-%dT%H:%M:%S').timetuple()))
+
+
+class PriceSeries(object):
+    """Time-ordered spot-price samples for one market, limited to a sliding window.
+
+    Samples are (timestamp, price, availability_zone) tuples kept in ascending timestamp
+    order. Alongside the samples the series keeps a running sum and two monotonic queues,
+    so the low, high and average over the whole window are available in O(1) and samples
+    are added and expired in amortized O(1).
+    """
+    def __init__(self, window_secs):
+        self.window_secs = window_secs
+        self.samples = deque()
+        self._lows = deque()
+        self._highs = deque()
+        self._sum = 0.0
+
+    def __len__(self):
+        return len(self.samples)
+
+    @property
+    def newest(self):
+        return self.samples[-1][0] if self.samples else None
+
+    def add(self, samples):
+        """Appends samples, which must be in ascending order and newer than those held.
+
+        :param samples: iterable of (timestamp, price, availability_zone) tuples.
+        :return: None
+        """
+        for sample in samples:
+            ts, price = sample[0], sample[1]
+            self.samples.append(sample)
+            self._sum += price
+            while self._lows and self._lows[-1][1] >= price:
+                self._lows.pop()
+            self._lows.append((ts, price))
+            while self._highs and self._highs[-1][1] <= price:
+                self._highs.pop()
+            self._highs.append((ts, price))
+
+    def expire(self, now):
+        """Drops samples that have fallen out of the window.
+
+        A price holds until the next sample, so for each zone the newest sample before the
+        window is kept, moved to the window start: a market whose price hasn't changed
+        within the window still has that price.
+
+        :param now: the current time, in seconds since the epoch.
+        :return: None
+        """
+        cutoff = now - self.window_secs
+        if not self.samples or self.samples[0][0] >= cutoff:
+            return
+        in_effect = {}
+        while self.samples and self.samples[0][0] < cutoff:
+            sample = self.samples.popleft()
+            self._sum -= sample[1]
+            in_effect[sample[2]] = sample
+        while self._lows and self._lows[0][0] < cutoff:
+            self._lows.popleft()
+        while self._highs and self._highs[0][0] < cutoff:
+            self._highs.popleft()
+        if not self.samples:
+            self._sum = 0.0
+
+        # zones with a sample right at the window start don't need the older one.
+        for sample in self.samples:
+            if sample[0] > cutoff:
+                break
+            in_effect.pop(sample[2], None)
+
+        # the kept samples are the oldest, so they go at the front of the monotonic queues
+        # if no later sample is as low (or as high).
+        for sample in sorted(in_effect.values(), key=lambda s: s[1], reverse=True):
+            sample = (cutoff,) + tuple(sample[1:])
+            price = sample[1]
+            self.samples.appendleft(sample)
+            self._sum += price
+            if not self._lows or price < self._lows[0][1]:
+                self._lows.appendleft((cutoff, price))
+        for sample in sorted(in_effect.values(), key=lambda s: s[1]):
+            if not self._highs or sample[1] > self._highs[0][1]:
+                self._highs.appendleft((cutoff, sample[1]))
+
+    def since(self, since):
+        """Returns the samples in effect from a time on.
+
+        For each zone, the newest sample before since is included, moved to since.
+
+        :param since: the start time, in seconds since the epoch.
+        :return: list of samples, oldest first.
+        """
+        recent = []
+        in_effect = {}
+        for sample in reversed(self.samples):
+            if sample[0] >= since:
+                recent.append(sample)
+            elif sample[2] not in in_effect:
+                in_effect[sample[2]] = (since,) + tuple(sample[1:])
+        for sample in recent:
+            if sample[0] == since:
+                in_effect.pop(sample[2], None)
+        recent.extend(sorted(in_effect.values(), reverse=True))
+        recent.reverse()
+        return recent
+
+    def stats(self, since=None):
+        """Returns the low, high and average price.
+
+        Stats over the whole window come from the running values; stats for a shorter
+        period (since a given time) require a scan of the samples in that period.
+
+        :param since: optional start time, in seconds since the epoch (default: None).
+        :return: tuple: (low, high, average) price, or None if there are no samples.
+        """
+        if not self.samples:
+            return None
+        if since is None or since <= self.samples[0][0]:
+            return self._lows[0][1], self._highs[0][1], self._sum/len(self.samples)
+
+        prices = [s[1] for s in self.since(since)]
+        if not prices:
+            return None
+        return min(prices), max(prices), sum(prices)/len(prices)
+
+
+class PriceHistory(object):
+    """An incremental store of spot-price history.
+
+    The store holds a PriceSeries for each (availability_zone, instance_type,
+    product_description) market. Each update only asks EC2 for samples newer than the
+    newest one held, and updates are skipped entirely if the market was refreshed less
+    than refresh_secs ago. If a path is given, the store is loaded from and saved to
+    that file (JSON), so a restarted monitor doesn't download the whole window again.
+    """
+    VERSION = 1
+
+    def __init__(self, path=None, window_days=5, refresh_secs=60):
+        self.path = path
+        self.window_secs = window_days*24*3600
+        self.refresh_secs = refresh_secs
+        self._series = {}
+        self._fetched = {}
+        if path and os.path.exists(path):
+            self.load()
+
+    def get_price_info(self, conn, availability_zone, instance_type, product_description,
+                       days=None, now=None):
+        """Returns the low, high and average price for a market.
+
+        :param conn: the EC2 connection used to fetch new samples.
+        :param availability_zone: availability zone, or None for all zones.
+        :param instance_type: the instance type.
+        :param product_description: the product description, e.g., 'Linux/UNIX'.
+        :param days: the number of days to look back (default: the whole window).
+        :param now: the current time, in seconds since the epoch (default: time.time()).
+        :return: tuple: (low, high, average) price
+        """
+        now = time.time() if now is None else now
+        if days is not None and days*24*3600 > self.window_secs:
+            self._resize(days*24*3600)
+
+        series = self.update(conn, availability_zone, instance_type, product_description, now)
+        since = now - days*24*3600 if days is not None else None
+        info = series.stats(since)
+        if info is None:
+            raise ValueError('no price history for {0}/{1}/{2}'
+                             .format(availability_zone, instance_type, product_description))
+        return info
+
+    def load(self):
+        with open(self.path, 'r') as f:
+            dct = json.load(f)
+        if dct.get('version') != self.VERSION:
+            return
+        for item in dct['series']:
+            series = self.series(*item['key'])
+            series.add(tuple(s) for s in item['samples'])
+
+    def save(self):
+        dct = dict(
+            version = self.VERSION,
+            series = [dict(key=list(key), samples=list(series.samples))
+                      for key, series in self._series.items()]
+        )
+        tmp = self.path + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(dct, f, separators=(',', ':'))
+        os.rename(tmp, self.path)
+
+    def series(self, availability_zone, instance_type, product_description):
+        """Returns the (possibly empty) series for a market, creating it if necessary."""
+        key = (availability_zone, instance_type, product_description)
+        series = self._series.get(key)
+        if series is None:
+            series = self._series[key] = PriceSeries(self.window_secs)
+        return series
+
+    def update(self, conn, availability_zone, instance_type, product_description, now=None):
+        """Fetches samples newer than those held for a market, then expires old samples.
+
+        :return: the updated PriceSeries.
+        """
+        now = time.time() if now is None else now
+        key = (availability_zone, instance_type, product_description)
+        series = self.series(*key)
+        if now - self._fetched.get(key, 0) < self.refresh_secs:
+            return series
+
+        newest = series.newest
+        start = newest if newest is not None else now - self.window_secs
+        items = conn.get_spot_price_history(
+            start_time=datetime.utcfromtimestamp(start).isoformat(),
+            availability_zone=availability_zone,
+            instance_type=instance_type,
+            product_description=product_description)
+
+        # EC2 returns samples newest-first, and includes the sample in effect at
+        # start_time, which we may already hold.
+        held = set((s[0], s[2]) for s in reversed(series.samples) if s[0] == newest)
+        fresh = []
+        for item in items:
+            ts = parse_timestamp(item.timestamp)
+            az = getattr(item, 'availability_zone', availability_zone)
+            if newest is None or ts > newest or (ts == newest and (ts, az) not in held):
+                fresh.append((ts, float(item.price), az))
+        fresh.sort()
+
+        series.add(fresh)
+        series.expire(now)
+        self._fetched[key] = now
+        if self.path and fresh:
+            self.save()
+        return series
+
+    def _resize(self, window_secs):
+        # a longer window needs older samples than those held; start again.
+        self.window_secs = window_secs
+        self._series = {}
+        self._fetched = {}
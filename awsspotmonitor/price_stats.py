@@ -0,0 +1,180 @@
+from __future__ import absolute_import
+
+# standard
+from collections import namedtuple
+import random
+
+# pypi
+import numpy as np
+
+
+__all__ = ['PriceStats', 'STATS_STRATEGIES', 'batch_stats', 'compute_stats', 'strategy_price',
+           'time_above', 'to_arrays']
+
+
+PriceStats = namedtuple('PriceStats', 'low, high, mean, p50, p90, p99, ewma, volatility')
+
+# bid strategies that need PriceStats, rather than just (low, high, average).
+STATS_STRATEGIES = ('p50', 'p90', 'p99', 'ewma', 'ewma-high')
+
+
+def to_arrays(samples, end):
+    """Converts price-history samples into time-weighted arrays.
+
+    A spot price holds from its timestamp until the next sample for the same availability
+    zone, so each sample is weighted by that duration; the newest sample in each zone holds
+    until end.
+
+    :param samples: sequence of (timestamp, price, availability_zone) tuples.
+    :param end: the end of the period, in seconds since the epoch.
+    :return: tuple of arrays: (times, prices, weights)
+    """
+    n = len(samples)
+    times = np.fromiter((s[0] for s in samples), dtype=np.float64, count=n)
+    prices = np.fromiter((s[1] for s in samples), dtype=np.float64, count=n)
+    if not n:
+        return times, prices, np.zeros(0)
+    _, zones = np.unique([s[2] or '' for s in samples], return_inverse=True)
+    return times, prices, _durations(times, zones, end)
+
+
+def batch_stats(groups, end, halflife=6*3600):
+    """Computes PriceStats for many sample sets in one vectorized pass.
+
+    :param groups: sequence of (times, prices, weights) array tuples, e.g., from to_arrays().
+    :param end: the end of the period, in seconds since the epoch.
+    :param halflife: the EWMA half-life, in seconds (default: 6 hours).
+    :return: list of PriceStats, None for groups with no samples.
+    """
+    counts = np.array([len(g[0]) for g in groups], dtype=np.intp)
+    result = [None]*len(groups)
+    if not counts.sum():
+        return result
+
+    gid = np.repeat(np.arange(len(groups)), counts)
+    t = np.concatenate([g[0] for g in groups])
+    p = np.concatenate([g[1] for g in groups])
+    w = np.concatenate([g[2] for g in groups]).copy()
+    ngroups = len(groups)
+
+    # groups with no elapsed time (e.g., a single sample at end) fall back to equal weights.
+    total = np.bincount(gid, w, ngroups)
+    flat = total[gid] <= 0
+    w[flat] = 1.0
+    total = np.bincount(gid, w, ngroups)
+
+    present = counts > 0
+    starts = np.concatenate(([0], np.cumsum(counts)[:-1]))[present]
+    low = np.full(ngroups, np.nan)
+    high = np.full(ngroups, np.nan)
+    low[present] = np.minimum.reduceat(p, starts)
+    high[present] = np.maximum.reduceat(p, starts)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = np.bincount(gid, w*p, ngroups)/total
+        volatility = np.sqrt(np.bincount(gid, w*(p - mean[gid])**2, ngroups)/total)
+
+        # EWMA: each sample's time weight decays with the age of its midpoint.
+        mid = t + w*(~flat)/2
+        decay = w*np.exp2(-(end - mid)/float(halflife))
+        ewma = np.bincount(gid, decay*p, ngroups)/np.bincount(gid, decay, ngroups)
+    ewma = np.where(np.isfinite(ewma), ewma, mean)
+
+    # weighted percentiles: sort by (group, price) and search the cumulative weights.
+    order = np.lexsort((p, gid))
+    cum = np.cumsum(w[order])
+    base = np.concatenate(([0.0], np.cumsum(total)[:-1]))
+    qs = np.array([0.5, 0.9, 0.99])
+    idx = np.searchsorted(cum, base[:, None] + qs[None, :]*total[:, None], side='left')
+    ends = np.cumsum(counts)-1
+    idx = np.minimum(idx, ends[:, None])
+    pct = p[order][np.maximum(idx, 0)]
+
+    for i in np.flatnonzero(present):
+        result[i] = PriceStats(*[float(v) for v in (low[i], high[i], mean[i], pct[i, 0],
+                                                     pct[i, 1], pct[i, 2], ewma[i], volatility[i])])
+    return result
+
+
+def compute_stats(samples, end, halflife=6*3600):
+    """Computes PriceStats for a sequence of price-history samples.
+
+    :param samples: sequence of (timestamp, price, availability_zone) tuples.
+    :param end: the end of the period, in seconds since the epoch.
+    :param halflife: the EWMA half-life, in seconds (default: 6 hours).
+    :return: PriceStats, or None if there are no samples.
+    """
+    return batch_stats([to_arrays(samples, end)], end, halflife)[0]
+
+
+def strategy_price(strategy, low, high, avg, stats=None, recent_price=0, factor=1.05, rand=None):
+    """Returns the bid price a strategy suggests.
+
+    The 'high', 'average-high', 'average' and 'random' strategies use the low, high and
+    average; the percentile and 'ewma' strategies bid the corresponding time-weighted
+    statistic, and 'ewma-high' bids two standard deviations above the EWMA, capped at the
+    high. Any strategy bids at least factor times a recent bid that wasn't fulfilled.
+
+    The prices may also be arrays (e.g., for backtesting), in which case an array of bids
+    is returned.
+
+    :param strategy: the strategy name (see AwsSpotMonitor.DEFAULT_CONFIG).
+    :param low: the low price.
+    :param high: the high price.
+    :param avg: the average price.
+    :param stats: PriceStats, required for the STATS_STRATEGIES (default: None).
+    :param recent_price: a recent bid price that was not fulfilled (default: 0).
+    :param factor: how much to raise on a recent bid (default: 1.05).
+    :param rand: the 'random' strategy's draw(s) in [0, 1) (default: random.random()).
+    :return: float, or array
+    """
+    floor = np.multiply(recent_price, factor)
+    if strategy in STATS_STRATEGIES:
+        if strategy == 'ewma-high':
+            # two standard deviations above the trend, but no higher than the high.
+            price = np.maximum(np.minimum(stats.ewma + 2*stats.volatility, stats.high), floor)
+        else:
+            price = np.maximum(getattr(stats, strategy), floor)
+    elif strategy == 'high':
+        price = np.maximum(high, floor)
+    elif strategy == 'random':
+        l = np.maximum(low, floor)
+        h = np.maximum(high, floor)
+        price = l + abs(h-l)*(random.random() if rand is None else rand)
+    elif strategy == 'average-high':
+        a = np.maximum(avg, floor)
+        price = a + abs(high-a)/2
+    else:
+        # strategy == 'average'
+        price = np.maximum(avg, floor)
+    return float(price) if np.ndim(price) == 0 else price
+
+
+def time_above(prices, weights, levels):
+    """Returns the fraction of time the price was above each of the given levels.
+
+    :param prices: array of prices.
+    :param weights: array of time weights, e.g., from to_arrays().
+    :param levels: a price, or an array of prices.
+    :return: float or array of floats.
+    """
+    order = np.argsort(prices)
+    p = prices[order]
+    cum = np.concatenate(([0.0], np.cumsum(weights[order])))
+    idx = np.searchsorted(p, levels, side='right')
+    return (cum[-1] - cum[idx])/cum[-1] if cum[-1] > 0 else np.zeros_like(idx, dtype=np.float64)
+
+
+def _durations(times, zones, end):
+    order = np.lexsort((times, zones))
+    t = times[order]
+    z = zones[order]
+    nxt = np.empty_like(t)
+    nxt[:-1] = t[1:]
+    nxt[-1:] = end
+    last = np.ones(len(t), dtype=bool)
+    last[:-1] = z[1:] != z[:-1]
+    nxt[last] = end
+    durations = np.empty_like(t)
+    durations[order] = np.maximum(nxt - t, 0.0)
+    return durations
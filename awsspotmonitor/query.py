@@ -0,0 +1,58 @@
+from __future__ import absolute_import
+
+
+__all__ = ['ACTIVE_INSTANCE_STATES', 'get_spot_instances', 'get_spot_requests']
+
+
+# instance states that count as capacity ('shutting-down' and 'terminated' don't).
+ACTIVE_INSTANCE_STATES = ('pending', 'running', 'stopping', 'stopped')
+
+
+def get_spot_instances(conn, instance_ids=None):
+    """Returns active spot instances, filtered by EC2.
+
+    If instance_ids is given only those instances are looked up, so the cost of the call
+    depends on the number of IDs, not on the number of instances in the region. An empty
+    list of IDs returns an empty list without calling EC2.
+
+    :param conn: the EC2 connection.
+    :param instance_ids: optional list of instance IDs (default: None).
+    :return: list of instances (may be empty).
+    """
+    filters = {
+        'instance-lifecycle': 'spot',
+        'instance-state-name': list(ACTIVE_INSTANCE_STATES)
+    }
+    if instance_ids is None:
+        reservations = conn.get_all_instances(filters=filters)
+    elif not instance_ids:
+        return []
+    else:
+        from boto.exception import EC2ResponseError
+        try:
+            reservations = conn.get_all_instances(instance_ids=list(instance_ids), filters=filters)
+        except EC2ResponseError as e:
+            # an unknown ID fails the whole call: it can be too new to be visible yet, or
+            # long gone. fall back to a filtered query restricted to the same IDs.
+            if e.error_code != 'InvalidInstanceID.NotFound':
+                raise
+            ids = set(instance_ids)
+            return [i for i in get_spot_instances(conn) if i.id in ids]
+
+    return [i for r in reservations for i in r.instances]
+
+
+def get_spot_requests(conn, status_codes=None, tag=None):
+    """Returns spot-instance requests, filtered by EC2.
+
+    :param conn: the EC2 connection.
+    :param status_codes: optional list of request status codes to include (default: None).
+    :param tag: optional (key, value) tag that requests must have (default: None).
+    :return: list of spot-instance requests (may be empty).
+    """
+    filters = {}
+    if status_codes:
+        filters['status-code'] = list(status_codes)
+    if tag:
+        filters['tag:{0}'.format(tag[0])] = tag[1]
+    return conn.get_all_spot_instance_requests(filters=filters or None)
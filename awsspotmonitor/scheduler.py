@@ -0,0 +1,55 @@
+from __future__ import absolute_import
+
+# standard
+import random
+import threading
+
+
+__all__ = ['PollScheduler']
+
+
+class PollScheduler(object):
+    """Decides how long to wait between checks, and waits.
+
+    While something is in flux (requests pending or holding, instances marked for
+    termination, too few instances) the scheduler polls every min_secs. Once things are
+    quiet the delay grows by backoff each time, up to max_secs. Every delay gets +/- jitter
+    (a fraction) so many monitors don't poll in lock-step.
+
+    The wait can be cut short by calling wake() from another thread, e.g., when an
+    interruption notice arrives.
+    """
+    def __init__(self, min_secs=10, max_secs=180, backoff=2.0, jitter=0.1):
+        self.min_secs = min_secs
+        self.max_secs = max_secs
+        self.backoff = backoff
+        self.jitter = jitter
+        self._delay = min_secs
+        self._event = threading.Event()
+
+    def next_delay(self, busy):
+        """Returns the number of seconds to wait before the next check.
+
+        :param busy: True if the last check found anything in flux.
+        :return: float
+        """
+        if busy:
+            self._delay = self.min_secs
+        else:
+            self._delay = min(self._delay*self.backoff, self.max_secs)
+        return self._delay*(1 + random.uniform(-self.jitter, self.jitter))
+
+    def sleep(self, secs):
+        """Waits for secs seconds, or until wake() is called.
+
+        :param secs: the number of seconds to wait.
+        :return: True if woken early.
+        """
+        woken = self._event.wait(secs)
+        self._event.clear()
+        return bool(woken)
+
+    def wake(self):
+        """Ends the current (or next) sleep() early, and resets the delay to min_secs."""
+        self._delay = self.min_secs
+        self._event.set()
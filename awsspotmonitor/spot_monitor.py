@@ -7,17 +7,34 @@ from datetime import datetime, timedelta
 import os
 import random
 import time
-import traceback
 
-# pypi
-import boto.ec2
-from boto.exception import EC2ResponseError
-
-# package
+# package. boto, numpy and the mail modules are imported where they're first needed, so
+# the package (and the command line) start quickly.
+from .batch import MutationBatch
 from .capturelog import CaptureLog
+from .events import INFO, EventLog, JsonlSink
+from .hooks import HookExecutor
+from .journal import Journal
+from .metrics import InstrumentedConnection, REGISTRY
+from .price_history import PriceHistory
+from .query import get_spot_instances, get_spot_requests
+from .scheduler import PollScheduler
+from .throttle import ThrottledConnection, classify
+
+
+__all__ = ['AwsSpotMonitor', 'RequestEvent', 'RequestIndex', 'connect']
 
 
-__all__ = ['AwsSpotMonitor']
+def connect(region_name):
+    """Connects to EC2 in a region, using credentials from the environment.
+
+    :param region_name: the region, e.g., 'us-east-1'.
+    :return: boto.ec2.connection.EC2Connection
+    """
+    import boto.ec2
+    return boto.ec2.connect_to_region(region_name,
+        aws_access_key_id=os.environ['AWS_ACCESS_KEY_ID'],
+        aws_secret_access_key=os.environ['AWS_SECRET_ACCESS_KEY'])
 
 
 class Request(object):
@@ -36,6 +53,7 @@ class Request(object):
        the right moment. However, when this status is detected it is distinguishable.
     """
     DATE_TAG = 'req_date'
+    WARM_TAG = 'warm_for'       # a warm replacement's tag: the IDs of the instances it replaces
     DATETIME_FORMAT = '%Y-%m-%dT%H:%M:%S'
 
     State = namedtuple('State', 'Dead, Terminated, Pending, Holding, Fulfilled, Marked')(
@@ -47,6 +65,59 @@ class Request(object):
         Marked = 5
     )
 
+    # documented spot-request status codes, by state. the live states (whose requests are,
+    # or may yet be, backed by an instance) come first.
+    STATE_CODES = (
+        (State.Pending, (
+            'pending-evaluation',
+            'pending-fulfillment')),
+        (State.Holding, (
+            'capacity-not-available',
+            'capacity-oversubscribed',
+            'price-too-low',
+            'not-scheduled-yet',
+            'launch-group-constraint',
+            'az-group-constraint',
+            'placement-group-constraint',
+            'constraint-not-fulfillable',
+            'limit-exceeded')),
+        (State.Fulfilled, (
+            'fulfilled',
+            'request-canceled-and-instance-running')),
+        (State.Marked, (
+            'marked-for-termination',
+            'marked-for-stop',
+            'marked-for-stop-by-experiment')),
+        (State.Terminated, (
+            'instance-terminated-by-price',
+            'instance-terminated-by-user',
+            'instance-terminated-by-service',
+            'instance-terminated-by-schedule',
+            'instance-terminated-by-experiment',
+            'spot-instance-terminated-by-user',
+            'instance-terminated-no-capacity',
+            'instance-terminated-capacity-oversubscribed',
+            'instance-terminated-launch-group-constraint',
+            'instance-stopped-by-price',
+            'instance-stopped-by-user',
+            'instance-stopped-no-capacity',
+            'instance-stopped-by-experiment')),
+        (State.Dead, (
+            'bad-parameters',
+            'canceled-before-fulfillment',
+            'schedule-expired',
+            'system-error'))
+    )
+
+    # status code -> State lookup table. unknown codes are treated as dead.
+    STATUS_STATES = dict((code, state) for state, codes in STATE_CODES for code in codes)
+
+    # status codes of live requests: these are the only requests the monitor needs to fetch.
+    LIVE_STATUS_CODES = tuple(sorted(code for state, codes in STATE_CODES[:4] for code in codes))
+
+    # there can be one Request for every request in an account, so keep them small.
+    __slots__ = ('req', '_dt', '_state')
+
     @property
     def last_date(self):
         if self._dt is None:
@@ -57,57 +128,108 @@ class Request(object):
     def __init__(self, boto_req):
         self.req = boto_req
         self._dt = None
-        self._state = None
+        self._state = self.STATUS_STATES.get(boto_req.status.code, self.State.Dead)
 
     def state(self):
-        # use cached state if possible.
-        if self._state:
-            return self._state
-
-        if self.req.status.code in (
-                'marked-for-termination'):
-            self._state = self.State.Marked
-        elif self.req.status.code in (
-                'instance-terminated-by-price'
-                'instance-terminated-by-user',
-                'spot-instance-terminated-by-user',
-                'instance-terminated-no-capacity',
-                'instance-terminated-capacity-oversubscribed',
-                'instance-terminated-launch-group-constraint'):
-            self._state = self.State.Terminated
-        elif self.req.status.code in (
-                'pending-evaluation',
-                'pending-fulfillment'):
-            self._state = self.State.Pending
-        elif self.req.status.code in (
-                'capacity-not-available',
-                'capacity-oversubscribed',
-                'price-too-low',
-                'not-scheduled-yet',
-                'launch-group-constraint',
-                'az-group-constraint',
-                'placement-group-constraint',
-                'constraint-not-fulfillable'):
-            self._state = self.State.Holding
-        elif self.req.status.code in (
-                'fulfilled',
-                'request-canceled-and-instance-running'):
-            self._state = self.State.Fulfilled
-        else:
-            self._state = self.State.Dead
-
         return self._state
 
-    def mark(self):
+    def mark(self, batch=None):
+        """Tags the request as processed, now or (if a MutationBatch is given) on flush.
+
+        :return: the DATE_TAG value.
+        """
         s = datetime.utcnow().strftime(self.DATETIME_FORMAT)
-        print('marking {0} with {1}'.format(self.req.id, s))
-        self.req.add_tag(self.DATE_TAG, s)
+        if batch is not None:
+            batch.tag(self.req.id, self.DATE_TAG, s)
+        else:
+            self.req.add_tag(self.DATE_TAG, s)
+        return s
+
+
+RequestEvent = namedtuple('RequestEvent', 'kind, request_id, request, previous')
+
+
+class RequestIndex(object):
+    """The last-seen spot requests, keyed by request ID, with change detection.
+
+    Each update() is diffed against the index by each request's status code, price and
+    instance ID, and the transitions are returned (and passed to subscribers) as
+    RequestEvents:
+        kind: 'new', 'changed' or 'gone' (no longer fetched, i.e., no longer live).
+        request_id: the request ID.
+        request: the Request (for 'gone', the last one seen).
+        previous: the previous (status code, price, instance ID), or None for 'new'.
+
+    Unchanged requests keep their Request wrapper (with the freshly fetched boto request),
+    so the cost of an update beyond the fetch scales with the number of transitions.
+    """
+    def __init__(self):
+        self._entries = {}
+        self._subscribers = []
+
+    def __contains__(self, request_id):
+        return request_id in self._entries
+
+    def __iter__(self):
+        return (entry[1] for entry in self._entries.values())
+
+    def __len__(self):
+        return len(self._entries)
+
+    def forget(self, request_id):
+        """Drops a request, so the next update() reports it as new."""
+        self._entries.pop(request_id, None)
+
+    def get(self, request_id):
+        """Returns the Request for an ID, or None."""
+        entry = self._entries.get(request_id)
+        return entry[1] if entry else None
+
+    def subscribe(self, callback):
+        """Calls callback(event) for every RequestEvent from now on."""
+        self._subscribers.append(callback)
+
+    def update(self, boto_reqs):
+        """Replaces the index's contents with freshly fetched requests.
+
+        :param boto_reqs: iterable of boto spot-instance requests: all the live requests.
+        :return: list of RequestEvents.
+        """
+        events = []
+        seen = set()
+        for boto_req in boto_reqs:
+            id = boto_req.id
+            seen.add(id)
+            key = (boto_req.status.code, boto_req.price, boto_req.instance_id)
+            entry = self._entries.get(id)
+            if entry is None:
+                entry = self._entries[id] = (key, Request(boto_req))
+                events.append(RequestEvent('new', id, entry[1], None))
+            elif entry[0] != key:
+                previous = entry[0]
+                entry = self._entries[id] = (key, Request(boto_req))
+                events.append(RequestEvent('changed', id, entry[1], previous))
+            else:
+                entry[1].req = boto_req
+
+        if len(seen) < len(self._entries):
+            for id in [id for id in self._entries if id not in seen]:
+                key, req = self._entries.pop(id)
+                events.append(RequestEvent('gone', id, req, key))
+
+        for event in events:
+            for callback in self._subscribers:
+                callback(event)
+        return events
 
 
 class AwsSpotMonitor(object):
     DEFAULT_CONFIG = dict(
         region_name = 'us-east-1',
 
+        # name used to identify the pool in fleet logs (default: instance type and zone).
+        pool_name = None,
+
         # parameters for pricing query.
         availability_zone = None,
         instance_type = 't1.micro',
@@ -116,16 +238,163 @@ class AwsSpotMonitor(object):
         # Amazon Linux AMI.
         ami_id = 'ami-54cf5c3d',
 
+        # multi-AZ placement: if multi_az is True, each submission goes to the availability
+        # zone with the best price, volatility and recent fulfillment, falling back to the
+        # next best zone on error. availability_zones optionally limits the zones considered;
+        # zone rankings are cached for placement_ttl_secs.
+        multi_az = False,
+        availability_zones = None,
+        placement_ttl_secs = 300,
+
+        # number of running spot instances to maintain.
+        target_capacity = 1,
+
+        # warm replacement: if warm_replacement is True, an instance at risk is replaced
+        # before it's lost: when the market price in its zone comes within warm_price_margin
+        # (a fraction of its bid) of its bid, a replacement is requested at once (marked and
+        # noticed instances are already replaced as soon as they're seen). once capacity is
+        # restored, the surplus is cancelled: open requests first, then the instances of
+        # replacements requested this way. replacements are tagged (see Request.WARM_TAG), so
+        # they're known after a restart, and become ordinary requests once the instances they
+        # replace are gone.
+        warm_replacement = False,
+        warm_price_margin = 0.1,
+
         # security/firewall.
         key_pair_name = None,       # key-pair name
         security_groups = None,     # list of group names
 
-        # price/bid strategy: ['high' | 'average-high' | 'average' | 'random']
-        # use 'high' or 'average-high' for best chance of fulfillment.
+        # price/bid strategy: ['high' | 'average-high' | 'average' | 'random' |
+        #                      'p50' | 'p90' | 'p99' | 'ewma' | 'ewma-high']
+        # use 'high', 'average-high', 'p99' or 'ewma-high' for best chance of fulfillment.
+        # the percentile and ewma strategies use time-weighted price statistics.
         # 'random' strategy really only useful for test/debug.
-        price_strategy = 'average-high'
+        price_strategy = 'average-high',
+        ewma_halflife_hours = 6,
+
+        # price history: samples are cached for price_window_days and refreshed at most
+        # every price_refresh_secs. if price_history_path is given, the cache is also
+        # kept on disk so it survives restarts.
+        price_window_days = 5,
+        price_refresh_secs = 60,
+        price_history_path = None,
+
+        # optional (key, value) tag put on every request this monitor submits; if given,
+        # only requests with the tag are monitored.
+        monitor_tag = None,
+
+        # capture logs keep at most capture_max_bytes in memory; the rest is spilled to a
+        # compressed file in capture_spill_dir (default: the system temp directory).
+        capture_max_bytes = 256*1024,
+        capture_spill_dir = None,
+
+        # logging: events at or above log_level ('debug' | 'info' | 'warning' | 'error') are
+        # printed, and captured for mail; if event_log_path is given, events at or above
+        # event_log_level are also appended to it as JSON lines. debug events (e.g., each
+        # check's request counts) cost next to nothing unless some sink wants them.
+        log_level = 'info',
+        event_log_path = None,
+        event_log_level = 'debug',
+
+        # metrics: if metrics_port is given, loop() serves them at http://127.0.0.1:<port>/
+        # in the Prometheus text format; if metrics_jsonl_path is given, a snapshot is
+        # appended to that file after every check.
+        metrics_port = None,
+        metrics_jsonl_path = None,
+
+        # interruption notices: if notice_port is given, loop() receives notices POSTed by
+        # the InterruptionWatcher agent on each instance (see notices.py), and replaces a
+        # noticed instance at once, without waiting for its request to be marked.
+        # notice_host must be reachable from the instances; notice_token is an optional
+        # shared secret.
+        notice_port = None,
+        notice_host = '127.0.0.1',
+        notice_token = None,
+
+        # each check fetches requests, instances (by the IDs last seen) and, if a shortfall
+        # is likely, prices in parallel, on up to fetch_workers threads. 0 fetches them one
+        # after another.
+        fetch_workers = 3,
+
+        # EC2 API calls are rate-limited per action, with token buckets that allow ec2_rate
+        # calls per second and bursts of ec2_burst; ec2_rates overrides the rate of some
+        # actions. throttled calls (RequestLimitExceeded, ...) are retried with exponential
+        # backoff and jitter, up to ec2_max_retries times per call and ec2_retry_budget
+        # times per check. a submission that fails because the bid is too low or the zone
+        # has no capacity is retried with a higher bid (or the next zone) for up to
+        # submit_attempts passes.
+        ec2_rate = 20,
+        ec2_burst = 100,
+        ec2_rates = dict(request_spot_instances=5, cancel_spot_instance_requests=5, create_tags=5),
+        ec2_max_retries = 4,
+        ec2_retry_budget = 10,
+        submit_attempts = 3,
+
+        # process_fulfilled() runs on up to hook_workers threads, so a slow bootstrap doesn't
+        # hold up the checks. a call that raises, or runs for more than hook_timeout_secs,
+        # is retried up to hook_retries times, hook_retry_secs after failing (doubling each
+        # time); a request is only tagged as processed once its call succeeds. 0 workers
+        # calls process_fulfilled() during the check. a timed-out call can't be stopped: its
+        # thread is abandoned, and once hook_workers are, the threads are replaced, so
+        # hook_workers also bounds how many stuck calls are absorbed before that.
+        hook_workers = 4,
+        hook_timeout_secs = 600,
+        hook_retries = 2,
+        hook_retry_secs = 30,
+
+        # optional path of a local journal of requests, instances and actions taken; with a
+        # journal, a restarted monitor resumes where it left off.
+        journal_path = None
     )
 
+    @property
+    def config(self):
+        return self._config
+
+    @property
+    def conn(self):
+        """The (rate-limited, instrumented) EC2 connection; connects on first use.
+
+        A connection given to the constructor that's already a ThrottledConnection (e.g.,
+        one FleetMonitor shares between the pools in a region) is used as it is, so its
+        rate limits hold for all its users; its owner resets its retry budget.
+        """
+        if self._conn is None:
+            conn = self._conn_arg or connect(self._config['region_name'])
+            if isinstance(conn, ThrottledConnection):
+                self._conn = InstrumentedConnection(conn, self._metrics, pool=self.name)
+            else:
+                conn = InstrumentedConnection(conn, self._metrics, pool=self.name)
+                self._conn = self._throttle = ThrottledConnection(
+                    conn, self._config['ec2_rate'], self._config['ec2_burst'],
+                    rates=self._config['ec2_rates'], max_retries=self._config['ec2_max_retries'],
+                    budget=self._config['ec2_retry_budget'], registry=self._metrics, pool=self.name)
+        return self._conn
+
+    @property
+    def events(self):
+        """The EventLog of this monitor's structured events; its sinks include log."""
+        return self._events
+
+    @property
+    def index(self):
+        """The RequestIndex of this monitor's live requests; subscribe() to follow transitions."""
+        return self._index
+
+    @property
+    def log(self):
+        return self._log
+
+    @property
+    def metrics(self):
+        return self._metrics
+
+    @property
+    def name(self):
+        return self._config['pool_name'] or '{0}/{1}/{2}'.format(
+            self._config['region_name'], self._config['availability_zone'] or '*',
+            self._config['instance_type'])
+
     @classmethod
     def create(cls, key_pair_name, security_groups):
         if isinstance(security_groups, basestring):
@@ -135,109 +404,277 @@ class AwsSpotMonitor(object):
         dct['security_groups'] = security_groups
         return cls(dct)
 
-    def __init__(self, config=None, mail_config=None):
-        self._config = config if config else self.DEFAULT_CONFIG.copy()
-        self._conn = boto.ec2.connect_to_region(self._config['region_name'],
-            aws_access_key_id=os.environ['AWS_ACCESS_KEY_ID'],
-            aws_secret_access_key=os.environ['AWS_SECRET_ACCESS_KEY'])
-        self._last_checkpoint = None
-        self._log = CaptureLog(mail_config)
+    def __init__(self, config=None, mail_config=None, conn=None, metrics=None):
+        self._config = self.DEFAULT_CONFIG.copy()
+        if config:
+            self._config.update(config)
+        self._metrics = metrics if metrics is not None else REGISTRY
+        self._conn_arg = conn
+        self._conn = None
+        self._throttle = None
+        self._lost_at = None
+        self._journal = Journal(self._config['journal_path']) if self._config['journal_path'] else None
+        self._last_checkpoint = self._journal.checkpoint if self._journal else None
+        self._resuming = self._last_checkpoint is not None
+        self._log = CaptureLog(mail_config, max_bytes=self._config['capture_max_bytes'],
+                               spill_dir=self._config['capture_spill_dir'], level=self._config['log_level'])
+        self._events = EventLog([self._log])
+        if self._config['event_log_path']:
+            self._events.add_sink(JsonlSink(self._config['event_log_path'], self._config['event_log_level']))
+        self._prices = PriceHistory(self._config['price_history_path'],
+                                    window_days=self._config['price_window_days'],
+                                    refresh_secs=self._config['price_refresh_secs'])
+        self._placement = None
+        if self._config['multi_az']:
+            from .placement import PlacementOptimizer
+            self._placement = PlacementOptimizer(
+                self._prices, strategy=self._config['price_strategy'],
+                halflife=self._config['ewma_halflife_hours']*3600,
+                zones=self._config['availability_zones'], ttl=self._config['placement_ttl_secs'])
+        self._scheduler = PollScheduler()
+        self._noticed = {}
+        self._short = False
+        self._at_risk = 0
+        self._warm = {}         # warm replacement's request ID -> IDs of the instances it replaces
+        self._executor = None
+        self._instance_ids = None
+        self._index = RequestIndex()
+        self._index.subscribe(self._on_request_event)
+        self._unprocessed = set()
+        self._dirty = set()
+        self._untagged = {}     # submitted request ID -> {tag: value} still to be put
+        self._marked = set()    # requests tagged as processed, journaled once the tag is sent
+        self._hooks = None
+        if self._config['hook_workers']:
+            self._hooks = HookExecutor(lambda req: self.process_fulfilled(req), self._config['hook_workers'],
+                                       timeout=self._config['hook_timeout_secs'],
+                                       retries=self._config['hook_retries'],
+                                       retry_delay=self._config['hook_retry_secs'], on_done=self.wake)
         random.jumpahead(int(os.getpid()))
 
     def check_requests(self):
         """Reviews the status of all spot-instance requests.
 
-        For newly fulfilled requests, the process_fulfilled() method is called.
+        Requests are diffed against the last check (see RequestIndex), and only transitions
+        are logged. For newly fulfilled requests, the process_fulfilled() method is called,
+        on the hook workers (see hook_workers), and the request is tagged as processed once
+        it succeeds. Tags and cancellations are collected during the check and sent in bulk.
+
+        If there are fewer running spot instances than the configured target_capacity (an
+        instance marked for termination, or with an interruption notice, doesn't count), further
+        action is taken: requests that have gone into the holding state are canceled, and the
+        shortfall not covered by pending requests is submitted as one spot-request. With
+        warm_replacement configured, instances whose bid the market price is nearing are
+        replaced ahead of time, and the surplus is cancelled once capacity is restored.
+
+        :return: dict of requests, as returned by _bucket_requests().
+        """
+        self.conn    # connects, if need be, so an owned throttle can be reset
+        if self._throttle is not None:
+            self._throttle.new_cycle()
+        with self._timer('cycle'):
+            self._events.info('check', '-----\ncheck requests:', pool=self.name)
+            self._tag_submitted()
+            reqs, instances = self._fetch()
+
+            # process newly fulfilled requests, and mark those whose hooks have succeeded.
+            # without hook workers, a request stays unprocessed (and is retried next check)
+            # until process_fulfilled() returns.
+            batch = MutationBatch(self.conn)
+            with self._timer('fulfilled'):
+                for id in sorted(self._unprocessed):
+                    r = self._index.get(id)
+                    if r is not None and r.state() == Request.State.Fulfilled and \
+                            r.last_date is None and not self._is_processed(r):
+                        if self._hooks is not None:
+                            self._hooks.submit(id, r.req)
+                        else:
+                            self.process_fulfilled(r.req)
+                            self._mark_processed(r, batch)
+                    self._unprocessed.discard(id)
+                if self._hooks is not None:
+                    self._collect_hooks(batch)
+
+            # if not enough instances running, see if action is needed. note that a request
+            # that's marked for termination is treated as terminated.
+            if self._journal:
+                self._reconcile(instances)
+            running = len(instances)-len(reqs[Request.State.Marked])
+            running -= self._count_noticed(reqs, instances)
+            at_risk, prices = [], None
+            if self._config['warm_replacement']:
+                self._update_warm(reqs, instances)
+                prices = self._get_market_prices()
+                at_risk = self._get_at_risk(reqs, instances, prices, self._config['warm_price_margin'])
+            self._at_risk = len(at_risk)
+            self._short = running < self._config['target_capacity']
+            self._record(reqs, running)
+            if self._short:
+                if not self._log.capturing:
+                    self._log.start_capture()
+                self._events.warning('short', 'not enough running instances: {running} of {target}.',
+                                     running=running, target=self._config['target_capacity'])
+                with self._timer('submit'):
+                    price = 0
+                    for r in reqs[Request.State.Holding]:
+                        self._events.info('cancel', 'cancelling request: {id}, price={price}, status={status}',
+                                          id=r.req.id, price=r.req.price, status=r.req.status.code)
+                        price = max(price, r.req.price)
+                        batch.cancel(r.req.id)
+                        self._record_placement(r.req, held=True)
+                    self._flush(batch)
 
-        If there are too few running spot instances, further action is taken: requests that
-        have gone into the holding state are canceled, and if there are no pending requests a
-        new spot-request is submitted.
+                    # request whatever pending requests won't cover (and replacements for
+                    # instances at risk).
+                    shortfall = self._config['target_capacity'] + len(at_risk) - running - \
+                        len(reqs[Request.State.Pending])
+                    if shortfall > 0:
+                        self.request_instances(shortfall, price)
+            else:
+                if self._log.capturing:
+                    self._log.end_capture()
+                if at_risk:
+                    with self._timer('submit'):
+                        self._prebid(reqs, running, at_risk)
+                elif self._config['warm_replacement'] and not \
+                        self._get_at_risk(reqs, instances, prices, 2*self._config['warm_price_margin']):
+                    # only once the price is well clear of the bids, so a price hovering
+                    # near them doesn't start and stop replacements every check.
+                    self._cancel_surplus(reqs, running, batch)
+            self._flush(batch)
 
+        self._events.flush()
+        self._last_checkpoint = time.time()
+        if self._journal:
+            self._journal.commit(self._last_checkpoint)
+        if self._config['metrics_jsonl_path']:
+            self._metrics.dump_jsonl(self._config['metrics_jsonl_path'])
+        return reqs
+
+    def drain(self, timeout=None):
+        """Waits for in-flight process_fulfilled() calls, and tags and journals their requests.
+
+        For one-shot runs (e.g., 'awsspotmonitor once'): a hook still running when the
+        process exits would otherwise never be collected, so its request would be processed
+        again by the next run. Failed calls are retried as configured (see hook_retries).
+
+        :param timeout: the longest wait, in secs (default: None, until every call is done).
         :return: None
         """
-        self._log.write('-----\ncheck requests:')
-        # process newly fulfilled requests.
-        reqs = self._bucket_requests()
-        for r in reqs[Request.State.Fulfilled]:
-            if r.last_date is None:
-                self.process_fulfilled(r.req)
-                r.mark()
-
-        # if not enough instances running, see if action is needed. note that a request
-        # that's marked for termination is treated as terminated.
-        instances = self._get_active_instances()
-        if (len(instances)-len(reqs[Request.State.Marked])) < 1:
-            if not self._log.capturing:
-                self._log.start_capture()
-            self._log.write('not enough running instances.')
-            price = 0
-            for r in reqs[Request.State.Holding]:
-                self._log.write('cancelling request: {0}, price={1}, status={2}'
-                                .format(r.req.id, r.req.price, r.req.status))
-                price = max(price, r.req.price)
-                r.req.cancel()
-
-            # if no remaining active requests, submit one.
-            if not reqs[Request.State.Pending]:
-                self.request_instance(price)
-        elif self._log.capturing:
-            self._log.end_capture()
+        if self._hooks is None or not len(self._hooks):
+            return
+        deadline = time.time() + timeout if timeout is not None else None
+        batch = MutationBatch(self.conn)
+        while len(self._hooks):
+            remaining = deadline - time.time() if deadline is not None else None
+            if remaining is not None and remaining <= 0:
+                break
+            self._hooks.wait(remaining)
+            self._collect_hooks(batch)
+        self._flush(batch)
+        if self._journal:
+            self._journal.commit(self._last_checkpoint)
 
     def get_price_info(self, days=5):
         """Retrieves historic price information.
 
         Retrieves historic price information for the specified number of days, and returns
-        the low, high and average price.
+        the low, high and average price. Price history is cached, so only samples newer
+        than those already held are downloaded.
 
         :param days: the number of days to look back (default: 5).
         :return: tuple: (low, high, average) price
         """
-        start = datetime.now() - timedelta(days=days)
-        items = self._conn.get_spot_price_history(start_time=start.isoformat(),
-                                                  availability_zone=self._config['availability_zone'],
-                                                  instance_type=self._config['instance_type'],
-                                                  product_description=self._config['product_description'])
-        # compute stats.
-        high=0.0
-        low=10.0
-        sum=0.0
-        for item in items:
-            if item.price > high:
-                high = item.price
-            if item.price < low:
-                low = item.price
-            sum += item.price
-        avg = sum/len(items)
-        return (low, high, avg)
-
-    def loop(self, wait_secs=180):
+        return self._prices.get_price_info(self.conn,
+                                           self._config['availability_zone'],
+                                           self._config['instance_type'],
+                                           self._config['product_description'],
+                                           days=days)
+
+    def get_price_stats(self, days=5):
+        """Retrieves time-weighted historic price statistics.
+
+        Like get_price_info(), but returns time-weighted statistics: each price is weighted
+        by how long it was in effect.
+
+        :param days: the number of days to look back (default: 5).
+        :return: price_stats.PriceStats
+        """
+        self.get_price_info(days)
+        series = self._prices.series(self._config['availability_zone'],
+                                     self._config['instance_type'],
+                                     self._config['product_description'])
+        now = time.time()
+        since = now - days*24*3600
+        samples = series.since(since)
+        from .price_stats import compute_stats
+        return compute_stats(samples, now, halflife=self._config['ewma_halflife_hours']*3600)
+
+    def loop(self, wait_secs=180, min_wait_secs=10):
         """Periodically checks request status.
 
-        Simple loop that calls check_requests() then sleeps for a specific length of time.
+        Loop that calls check_requests() then sleeps. While requests are pending or holding,
+        an instance is marked for termination, or there are too few instances, checks occur
+        every min_wait_secs; otherwise the wait backs off exponentially to wait_secs. The
+        wait can be cut short with wake().
 
-        :param wait_secs: seconds to wait between checks (default: 60).
+        :param wait_secs: the longest wait between checks (default: 180).
+        :param min_wait_secs: the shortest wait between checks (default: 10).
         :return: None
         """
+        self._scheduler.min_secs = min_wait_secs
+        self._scheduler.max_secs = wait_secs
+        if self._config['metrics_port']:
+            from .metrics import serve_metrics
+            serve_metrics(self._metrics, self._config['metrics_port'])
+        if self._config['notice_port']:
+            from .notices import serve_notices
+            serve_notices(self.notice, self._config['notice_port'], self._config['notice_host'],
+                          self._config['notice_token'])
+        from boto.exception import EC2ResponseError
         while True:
             try:
-                self.check_requests()
-                time.sleep(wait_secs)
+                try:
+                    busy = self._is_busy(self.check_requests())
+                except EC2ResponseError as e:
+                    # e.g., throttled beyond the retry budget: that ends the check, not the
+                    # monitor. a shortfall stays noted, and the next check is backed off.
+                    self._events.exception('check_failed', 'check failed: {code} ({kind})',
+                                           code=e.error_code, kind=classify(e))
+                    self._metrics.inc('awsspotmonitor_check_failures_total', pool=self.name)
+                    busy = False
+                self._scheduler.sleep(self._scheduler.next_delay(busy))
             except KeyboardInterrupt:
                 print('...got CTRL+C; exiting loop')
                 break
 
+    def notice(self, instance_id, action=None, when=None):
+        """Records an interruption notice for an instance, and wakes loop() to replace it.
+
+        Notices for instances this monitor doesn't own are ignored at the next check.
+
+        :param instance_id: the instance ID.
+        :param action: the interruption action, e.g., 'terminate' (default: None).
+        :param when: the interruption time, as given by the instance metadata (default: None).
+        :return: None
+        """
+        self._noticed[instance_id] = [action, when, False]
+        self.wake()
+
     def process_fulfilled(self, req):
         """Process a newly fulfilled instance.
 
         Processes an EC2 instance created as a result of a newly fulfilled spot-instance request.
         This method is intended to be overridden by derived classes, but those implementations
-        MUST ALSO call the base class implementation.
+        MUST ALSO call the base class implementation. With hook_workers configured, it's called
+        on a worker thread, and may be called again (see hook_retries) if it raises or runs
+        for longer than hook_timeout_secs.
 
         :param req: boto.ec2.spotinstancerequest
         :return: None
         """
-        self._log.write('FULFILLED {req.id}: instance-id={req.instance_id}, price={req.price}'
-                        .format(**locals()))
+        self._events.info('fulfilled', 'FULFILLED {id}: instance-id={instance_id}, price={price}',
+                          id=req.id, instance_id=req.instance_id, price=req.price)
         pass
 
     def request_instance(self, recent_price=0):
@@ -249,29 +686,55 @@ class AwsSpotMonitor(object):
         :param recent_price: a recent price that was not fulfilled (default: 0).
         :return: the submitted request.
         """
-        while True:
-            price = self._get_price(recent_price)
-            try:
-                request = self._conn.request_spot_instances(
-                    price, type='one-time',
-                    image_id=self._config['ami_id'], key_name=self._config['key_pair_name'],
-                    security_groups=self._config['security_groups'],
-                    instance_type=self._config['instance_type'])
-                request = request[0] if request else None
-                if request:
-                    self._log.write('submitted request: {0}, price={1}, state={2}'
-                                    .format(request.id, price, request.state))
-                return request
-            except EC2ResponseError:
-                # can occur when the bid is too low.
-                traceback.print_exc(file=self._log.file())
-                recent_price = price
+        requests = self.request_instances(1, recent_price)
+        return requests[0] if requests else None
+
+    def request_instances(self, count, recent_price=0):
+        """Submits new spot-instance requests for count instances.
+
+        All instances are requested in a single call, using the configuration information
+        given to the constructor, and an updated price. With multi_az configured, the call
+        goes to the best-ranked availability zone, falling back to the next on error.
+
+        A call that fails because the bid is too low or the zone has no capacity is retried
+        with a higher bid, for up to submit_attempts passes over the zones; then the
+        shortfall is left to the next check. Other errors (including throttling that the
+        connection's retries couldn't absorb) are raised.
+
+        :param count: the number of instances to request.
+        :param recent_price: a recent price that was not fulfilled (default: 0).
+        :return: list of the submitted requests (empty if every attempt failed).
+        """
+        from boto.exception import EC2ResponseError
+        for _ in range(self._config['submit_attempts']):
+            for zone, price in self._placements(recent_price):
+                try:
+                    return self._submit(count, price, zone)
+                except EC2ResponseError as e:
+                    if classify(e) != 'actionable':
+                        raise
+                    self._events.warning('submit_failed', 'request failed: {code}, price={price}, zone={zone}',
+                                         code=e.error_code, price=price, zone=zone)
+                    self._metrics.inc('awsspotmonitor_request_retries_total', pool=self.name)
+                    if self._placement:
+                        self._placement.record(zone, held=True)
+                    recent_price = max(recent_price, price)
+        self._events.error('submit_gave_up', 'no request submitted after {attempts} attempts; recent: {price}',
+                           attempts=self._config['submit_attempts'], price=recent_price)
+        return []
+
+    def wake(self):
+        """Makes loop() check requests now, rather than at the end of its current wait."""
+        self._scheduler.wake()
 
     def _bucket_requests(self):
         """Returns spot-instance requests bucketed by Request.State.
 
         Returns a dict where keys are Request.State values, and each value is a list
-        of Request objects (which might be empty).
+        of Request objects (which might be empty). Only live requests (see
+        Request.LIVE_STATUS_CODES) owned by this monitor are fetched, so the Dead and
+        Terminated buckets are normally empty. The requests are kept in the RequestIndex,
+        whose events are logged by _on_request_event().
 
         :return: dict
         """
@@ -284,70 +747,257 @@ class AwsSpotMonitor(object):
             Request.State.Marked: []
         }
 
-        spots = self._conn.get_all_spot_instance_requests()
-        for req in [Request(r) for r in spots]:
+        spots = get_spot_requests(self.conn, status_codes=Request.LIVE_STATUS_CODES,
+                                  tag=self._config['monitor_tag'])
+        self._index.update(spots)
+        for req in self._index:
             requests[req.state()].append(req)
-            if req.state() not in (Request.State.Dead, Request.State.Terminated):
-                self._log.write('request {0}: state={1}, status={2}, price={3}'
-                                .format(req.req.id, req.req.state, req.req.status.code, req.req.price))
-
-        self._log.write('dead: {0} / terminated: {1} / pending: {2} / holding: {3} / fulfilled: {4}'
-                        .format(len(requests[Request.State.Dead]),
-                                len(requests[Request.State.Terminated]),
-                                len(requests[Request.State.Pending]),
-                                len(requests[Request.State.Holding]),
-                                len(requests[Request.State.Fulfilled])
-        ))
+
+        self._events.debug('buckets', 'dead: {dead} / terminated: {terminated} / pending: {pending} / '
+                                      'holding: {holding} / fulfilled: {fulfilled}',
+                           dead=len(requests[Request.State.Dead]),
+                           terminated=len(requests[Request.State.Terminated]),
+                           pending=len(requests[Request.State.Pending]),
+                           holding=len(requests[Request.State.Holding]),
+                           fulfilled=len(requests[Request.State.Fulfilled]))
 
         return requests
 
+    def _cancel_surplus(self, reqs, running, batch):
+        """Cancels requests beyond target_capacity, once capacity is restored (warm replacement).
+
+        Holding requests go first, then pending ones, then fulfilled replacements requested
+        by _prebid(), whose instances are terminated. Other instances are never terminated.
+        """
+        surplus = running + len(reqs[Request.State.Pending]) + len(reqs[Request.State.Holding]) - \
+            self._config['target_capacity']
+        if surplus <= 0:
+            return
+        candidates = reqs[Request.State.Holding] + reqs[Request.State.Pending] + \
+            [r for r in reqs[Request.State.Fulfilled] if r.req.id in self._warm]
+        terminate = []
+        for r in candidates[:surplus]:
+            self._events.info('surplus', 'cancelling surplus request: {id}, status={status}, instance={instance_id}',
+                              id=r.req.id, status=r.req.status.code, instance_id=r.req.instance_id)
+            batch.cancel(r.req.id)
+            self._warm.pop(r.req.id, None)
+            if r.state() == Request.State.Fulfilled and r.req.instance_id:
+                terminate.append(r.req.instance_id)
+        if terminate:
+            self.conn.terminate_instances(terminate)
+
+    def _collect_hooks(self, batch):
+        """Marks the requests whose process_fulfilled() calls have succeeded, and logs failures."""
+        succeeded, retrying, failed = self._hooks.poll()
+        for id in succeeded:
+            r = self._index.get(id)
+            if r is not None:
+                self._mark_processed(r, batch)
+        for id, error in retrying:
+            self._events.warning('hook_retry', 'process_fulfilled failed for {id}, will retry: {error!r}',
+                                 id=id, error=error)
+        for id, error in failed:
+            self._events.error('hook_failed', 'process_fulfilled failed for {id}, giving up: {error!r}',
+                               id=id, error=error)
+            self._metrics.inc('awsspotmonitor_hook_failures_total', pool=self.name)
+
+    def _count_noticed(self, reqs, instances):
+        """Returns how many running instances have an interruption notice but aren't marked.
+
+        Notices for instances that are gone (or were never this monitor's) are dropped.
+        """
+        if not self._noticed:
+            return 0
+        live = set(i.id for i in instances)
+        marked = set(r.req.instance_id for r in reqs[Request.State.Marked])
+        count = 0
+        for id, notice in list(self._noticed.items()):
+            if id not in live:
+                del self._noticed[id]
+            elif id not in marked:
+                if not notice[2]:
+                    notice[2] = True
+                    self._events.warning('notice', 'interruption notice: {instance_id}, action={action}, time={time}',
+                                         instance_id=id, action=notice[0], time=notice[1])
+                    self._metrics.inc('awsspotmonitor_notices_total', pool=self.name)
+                count += 1
+        return count
+
+    def _fetch(self):
+        """Fetches this check's requests and instances, and warms the price history.
+
+        The reads are independent, so they run in parallel: the requests, the instances by
+        the IDs seen last check (or in the journal), and, when a shortfall is likely (or
+        turns out to be once the requests arrive) or warm_replacement is configured, prices,
+        so they're at hand if a replacement is submitted. Instances are looked up again only if the requests name
+        instances that weren't prefetched. A failed price fetch is logged, and retried when
+        the price is needed.
+
+        :return: tuple: (requests, as returned by _bucket_requests(), active instances)
+        """
+        if not self._config['fetch_workers']:
+            with self._timer('buckets'):
+                reqs = self._bucket_requests()
+            with self._timer('instances'):
+                instances = self._get_active_instances(reqs)
+            self._instance_ids = self._get_instance_ids(reqs)
+            return reqs, instances
+
+        if self._executor is None:
+            from concurrent.futures import ThreadPoolExecutor
+            self._executor = ThreadPoolExecutor(max_workers=self._config['fetch_workers'])
+        submit = self._executor.submit
+
+        known = self._instance_ids
+        if known is None and self._journal:
+            known = list(self._journal.instances)
+        buckets = submit(self._timed, 'buckets', self._bucket_requests)
+        prefetched = submit(self._timed, 'instances', get_spot_instances, self.conn, known) \
+            if known else None
+        prices = submit(self._timed, 'price', self._warm_prices) \
+            if self._is_short_likely() or self._config['warm_replacement'] else None
+
+        reqs = buckets.result()
+        ids = self._get_instance_ids(reqs)
+        if prices is None and self._is_short_likely(reqs):
+            prices = submit(self._timed, 'price', self._warm_prices)
+
+        instances = None
+        if prefetched is not None and set(ids) <= set(known):
+            try:
+                wanted = set(ids)
+                instances = [i for i in prefetched.result() if i.id in wanted]
+            except Exception:
+                self._events.exception('fetch_failed', 'prefetching instances failed')
+        if instances is None:
+            with self._timer('instances'):
+                instances = get_spot_instances(self.conn, ids)
+        self._instance_ids = ids
+
+        if prices is not None:
+            try:
+                prices.result()
+            except Exception:
+                self._events.exception('fetch_failed', 'warming prices failed')
+        return reqs, instances
+
+    def _flush(self, batch):
+        """Sends a MutationBatch, logging any per-ID failures.
+
+        A request whose update failed is looked at again next check: e.g., a fulfilled
+        request whose processed tag wasn't written. Processed requests are journaled only
+        once their tag has been sent.
+        """
+        if not len(batch):
+            return
+        failures = batch.flush()
+        for id, error in failures.items():
+            self._events.error('update_failed', 'update failed for {id}: {error}', id=id, error=error)
+            self._unprocessed.add(id)
+        if self._journal:
+            for id in sorted(self._marked.difference(failures)):
+                self._journal.record_processed(id)
+        self._marked.clear()
+
     def _get_price(self, recent_price=0):
         """Suggests a new spot-instance bid price.
 
         Uses the price-strategy supplied to the constructor, and an optional recent price,
         to select and suggest a new spot-instance bid price. Pricing intends for requests
         to be fulfilled, but may take a few iterations. The 'high' and 'average-high'
-        price strategies should have the best chance of fulfillment.
+        price strategies should have the best chance of fulfillment. The percentile and
+        'ewma' strategies bid the corresponding time-weighted statistic, and 'ewma-high'
+        bids two standard deviations above the EWMA, capped at the high.
 
         :param recent_price: a recent bid price that was not fulfilled (default: 0).
         :return: suggested bid price.
         """
-        low, high, avg = self.get_price_info()
-        factor = 1.05
+        from .price_stats import STATS_STRATEGIES, strategy_price
         strategy = self._config['price_strategy']
-        if strategy == 'high':
-            price = max(high, recent_price*factor)
-        elif strategy == 'random':
-            l = max(low, recent_price*factor)
-            h = max(high, recent_price*factor)
-            price = l + abs(h-l)*random.random()
-        elif strategy == 'average-high':
-            a = max(avg, recent_price*factor)
-            price = a + abs(high-a)/2
-        else:
-            # strategy == 'average'
-            price = max(avg, recent_price*factor)
+        stats = None
+        with self._timer('price'):
+            if strategy in STATS_STRATEGIES:
+                stats = self.get_price_stats()
+                low, high, avg = stats.low, stats.high, stats.mean
+            else:
+                low, high, avg = self.get_price_info()
+        price = strategy_price(strategy, low, high, avg, stats, recent_price)
 
-        self._log.write('price: {price}; recent: {recent_price}, (l,a,h)={low}, {avg}, {high} ({strategy})'
-                        .format(**locals()))
+        self._events.info('price', 'price: {price}; recent: {recent_price}, (l,a,h)={low}, {avg}, {high} ({strategy})',
+                          price=price, recent_price=recent_price, low=low, avg=avg, high=high, strategy=strategy)
         return price
 
-    def _get_active_instances(self):
+    def _get_active_instances(self, reqs=None):
         """Returns a list of EC2 instances created via a spot-instance request.
 
         The returned list of instances all have an associated spot_instance_request_id, and
-        are not in the 'terminated' or 'shutting-down' state.
+        are not in the 'terminated' or 'shutting-down' state. If bucketed requests are given,
+        only the instances of fulfilled and marked requests are looked up.
 
+        :param reqs: optional dict of requests, as returned by _bucket_requests().
         :return: list of instances (may be empty).
         """
-        result = self._conn.get_all_instances()
-        lst = []
-        for reservation in result:
-            for instance in reservation.instances:
-                if instance.state not in ('terminated', 'shutting-down') and\
-                   instance.spot_instance_request_id:
-                    lst.append(instance)
-        return lst
+        return get_spot_instances(self.conn, self._get_instance_ids(reqs) if reqs is not None else None)
+
+    def _get_at_risk(self, reqs, instances, prices, margin):
+        """Returns the fulfilled requests whose bid the market price in their zone is nearing.
+
+        Marked and noticed instances are left out, as they're already counted as lost, and
+        so are warm replacements while the instances they replace are running.
+
+        :param prices: {zone: price}, as returned by _get_market_prices().
+        :param margin: a request is at risk if the price is within this fraction of its bid.
+        :return: list of Requests.
+        """
+        if not prices:
+            return []
+        from .placement import request_zone
+        live = set(i.id for i in instances)
+        margin = 1 - margin
+        at_risk = []
+        for r in reqs[Request.State.Fulfilled]:
+            id = r.req.instance_id
+            if id not in live or id in self._noticed or r.req.id in self._warm:
+                continue
+            price = prices.get(request_zone(r.req) or self._config['availability_zone'])
+            if price is not None and price >= float(r.req.price)*margin:
+                at_risk.append(r)
+        return at_risk
+
+    def _get_instance_ids(self, reqs):
+        """Returns the instance IDs of fulfilled and marked requests."""
+        return [r.req.instance_id
+                for r in reqs[Request.State.Fulfilled] + reqs[Request.State.Marked]
+                if r.req.instance_id]
+
+    def _get_market_prices(self):
+        """Returns {zone: latest spot price} from the price history, brought up to date."""
+        try:
+            self._warm_prices()
+        except Exception:
+            self._events.exception('price_failed', 'updating prices failed')
+            return {}
+        zone = None if self._placement else self._config['availability_zone']
+        series = self._prices.series(zone, self._config['instance_type'], self._config['product_description'])
+        prices = {}
+        for sample in reversed(series.samples):
+            prices.setdefault(sample[2], sample[1])
+        return prices
+
+    def _get_placement_price(self, recent_price=0):
+        """Returns [(zone, price)] for the ranked availability zones, best first."""
+        with self._timer('price'):
+            ranking = self._placement.rank(self.conn, self._config['instance_type'],
+                                           self._config['product_description'],
+                                           recent_price=recent_price)
+        if not ranking:
+            raise ValueError('no price history for {0}/{1}'.format(
+                self._config['instance_type'], self._config['product_description']))
+        if self._events.enabled(INFO):
+            self._events.info('placement', 'placement: {ranking}; recent: {recent_price} ({strategy})',
+                              ranking=', '.join('{0}={1:.4f}/{2:.4f}'.format(*p) for p in ranking),
+                              recent_price=recent_price, strategy=self._config['price_strategy'])
+        return [(p.zone, p.price) for p in ranking]
 
     def _get_single_instance(self, id):
         """Returns a single EC2 instance.
@@ -357,5 +1007,203 @@ class AwsSpotMonitor(object):
         :param id: specifies the instance ID.
         :return: the instance object, or None.
         """
-        r = self._conn.get_all_instances(id)
+        r = self.conn.get_all_instances(id)
         return r[0].instances[0] if r and r[0].instances else None
+
+    def _is_busy(self, reqs):
+        """Returns True if the last check found anything in flux, or hooks are in progress."""
+        return bool(self._short or self._noticed or self._at_risk or
+                    (self._hooks is not None and len(self._hooks)) or
+                    reqs[Request.State.Pending] or
+                    reqs[Request.State.Holding] or
+                    reqs[Request.State.Marked])
+
+    def _is_processed(self, r):
+        """Returns True if the journal says a request was processed, even if it isn't tagged."""
+        return bool(self._journal and self._journal.is_processed(r.req.id))
+
+    def _is_short_likely(self, reqs=None):
+        """Returns True if this check will likely find too few instances, so prices will be needed.
+
+        Before the requests arrive, that's when the last check was short, an instance has
+        an interruption notice, or there was no last check; after, it's when the fulfilled
+        and pending requests can't cover the target, or a request is holding or marked.
+        """
+        if reqs is None:
+            return bool(self._short or self._noticed or self._instance_ids is None)
+        return bool(len(reqs[Request.State.Fulfilled]) + len(reqs[Request.State.Pending]) <
+                    self._config['target_capacity'] or
+                    reqs[Request.State.Holding] or
+                    reqs[Request.State.Marked])
+
+    def _mark_processed(self, r, batch):
+        """Tags a request whose process_fulfilled() has succeeded; it's journaled by _flush()."""
+        self._events.info('mark', 'marking {id} with {date}', id=r.req.id, date=r.mark(batch))
+        self._record_placement(r.req, held=False)
+        self._marked.add(r.req.id)
+
+    def _on_request_event(self, event):
+        """Logs a request transition, and notes the requests to process and journal."""
+        r = event.request
+        if event.kind == 'new':
+            self._events.info('request_new', 'request {id}: new, state={state}, status={status}, price={price}',
+                              id=event.request_id, state=r.req.state, status=r.req.status.code, price=r.req.price)
+        elif event.kind == 'changed':
+            self._events.info('request_changed', 'request {id}: status {previous} -> {status}, price={price}',
+                              id=event.request_id, previous=event.previous[0], status=r.req.status.code,
+                              price=r.req.price)
+        else:
+            self._events.info('request_gone', 'request {id}: gone, last status={previous}',
+                              id=event.request_id, previous=event.previous[0])
+
+        if event.kind != 'gone' and r.state() == Request.State.Fulfilled:
+            self._unprocessed.add(event.request_id)
+        elif event.kind == 'gone':
+            self._unprocessed.discard(event.request_id)
+        if self._journal:
+            self._dirty.add(event.request_id)
+
+    def _placements(self, recent_price=0):
+        """Returns [(zone, price)] to try in order: the ranked zones, or the configured one."""
+        if self._placement:
+            return self._get_placement_price(recent_price)
+        return [(self._config['availability_zone'], self._get_price(recent_price))]
+
+    def _prebid(self, reqs, running, at_risk):
+        """Requests replacements for instances at risk, beyond what pending requests cover."""
+        shortfall = self._config['target_capacity'] + len(at_risk) - running - len(reqs[Request.State.Pending])
+        if shortfall <= 0:
+            return
+        self._events.info('prebid', 'requesting {count} warm replacement(s) for: {ids}', count=shortfall,
+                          ids=', '.join(r.req.instance_id for r in at_risk))
+        price = max(float(r.req.price) for r in at_risk)
+        replaces = [r.req.instance_id for r in at_risk]
+        for request in self.request_instances(shortfall, price):
+            self._warm[request.id] = replaces
+            self._untagged.setdefault(request.id, {})[Request.WARM_TAG] = ' '.join(replaces)
+        self._tag_submitted()
+
+    def _reconcile(self, instances):
+        """Applies this check's request transitions and instances to the journal.
+
+        Only changes are written. Requests that are no longer live are forgotten. On the
+        first check after a restart every request is new to the index, so the journal is
+        compared with all of them, and the differences are logged, as they happened while
+        the monitor was down.
+        """
+        changed = 0
+        gone = 0
+        for id in self._dirty:
+            r = self._index.get(id)
+            if r is None:
+                self._journal.forget(id)
+                continue
+            previous = self._journal.record_request(id, r.req.status.code, r.req.instance_id, r.req.price)
+            if previous is None or previous['code'] != r.req.status.code:
+                changed += 1
+        self._dirty.clear()
+        for instance in instances:
+            self._journal.record_instance(instance.id, instance.state)
+
+        if self._resuming:
+            stale = [id for id in self._journal.requests if id not in self._index]
+            for id in stale:
+                self._journal.forget(id)
+            gone = len(stale)
+            self._resuming = False
+            self._events.info('resumed', 'resumed from journal of {checkpoint} UTC: {changed} requests new '
+                                         'or changed, {gone} gone',
+                              checkpoint=datetime.utcfromtimestamp(self._last_checkpoint).isoformat(),
+                              changed=changed, gone=gone)
+
+    def _record(self, reqs, running):
+        """Records bucket sizes and capacity, and times replacement of lost capacity."""
+        for state, name in zip(Request.State, Request.State._fields):
+            self._metrics.set('awsspotmonitor_requests', len(reqs[state]), state=name, pool=self.name)
+        self._metrics.set('awsspotmonitor_instances', running, pool=self.name)
+        now = time.time()
+        if self._short and self._lost_at is None:
+            self._lost_at = now
+        elif not self._short and self._lost_at is not None:
+            self._metrics.observe('awsspotmonitor_replacement_seconds', now - self._lost_at,
+                                  buckets=(30, 60, 120, 300, 600, 1200, 1800, 3600, 7200),
+                                  pool=self.name)
+            self._lost_at = None
+
+    def _record_placement(self, req, held):
+        """Records whether a request was left holding or fulfilled, for multi-AZ placement."""
+        if self._placement:
+            from .placement import request_zone
+            self._placement.record(request_zone(req), held)
+
+    def _submit(self, count, price, zone=None):
+        """Submits one spot-instance request for count instances, tagging it if configured."""
+        requests = self.conn.request_spot_instances(
+            price, count=count, type='one-time',
+            image_id=self._config['ami_id'], key_name=self._config['key_pair_name'],
+            security_groups=self._config['security_groups'],
+            instance_type=self._config['instance_type'], placement=zone)
+        requests = requests or []
+        if requests and self._config['monitor_tag']:
+            key, value = self._config['monitor_tag']
+            for r in requests:
+                self._untagged.setdefault(r.id, {})[key] = value
+            self._tag_submitted()
+        for request in requests:
+            self._events.info('submitted', 'submitted request: {id}, price={price}, zone={zone}, state={state}',
+                              id=request.id, price=price, zone=zone, state=request.state)
+        return requests
+
+    def _tag_submitted(self):
+        """Puts the monitor tag and WARM_TAG on submitted requests; failed tags are retried next check.
+
+        Until it's tagged, a request is invisible to the monitor, which would submit another
+        in its place. A request just submitted may not be visible to create_tags() yet, as
+        EC2 is eventually consistent, so a failure here mustn't fail the submission.
+        """
+        if not self._untagged:
+            return
+        batch = MutationBatch(self.conn)
+        for id, tags in sorted(self._untagged.items()):
+            for key, value in tags.items():
+                batch.tag(id, key, value)
+        failures = batch.flush()
+        for id, error in failures.items():
+            self._events.warning('tag_failed', 'tagging request {id} failed, will retry: {error}',
+                                 id=id, error=error)
+        for id in list(self._untagged):
+            if id not in failures:
+                del self._untagged[id]
+
+    def _timed(self, phase, fn, *args):
+        """Calls fn(*args) under a phase timer, e.g., on a fetch thread."""
+        with self._timer(phase):
+            return fn(*args)
+
+    def _timer(self, phase):
+        return self._metrics.timer('awsspotmonitor_phase_seconds', phase=phase, pool=self.name)
+
+    def _update_warm(self, reqs, instances):
+        """Brings the warm replacements up to date with this check's requests and instances.
+
+        Replacements are read back from their WARM_TAG, so they survive a restart. Once none
+        of the instances a replacement replaces is running (i.e., all are gone, marked or
+        noticed), it's ordinary capacity: watched for risk, and never cancelled as surplus.
+        """
+        for r in reqs[Request.State.Pending] + reqs[Request.State.Holding] + reqs[Request.State.Fulfilled]:
+            replaces = r.req.tags.get(Request.WARM_TAG)
+            if replaces and r.req.id not in self._warm:
+                self._warm[r.req.id] = replaces.split()
+        lost = set(self._noticed).union(r.req.instance_id for r in reqs[Request.State.Marked])
+        running = set(i.id for i in instances) - lost
+        for id, replaces in list(self._warm.items()):
+            if running.isdisjoint(replaces):
+                del self._warm[id]
+
+    def _warm_prices(self):
+        """Brings the price history for the next bid up to date."""
+        if self._placement:
+            self._placement.rank(self.conn, self._config['instance_type'],
+                                 self._config['product_description'])
+        else:
+            self.get_price_info()
@@ -0,0 +1,107 @@
+from __future__ import absolute_import
+
+# standard
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+# pypi
+import numpy as np
+
+# package
+from .backtest import *
+
+
+HOUR = 3600.0
+
+
+class LoadHistory_test(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir)
+
+    def write(self, name, text):
+        path = os.path.join(self.tmpdir, name)
+        with open(path, 'w') as f:
+            f.write(text)
+        return path
+
+    def test_csv(self):
+        path = self.write('history.csv',
+            'Timestamp,SpotPrice,AvailabilityZone,InstanceType,ProductDescription\n'
+            '2013-08-12T19:00:00.000Z,0.03,us-east-1a,m1.small,Linux/UNIX\n'
+            '2013-08-12T18:00:00.000Z,0.02,us-east-1a,m1.small,Linux/UNIX\n'
+            '2013-08-12T18:00:00.000Z,0.05,us-east-1b,m1.small,Linux/UNIX\n'
+            '2013-08-12T18:00:00.000Z,0.09,us-east-1a,m1.large,Linux/UNIX\n')
+        history = load_history(path, instance_type='m1.small')
+        self.assertEqual(sorted(history), ['us-east-1a', 'us-east-1b'])
+        times, prices = history['us-east-1a']
+        self.assertEqual(list(times), [1376330400.0, 1376334000.0])
+        self.assertEqual(list(prices), [0.02, 0.03])
+
+    def test_jsonl(self):
+        path = self.write('history.jsonl', '\n'.join(json.dumps(r) for r in (
+            dict(timestamp=1000, price='0.02', availability_zone='us-east-1a'),
+            dict(timestamp=2000, price='0.04', availability_zone='us-east-1b'))))
+        history = load_history(path, availability_zone='us-east-1b')
+        self.assertEqual(list(history), ['us-east-1b'])
+        self.assertEqual(list(history['us-east-1b'][1]), [0.04])
+
+
+class Backtest_test(unittest.TestCase):
+    def setUp(self):
+        # hourly samples for three days: 0.02, except 0.10 for hour 50.
+        self.times = np.arange(73)*HOUR
+        self.prices = np.full(73, 0.02)
+        self.prices[50] = 0.10
+        self.backtest = Backtest(self.times, self.prices)
+
+    def run_one(self, strategy):
+        result, = self.backtest.run([strategy], days=[1])
+        return result
+
+    def test_high(self):
+        # interrupted at hour 50, and replaced at once by bidding the new high.
+        result = self.run_one('high')
+        self.assertEqual((result['fills'], result['interruptions'], result['bids']), (2, 1, 2))
+        self.assertEqual(result['max_latency_secs'], 0)
+        self.assertAlmostEqual(result['hours'], 48)
+        self.assertAlmostEqual(result['cost'], 47*0.02 + 0.10)
+        self.assertAlmostEqual(result['availability'], 1.0)
+
+    def test_average(self):
+        # the average bid holds (and is raised every check) until the price falls at hour 51.
+        result = self.run_one('average')
+        self.assertEqual((result['fills'], result['interruptions']), (2, 1))
+        self.assertEqual(result['max_latency_secs'], HOUR)
+        self.assertEqual(result['bids'], 1 + HOUR/180)
+        self.assertAlmostEqual(result['cost'], 47*0.02)
+        self.assertAlmostEqual(result['interruption_rate'], 0.5)
+
+    def test_matches_first_passage(self):
+        rng = np.random.RandomState(1)
+        prices = rng.uniform(0.01, 0.05, 1000)
+        backtest = Backtest(np.arange(1000.0), prices)
+        start = rng.randint(0, 1000, 200)
+        bid = rng.uniform(0.01, 0.05, 200)
+        for below in (True, False):
+            found = backtest._first(start, bid, below)
+            for s, b, j in zip(start, bid, found):
+                crossed = np.flatnonzero(prices[s:] <= b if below else prices[s:] > b)
+                self.assertEqual(j, s + crossed[0] if len(crossed) else 1000)
+
+    def test_sweep(self):
+        results = self.backtest.run(days=[1, 2], factors=[1.05, 1.2])
+        self.assertEqual(len(results), len(BACKTEST_STRATEGIES)*4)
+        for result in results:
+            self.assertLessEqual(result['availability'], 1.0)
+
+    def test_stats_strategies_rejected(self):
+        with self.assertRaises(ValueError):
+            self.backtest.run(['p90'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,50 @@
+from __future__ import absolute_import
+
+# standard
+import unittest
+
+# package
+from .batch import *
+from .fake_ec2 import FakeEC2Connection
+
+
+class MutationBatch_test(unittest.TestCase):
+    def setUp(self):
+        self.conn = FakeEC2Connection(volatility=0, seed=1)
+        self.reqs = self.conn.request_spot_instances(0.05, 'ami-1', count=5)
+        self.ids = [r.id for r in self.reqs]
+
+    def test_bulk_calls(self):
+        batch = MutationBatch(self.conn, chunk_size=2)
+        for id in self.ids:
+            batch.tag(id, 'req_date', '2013-01-01T00:00:00')
+            batch.cancel(id)
+        self.assertEqual(batch.flush(), {})
+        self.assertEqual(self.conn.calls['create_tags'], 3)
+        self.assertEqual(self.conn.calls['cancel_spot_instance_requests'], 3)
+        for req in self.conn.requests.values():
+            self.assertEqual(req.state, 'cancelled')
+            self.assertEqual(req.tags['req_date'], '2013-01-01T00:00:00')
+        self.assertEqual(len(batch), 0)
+
+    def test_partial_failure(self):
+        batch = MutationBatch(self.conn)
+        for id in self.ids[:2] + ['sir-bogus']:
+            batch.cancel(id)
+        failures = batch.flush()
+        self.assertEqual(list(failures), ['sir-bogus'])
+        self.assertTrue(failures['sir-bogus'].startswith('InvalidSpotInstanceRequestID.NotFound'))
+        self.assertEqual([r.state for r in self.conn.requests.values()][:3],
+                         ['cancelled', 'cancelled', 'open'])
+
+    def test_throttled_chunk_not_split(self):
+        batch = MutationBatch(self.conn)
+        for id in self.ids:
+            batch.tag(id, 'a', 'b')
+        self.conn.throttle_rate = 1.0
+        self.assertEqual(sorted(batch.flush()), sorted(self.ids))
+        self.assertEqual(self.conn.calls['create_tags'], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
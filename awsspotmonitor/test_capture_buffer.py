@@ -0,0 +1,50 @@
+from __future__ import absolute_import
+
+# standard
+import gzip
+import os
+import shutil
+from StringIO import StringIO
+import tempfile
+import unittest
+
+# package
+from .capture_buffer import *
+
+
+class CaptureBuffer_test(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir)
+
+    def test_small_capture_in_memory(self):
+        buf = CaptureBuffer(max_bytes=1024, spill_dir=self.tmpdir)
+        buf.write('hello\n')
+        buf.close()
+        self.assertFalse(buf.spilled)
+        self.assertEqual(buf.excerpt(), 'hello\n')
+        self.assertEqual(os.listdir(self.tmpdir), [])
+
+    def test_spill(self):
+        buf = CaptureBuffer(max_bytes=400, spill_dir=self.tmpdir)
+        lines = ['line {0:04d}\n'.format(i) for i in range(1000)]
+        for line in lines:
+            buf.write(line)
+        buf.close()
+
+        self.assertTrue(buf.spilled)
+        self.assertEqual(len(os.listdir(self.tmpdir)), 1)
+        self.assertEqual((buf.lines, buf.bytes), (1000, 10000))
+        excerpt = buf.excerpt()
+        self.assertTrue(excerpt.startswith('line 0000\n'))
+        self.assertTrue(excerpt.endswith('line 0999\n'))
+        self.assertIn('lines, ', excerpt)
+        self.assertLess(len(excerpt), 500)
+
+        text = gzip.GzipFile(fileobj=StringIO(buf.compressed())).read()
+        self.assertEqual(text, ''.join(lines))
+        self.assertEqual(os.listdir(self.tmpdir), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
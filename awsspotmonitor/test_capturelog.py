@@ -1,7 +1,7 @@
 from __future__ import absolute_import
 
 # standard
-from mock import patch
+from mock import Mock
 import unittest
 
 # package
@@ -16,16 +16,30 @@ class CaptureLog_test(unittest.TestCase):
             recipients = ['borick@gmail.com', 'waxkinetic@gmail.com']
         )
 
-        log = CaptureLog(mail_config)
-        with patch('awsspotmonitor.capturelog.send_plaintext_msg') as send_msg:
-            log.start_capture()
-            log.write('first message')
-            log.write('second message')
-            log.end_capture()
-            send_msg.assert_called_once()
-            args, _ = send_msg.call_args
-            self.assertEqual(args[1], 'Rick <waxkinetic@gmail.com>')
-            self.assertEqual(args[2], mail_config['recipients'])
+        mailer = Mock()
+        log = CaptureLog(mail_config, mailer=mailer)
+        log.start_capture()
+        log.write('first message')
+        log.write('second message')
+        log.end_capture()
+        self.assertEqual(mailer.send.call_count, 2)
+        args, _ = mailer.send.call_args
+        self.assertEqual(args[:3], ('email subject', mail_config['sender'], mail_config['recipients']))
+        self.assertIn('first message\nsecond message\n', args[3])
+
+    def test_long_capture_attached(self):
+        mail_config = dict(subject='log', sender='me@home.com', recipients='you@home.com')
+        mailer = Mock()
+        log = CaptureLog(mail_config, mailer=mailer, max_bytes=1024)
+        log.start_capture()
+        for i in range(1000):
+            log.write('request sir-{0}: state=open'.format(i))
+        log.end_capture()
+        args, _ = mailer.send.call_args
+        self.assertTrue(args[3].startswith('Capture log: 1002 lines'))
+        self.assertLess(len(args[3]), 2048)
+        (filename, data), = args[4]
+        self.assertTrue(filename.endswith('.log.gz'))
 
 
 if __name__ == '__main__':
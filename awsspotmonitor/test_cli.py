@@ -0,0 +1,93 @@
+from __future__ import absolute_import
+
+# standard
+import json
+from mock import patch
+import os
+import shutil
+from StringIO import StringIO
+import subprocess
+import sys
+import tempfile
+import unittest
+
+# package
+from .cli import *
+from .fake_ec2 import FakeEC2Connection
+from .journal import Journal
+
+
+class Cli_test(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir)
+        self.journal_path = os.path.join(self.tmpdir, 'journal.jsonl')
+        self.config = self.write_config(dict(pool_name='web', price_strategy='high',
+                                             journal_path=self.journal_path))
+
+    def write_config(self, dct):
+        path = os.path.join(self.tmpdir, 'config.json')
+        with open(path, 'w') as f:
+            json.dump(dct, f)
+        return path
+
+    def main(self, *argv):
+        with patch('sys.stdout', StringIO()) as stdout:
+            code = main(list(argv))
+        return code, stdout.getvalue()
+
+    def test_load_config(self):
+        pools, mail_config = load_config(self.write_config(dict(pools=[{}, {}], mail={'host': 'h'})))
+        self.assertEqual(len(pools), 2)
+        self.assertEqual(mail_config, {'host': 'h'})
+
+    def test_once_connects_on_first_use(self):
+        conn = FakeEC2Connection(volatility=0, seed=1)
+        with patch('awsspotmonitor.spot_monitor.connect', return_value=conn) as connect:
+            self.assertEqual(self.main('once', self.config)[0], 0)
+        connect.assert_called_once_with('us-east-1')
+        self.assertEqual(len(conn.requests), 1)
+
+    def test_status_from_journal(self):
+        journal = Journal(self.journal_path)
+        journal.record_request('sir-1', 'fulfilled', 'i-1', 0.02)
+        journal.record_instance('i-1', 'running')
+        journal.commit(0)
+        size = os.path.getsize(self.journal_path)
+
+        with patch('awsspotmonitor.spot_monitor.connect') as connect:
+            code, out = self.main('status', self.config)
+        self.assertFalse(connect.called)
+        self.assertIn('web: journal of 1970-01-01T00:00:00 UTC', out)
+        self.assertIn('requests: fulfilled=1', out)
+        self.assertIn('instances: running=1', out)
+
+        # the journal was read, not compacted, so the monitor's open journal is unaffected.
+        self.assertEqual(os.path.getsize(self.journal_path), size)
+        journal.close()
+
+    def test_price_leaves_journal(self):
+        journal = Journal(self.journal_path)
+        for i in range(3):
+            journal.record_request('sir-1', 'fulfilled', 'i-1', 0.02 + i)
+            journal.commit(i)
+        size = os.path.getsize(self.journal_path)
+
+        conn = FakeEC2Connection(volatility=0, seed=1)
+        with patch('awsspotmonitor.spot_monitor.connect', return_value=conn):
+            code, out = self.main('price', self.config)
+        self.assertIn('web: low=', out)
+        self.assertEqual(os.path.getsize(self.journal_path), size)
+        journal.close()
+
+    def test_lazy_imports(self):
+        root = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+        out = subprocess.check_output([sys.executable, '-c',
+            'import sys; import awsspotmonitor.cli; from awsspotmonitor import AwsSpotMonitor; '
+            'print(sorted(m for m in ("boto", "numpy", "smtplib") if m in sys.modules))'],
+            cwd=root)
+        self.assertEqual(out.strip(), '[]')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,82 @@
+from __future__ import absolute_import
+
+# standard
+import json
+import os
+import shutil
+from StringIO import StringIO
+import tempfile
+import unittest
+
+# pypi
+from mock import Mock
+
+# package
+from .capturelog import CaptureLog
+from .events import *
+
+
+class EventLog_test(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_levels(self):
+        stream = StringIO()
+        log = EventLog([TextSink(stream, level='info')])
+        self.assertFalse(log.enabled(DEBUG))
+        self.assertTrue(log.enabled(WARNING))
+
+        # a debug event is dropped without formatting its message.
+        message = Mock()
+        log.debug('tick', message, n=1)
+        self.assertFalse(message.format.called)
+        log.info('tock', 'tock {n}', n=1)
+        log.error('oops', 'oops: {reason}', reason='broken')
+        self.assertEqual(stream.getvalue(), 'tock 1\noops: broken\n')
+        self.assertRaises(ValueError, parse_level, 'chatty')
+
+    def test_jsonl(self):
+        path = os.path.join(self.dir, 'events.jsonl')
+        stream = StringIO()
+        sink = JsonlSink(path)
+        log = EventLog([TextSink(stream, level=WARNING), sink])
+        self.assertTrue(log.enabled(DEBUG))
+        log.debug('buckets', 'pending: {pending}', pending=2)
+        log.warning('short', 'short by {n}', n=1, at=object())
+        log.flush()
+        sink.close()
+
+        with open(path) as f:
+            records = [json.loads(line) for line in f]
+        self.assertEqual([(r['event'], r['level']) for r in records], [('buckets', 'debug'), ('short', 'warning')])
+        self.assertEqual(records[0]['pending'], 2)
+        self.assertIn('object', records[1]['at'])
+        self.assertEqual(stream.getvalue(), 'short by 1\n')
+
+    def test_exception(self):
+        stream = StringIO()
+        log = EventLog([TextSink(stream)])
+        try:
+            raise RuntimeError('boom')
+        except RuntimeError:
+            log.exception('failed', 'step {step} failed', step=3)
+        self.assertTrue(stream.getvalue().startswith('step 3 failed\nTraceback'))
+        self.assertIn('RuntimeError: boom', stream.getvalue())
+
+    def test_capture_log(self):
+        capture = CaptureLog(level='info')
+        log = EventLog([capture])
+        capture.start_capture()
+        log.info('submitted', 'submitted request: {id}', id='sir-1')
+        log.debug('buckets', 'pending: {pending}', pending=0)
+        text = capture.file().getvalue()
+        capture.end_capture()
+        self.assertIn('submitted request: sir-1', text)
+        self.assertNotIn('pending', text)
+
+
+if __name__ == '__main__':
+    unittest.main()
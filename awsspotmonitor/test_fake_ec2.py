@@ -0,0 +1,55 @@
+from __future__ import absolute_import
+
+# standard
+import unittest
+
+# pypi
+from boto.exception import EC2ResponseError
+
+# package
+from .fake_ec2 import *
+
+
+class FakeEC2Connection_test(unittest.TestCase):
+    def test_lifecycle(self):
+        conn = FakeEC2Connection(volatility=0, seed=1)
+        req, = conn.request_spot_instances(0.05, 'ami-1')
+        self.assertEqual(req.status.code, 'pending-evaluation')
+
+        conn.step()
+        req, = conn.get_all_spot_instance_requests(filters={'status-code': 'fulfilled'})
+        instance, = conn.get_all_instances([req.instance_id])[0].instances
+        self.assertEqual(instance.spot_instance_request_id, req.id)
+
+        conn.set_price(instance.placement, 0.10)
+        conn.step()
+        self.assertEqual(conn.get_all_spot_instance_requests([req.id])[0].status.code,
+                         'marked-for-termination')
+        conn.step()
+        self.assertEqual(conn.get_all_instances(
+            filters={'instance-state-name': ['pending', 'running']}), [])
+        self.assertEqual(conn.calls['get_all_spot_instance_requests'], 2)
+
+    def test_low_bid_holds(self):
+        conn = FakeEC2Connection(volatility=0, seed=1)
+        req, = conn.request_spot_instances(0.01, 'ami-1')
+        conn.step()
+        self.assertEqual(conn.get_all_spot_instance_requests()[0].status.code, 'price-too-low')
+        req.cancel()
+        self.assertEqual(conn.get_all_spot_instance_requests()[0].state, 'cancelled')
+
+    def test_throttling(self):
+        conn = FakeEC2Connection(throttle_rate=1.0, seed=1)
+        with self.assertRaises(EC2ResponseError) as cm:
+            conn.get_all_instances()
+        self.assertEqual(cm.exception.error_code, 'RequestLimitExceeded')
+        self.assertEqual(conn.throttled['get_all_instances'], 1)
+
+    def test_price_history(self):
+        conn = FakeEC2Connection(zones=('a', 'b'), price_interval=3600, history_days=1)
+        self.assertEqual(len(conn.get_spot_price_history(availability_zone='a')), 25)
+        self.assertEqual(len(conn.get_spot_price_history()), 50)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,75 @@
+from __future__ import absolute_import
+
+# standard
+from mock import Mock, patch
+import threading
+import time
+import unittest
+
+# package
+from .fleet import *
+from .throttle import ThrottledConnection
+
+
+class _Monitor(object):
+    DEFAULT_CONFIG = dict(region_name='us-east-1')
+
+    def __init__(self, config, mail_config, conn, metrics):
+        self.config = config
+        self.name = config['pool_name']
+        self.conn = conn
+        self.events = Mock()
+        self.calls = 0
+
+    def check_requests(self):
+        self.calls += 1
+        if self.config.get('fail'):
+            raise RuntimeError('boom')
+        if 'meet' in self.config:
+            # arrive, then wait for the other pool: only checks that overlap can meet.
+            arrive, other = self.config['meet']
+            arrive.set()
+            self.met = other.wait(5)
+        time.sleep(self.config.get('delay', 0))
+
+
+class FleetMonitor_test(unittest.TestCase):
+    def setUp(self):
+        patcher = patch('awsspotmonitor.fleet.connect', side_effect=lambda region: Mock(region=region))
+        self.connect = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_connection_per_region(self):
+        fleet = FleetMonitor([dict(pool_name='a'), dict(pool_name='b'),
+                              dict(pool_name='c', region_name='eu-west-1')], monitor_class=_Monitor)
+        conns = [m.conn for m in fleet.monitors]
+        self.assertIs(conns[0], conns[1])
+        self.assertIsInstance(conns[0], ThrottledConnection)
+        self.assertEqual(conns[2].region, 'eu-west-1')
+        self.assertEqual(self.connect.call_count, 2)
+        fleet.shutdown()
+
+    def test_concurrent_and_isolated(self):
+        a, b = threading.Event(), threading.Event()
+        fleet = FleetMonitor([dict(pool_name='a', meet=(a, b)), dict(pool_name='b', meet=(b, a)),
+                              dict(pool_name='c', fail=True)], monitor_class=_Monitor)
+        self.assertEqual(fleet.check_all(), ['c'])
+        self.assertEqual([m.met for m in fleet.monitors[:2]], [True, True])
+        self.assertIsInstance(fleet.errors['c'], RuntimeError)
+        fleet.shutdown()
+
+    def test_slow_pool_skipped(self):
+        fleet = FleetMonitor([dict(pool_name='slow', delay=0.5), dict(pool_name='fast')],
+                             monitor_class=_Monitor)
+        fleet.check_all(timeout=0.05)
+        fleet.check_all(timeout=0.05)
+        slow, fast = fleet.monitors
+        self.assertEqual((slow.calls, fast.calls), (1, 2))
+        self.assertEqual(slow.events.warning.call_args[0][0], 'check_running')
+        self.assertFalse(fast.events.warning.called)
+        fleet.check_all()
+        fleet.shutdown()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,74 @@
+from __future__ import absolute_import
+
+# standard
+import threading
+import time
+import unittest
+
+# package
+from .hooks import *
+
+
+class HookExecutor_test(unittest.TestCase):
+    def test_retry_then_give_up(self):
+        done = threading.Event()
+        hooks = HookExecutor(lambda x: 1/x, workers=2, retries=1, retry_delay=10, on_done=done.set)
+        self.assertTrue(hooks.submit('a', 1))
+        self.assertTrue(hooks.submit('b', 0))
+        self.assertFalse(hooks.submit('b', 0))
+        hooks.shutdown(wait=True)
+        self.assertTrue(done.is_set())
+
+        now = time.time()
+        succeeded, retrying, failed = hooks.poll(now)
+        self.assertEqual((succeeded, [k for k, e in retrying], failed), (['a'], ['b'], []))
+        self.assertIn('b', hooks)
+
+        # the retry waits for retry_delay.
+        self.assertEqual(hooks.poll(now + 5), ([], [], []))
+        hooks.poll(now + 10)
+        hooks.shutdown(wait=True)
+        succeeded, retrying, failed = hooks.poll(now + 10)
+        self.assertEqual([k for k, e in failed], ['b'])
+        self.assertIsInstance(failed[0][1], ZeroDivisionError)
+        self.assertEqual(len(hooks), 0)
+
+    def test_timeout(self):
+        release = threading.Event()
+        hooks = HookExecutor(release.wait, timeout=0.05, retries=0)
+        hooks.submit('a', 5)
+        time.sleep(0.1)
+        succeeded, retrying, failed = hooks.poll()
+        self.assertEqual([k for k, e in failed], ['a'])
+        self.assertEqual(hooks.abandoned, 1)
+        release.set()
+        hooks.shutdown(wait=True)
+
+    def test_stuck_workers_replaced(self):
+        release = threading.Event()
+        self.addCleanup(release.set)
+        calls = []
+
+        def hook(key):
+            calls.append(key)
+            if key == 'stuck':
+                release.wait()
+
+        hooks = HookExecutor(hook, workers=1, timeout=0.05, retries=0)
+        hooks.submit('stuck', 'stuck')
+        hooks.submit('next', 'next')
+        hooks.wait()
+        succeeded, retrying, failed = hooks.poll()
+        self.assertEqual([k for k, e in failed], ['stuck'])
+
+        # the only worker is stuck: the queued call runs on a fresh pool.
+        while 'next' in hooks:
+            hooks.wait(1)
+            succeeded, retrying, failed = hooks.poll()
+        self.assertEqual(succeeded, ['next'])
+        self.assertEqual(calls, ['stuck', 'next'])
+        hooks.shutdown()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,94 @@
+from __future__ import absolute_import
+
+# standard
+import os
+import shutil
+import tempfile
+import unittest
+
+# pypi
+from mock import Mock
+
+# package
+from .fake_ec2 import FakeEC2Connection
+from .journal import *
+from .spot_monitor import AwsSpotMonitor
+
+
+class Journal_test(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir)
+        self.path = os.path.join(self.tmpdir, 'journal.jsonl')
+
+    def test_reload(self):
+        journal = Journal(self.path)
+        self.assertIsNone(journal.record_request('sir-1', 'fulfilled', 'i-1', 0.02))
+        journal.record_request('sir-2', 'pending-evaluation')
+        journal.record_instance('i-1', 'running')
+        journal.record_processed('sir-1')
+        journal.forget('sir-2')
+        journal.commit(100.0)
+        journal.close()
+
+        # a torn last line is ignored.
+        with open(self.path, 'a') as f:
+            f.write('{"t":"req","id":"sir-3"')
+
+        journal = Journal(self.path)
+        self.assertEqual(journal.requests, {'sir-1': dict(code='fulfilled', iid='i-1', price=0.02)})
+        self.assertEqual(journal.instances, {'i-1': 'running'})
+        self.assertTrue(journal.is_processed('sir-1'))
+        self.assertEqual(journal.checkpoint, 100.0)
+
+    def test_only_changes_written_and_compaction(self):
+        journal = Journal(self.path, compact_every=10)
+        for i in range(50):
+            journal.record_request('sir-1', 'fulfilled', 'i-1', 0.02)
+            journal.commit()
+        with open(self.path) as f:
+            self.assertLessEqual(len(f.readlines()), 13)
+
+    def test_monitor_resume(self):
+        conn = FakeEC2Connection(volatility=0, seed=1)
+        config = dict(price_strategy='high', journal_path=self.path, hook_workers=0)
+        monitor = AwsSpotMonitor(config, conn=conn)
+        monitor.check_requests()
+        conn.step()
+
+        # the request is processed, but the tag never made it to EC2.
+        conn.create_tags = lambda ids, tags: True
+        processed = []
+        monitor.process_fulfilled = processed.append
+        monitor.check_requests()
+        self.assertEqual(len(processed), 1)
+
+        restarted = AwsSpotMonitor(config, conn=conn)
+        restarted.process_fulfilled = processed.append
+        restarted.check_requests()
+        self.assertEqual(len(processed), 1)
+
+    def test_failed_tag_not_journaled(self):
+        conn = FakeEC2Connection(volatility=0, seed=1)
+        config = dict(price_strategy='high', journal_path=self.path, hook_workers=0)
+        monitor = AwsSpotMonitor(config, conn=conn)
+        monitor.check_requests()
+        conn.step()
+
+        # the processed tag fails: the request isn't journaled, and is processed again.
+        create_tags = conn.create_tags
+        conn.create_tags = Mock(side_effect=conn.error(400, 'InvalidSpotInstanceRequestID.NotFound', 'not yet'))
+        processed = []
+        monitor.process_fulfilled = processed.append
+        monitor.check_requests()
+        req, = conn.requests.values()
+        self.assertFalse(monitor._journal.is_processed(req.id))
+
+        conn.create_tags.side_effect = create_tags
+        monitor.check_requests()
+        self.assertEqual(len(processed), 2)
+        self.assertTrue(monitor._journal.is_processed(req.id))
+
+
+if __name__ == '__main__':
+    unittest.main()
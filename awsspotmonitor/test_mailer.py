@@ -0,0 +1,47 @@
+from __future__ import absolute_import
+
+# standard
+import email
+from mock import MagicMock, patch
+import smtplib
+import unittest
+
+# package
+from .mailer import *
+
+
+class MailQueue_test(unittest.TestCase):
+    def setUp(self):
+        patcher = patch('awsspotmonitor.mailer.open_smtp')
+        self.open_smtp = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.smtp = self.open_smtp.return_value
+        self.smtp.noop.return_value = (250, 'OK')
+
+    def test_digest(self):
+        queue = MailQueue(dict(host='mail'), digest_secs=0.2, min_interval=0)
+        queue.send('log', 'me@home.com', 'you@home.com', 'first')
+        queue.send('log', 'me@home.com', 'you@home.com', 'second')
+        queue.close(5)
+        self.assertEqual(self.smtp.sendmail.call_count, 1)
+        sender, recipients, text = self.smtp.sendmail.call_args[0]
+        self.assertEqual(recipients, ['you@home.com'])
+        msg = email.message_from_string(text)
+        self.assertEqual(msg['Subject'], 'log (2 messages)')
+        body = msg.get_payload(decode=True)
+        self.assertIn('first', body)
+        self.assertIn('second', body)
+
+    def test_connection_reused_and_retried(self):
+        self.smtp.sendmail.side_effect = [smtplib.SMTPServerDisconnected(), None, None]
+        queue = MailQueue(dict(host='mail'), digest_secs=0, min_interval=0, backoff=0)
+        queue.send('a', 'me@home.com', 'you@home.com', 'one')
+        queue.send('b', 'me@home.com', 'other@home.com', 'two')
+        queue.close(5)
+        self.assertEqual(self.smtp.sendmail.call_count, 3)
+        # one reconnect after the failure, otherwise the connection is reused.
+        self.assertEqual(self.open_smtp.call_count, 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,75 @@
+from __future__ import absolute_import
+
+# standard
+import json
+import os
+import shutil
+import tempfile
+import unittest
+import urllib2
+
+# pypi
+from boto.exception import EC2ResponseError
+
+# package
+from .fake_ec2 import FakeEC2Connection
+from .metrics import *
+from .spot_monitor import AwsSpotMonitor
+
+
+class Registry_test(unittest.TestCase):
+    def test_render(self):
+        registry = Registry()
+        registry.inc('calls_total', action='a')
+        registry.inc('calls_total', 2, action='a')
+        registry.set('size', 5)
+        registry.observe('latency_seconds', 0.02, buckets=(0.01, 0.1))
+        text = registry.render()
+        self.assertIn('# TYPE calls_total counter\ncalls_total{action="a"} 3\n', text)
+        self.assertIn('size 5\n', text)
+        self.assertIn('latency_seconds_bucket{le="0.01"} 0\n', text)
+        self.assertIn('latency_seconds_bucket{le="0.1"} 1\n', text)
+        self.assertIn('latency_seconds_bucket{le="+Inf"} 1\n', text)
+        self.assertIn('latency_seconds_count 1\n', text)
+
+    def test_server(self):
+        registry = Registry()
+        registry.inc('calls_total')
+        server = serve_metrics(registry, port=0)
+        try:
+            url = 'http://127.0.0.1:{0}/metrics'.format(server.server_address[1])
+            self.assertIn('calls_total 1', urllib2.urlopen(url, timeout=5).read())
+        finally:
+            server.shutdown()
+
+    def test_instrumented_connection(self):
+        registry = Registry()
+        conn = InstrumentedConnection(FakeEC2Connection(throttle_rate=1.0), registry, pool='p')
+        with self.assertRaises(EC2ResponseError):
+            conn.get_all_instances()
+        self.assertEqual(registry.get('awsspotmonitor_ec2_calls_total', action='get_all_instances',
+                                      outcome='RequestLimitExceeded', pool='p'), 1)
+
+    def test_monitor_cycle(self):
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+        path = os.path.join(tmpdir, 'metrics.jsonl')
+        registry = Registry()
+        conn = FakeEC2Connection(volatility=0, seed=1)
+        monitor = AwsSpotMonitor(dict(pool_name='p', price_strategy='high', metrics_jsonl_path=path),
+                                 conn=conn, metrics=registry)
+        monitor.check_requests()
+        conn.step()
+        monitor.check_requests()
+
+        self.assertEqual(registry.get('awsspotmonitor_requests', state='Fulfilled', pool='p'), 1)
+        self.assertEqual(registry.get('awsspotmonitor_phase_seconds', phase='cycle', pool='p')[2], 2)
+        self.assertEqual(registry.get('awsspotmonitor_replacement_seconds', pool='p')[2], 1)
+        self.assertEqual(registry.get('awsspotmonitor_ec2_calls_total', action='request_spot_instances',
+                                      outcome='ok', pool='p'), 1)
+        with open(path) as f:
+            self.assertEqual(len([json.loads(line) for line in f]), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
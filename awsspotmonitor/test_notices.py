@@ -0,0 +1,90 @@
+from __future__ import absolute_import
+
+# standard
+from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+import json
+import threading
+import unittest
+import urllib2
+
+# package
+from .fake_ec2 import FakeEC2Connection
+from .notices import *
+from .spot_monitor import AwsSpotMonitor
+
+
+class _Metadata(BaseHTTPRequestHandler):
+    """Stand-in for the instance metadata service (IMDSv2)."""
+    def do_GET(self):
+        if self.headers.get('X-aws-ec2-metadata-token') != 'secret':
+            self.send_error(401)
+        elif self.path == '/latest/meta-data/instance-id':
+            self._reply(self.server.instance_id)
+        elif self.path == '/latest/meta-data/spot/instance-action' and self.server.action:
+            self._reply(json.dumps(self.server.action))
+        else:
+            self.send_error(404)
+
+    def do_PUT(self):
+        if self.path == '/latest/api/token':
+            self._reply('secret')
+        else:
+            self.send_error(404)
+
+    def log_message(self, format, *args):
+        pass
+
+    def _reply(self, body):
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class Notices_test(unittest.TestCase):
+    def setUp(self):
+        self.conn = FakeEC2Connection(volatility=0, seed=1)
+        self.monitor = AwsSpotMonitor(dict(price_strategy='high'), conn=self.conn)
+        self.monitor.check_requests()
+        self.conn.step()
+        self.monitor.check_requests()
+        instance_id, = self.conn.instances
+
+        self.metadata = HTTPServer(('127.0.0.1', 0), _Metadata)
+        self.metadata.instance_id = instance_id
+        self.metadata.action = None
+        threading.Thread(target=self.metadata.serve_forever).start()
+        self.addCleanup(self.metadata.shutdown)
+
+        self.receiver = serve_notices(self.monitor.notice, port=0, token='t')
+        self.addCleanup(self.receiver.shutdown)
+        self.url = 'http://127.0.0.1:{0}/notice'.format(self.receiver.server_address[1])
+
+    def watcher(self, token='t'):
+        return InterruptionWatcher(self.url, token,
+                                   'http://127.0.0.1:{0}/latest'.format(self.metadata.server_address[1]),
+                                   interval=0.01)
+
+    def test_notice_triggers_replacement(self):
+        watcher = self.watcher()
+        self.assertIsNone(watcher.check())
+
+        self.metadata.action = dict(action='terminate', time='2015-01-05T18:02:00Z')
+        notice = watcher.run()
+        self.assertEqual(notice['instance_id'], self.metadata.instance_id)
+
+        # the monitor was woken, and replaces the instance before its request is marked.
+        self.assertTrue(self.monitor._scheduler.sleep(0))
+        self.monitor.check_requests()
+        self.assertEqual(len(self.conn.requests), 2)
+        self.monitor.check_requests()
+        self.assertEqual(len(self.conn.requests), 2)
+
+    def test_token_required(self):
+        with self.assertRaises(urllib2.HTTPError) as cm:
+            self.watcher(token='wrong').send(dict(instance_id='i-1'))
+        self.assertEqual(cm.exception.code, 403)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,85 @@
+from __future__ import absolute_import
+
+# standard
+from mock import Mock
+import unittest
+
+# package
+from .fake_ec2 import FakeEC2Connection
+from .placement import *
+from .price_history import PriceHistory
+from .spot_monitor import AwsSpotMonitor
+
+
+class PlacementOptimizer_test(unittest.TestCase):
+    def setUp(self):
+        self.conn = FakeEC2Connection(volatility=0, seed=1)
+        self.conn.step(60)
+        self.conn.set_price('us-east-1b', 0.01)
+        self.conn.step(3600)
+        self.optimizer = PlacementOptimizer(PriceHistory(), strategy='average', ttl=300)
+
+    def rank(self, **kwargs):
+        return self.optimizer.rank(self.conn, 'm1.small', 'Linux/UNIX', days=1,
+                                   now=self.conn.now, **kwargs)
+
+    def test_rank_by_price(self):
+        self.optimizer.volatility_weight = 0
+        ranking = self.rank()
+        self.assertEqual([p.zone for p in ranking], ['us-east-1b', 'us-east-1a', 'us-east-1c'])
+        self.assertAlmostEqual(ranking[1].price, 0.02)
+        self.assertLess(ranking[0].price, 0.02)
+
+        # all zones came from one price-history query, and the ranking is cached.
+        self.rank()
+        self.assertEqual(self.conn.calls['get_spot_price_history'], 1)
+
+    def test_volatility(self):
+        # us-east-1b is cheaper on average, but its price has just moved.
+        self.assertEqual(self.rank()[-1].zone, 'us-east-1b')
+
+    def test_holding_penalty(self):
+        for _ in range(3):
+            self.optimizer.record('us-east-1b', held=True, now=self.conn.now)
+        self.assertEqual(self.rank()[-1].zone, 'us-east-1b')
+
+        # a fulfilled request halves the penalty, and penalties fade with time.
+        penalty = self.optimizer.penalty('us-east-1b', self.conn.now)
+        self.optimizer.record('us-east-1b', held=False, now=self.conn.now)
+        self.assertAlmostEqual(self.optimizer.penalty('us-east-1b', self.conn.now), penalty/2)
+        self.assertAlmostEqual(self.optimizer.penalty('us-east-1b', self.conn.now + 3600), penalty/4)
+
+    def test_zones(self):
+        self.optimizer.zones = ['us-east-1c']
+        self.assertEqual([p.zone for p in self.rank()], ['us-east-1c'])
+
+    def test_request_zone(self):
+        self.assertEqual(request_zone(Mock(launched_availability_zone='us-east-1a')), 'us-east-1a')
+        self.assertEqual(request_zone(Mock(launched_availability_zone=None,
+                                           launch_specification=Mock(placement='us-east-1b'))),
+                         'us-east-1b')
+
+
+class MultiAzMonitor_test(unittest.TestCase):
+    def test_falls_back_to_next_zone(self):
+        conn = FakeEC2Connection(volatility=0, seed=1)
+        monitor = AwsSpotMonitor(dict(target_capacity=1, multi_az=True, price_strategy='average'),
+                                 conn=conn)
+
+        submit = conn.request_spot_instances
+
+        def request_spot_instances(price, placement=None, **kwargs):
+            if placement == 'us-east-1a':
+                raise conn.error(500, 'InsufficientInstanceCapacity', 'no capacity')
+            return submit(price, placement=placement, **kwargs)
+        conn.request_spot_instances = request_spot_instances
+
+        monitor.check_requests()
+        req, = conn.requests.values()
+        # zones tie on price, so us-east-1a was tried first.
+        self.assertEqual(req.launch_specification.placement, 'us-east-1b')
+        self.assertGreater(monitor._placement.penalty('us-east-1a'), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
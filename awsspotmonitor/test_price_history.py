@@ -0,0 +1,93 @@
+from __future__ import absolute_import
+
+# standard
+from datetime import datetime
+from mock import Mock
+import os
+import shutil
+import tempfile
+import unittest
+
+# package
+from .price_history import *
+
+
+def _item(ts, price, az='us-east-1a'):
+    return Mock(timestamp=datetime.utcfromtimestamp(ts).strftime('%Y-%m-%dT%H:%M:%S.000Z'),
+                price=price, availability_zone=az)
+
+
+class PriceHistory_test(unittest.TestCase):
+    NOW = 1400000000.0
+
+    def test_incremental_update(self):
+        conn = Mock()
+        conn.get_spot_price_history.return_value = [
+            _item(self.NOW-100, 0.03), _item(self.NOW-200, 0.01), _item(self.NOW-300, 12.0)]
+        history = PriceHistory(window_days=1, refresh_secs=0)
+        self.assertEqual(history.get_price_info(conn, None, 'm1.small', 'Linux/UNIX', now=self.NOW),
+                         (0.01, 12.0, (0.03+0.01+12.0)/3))
+
+        # only newer samples are requested, and the repeated newest sample is ignored.
+        conn.get_spot_price_history.return_value = [_item(self.NOW+50, 0.05), _item(self.NOW-100, 0.03)]
+        low, high, avg = history.get_price_info(conn, None, 'm1.small', 'Linux/UNIX', now=self.NOW+60)
+        _, kwargs = conn.get_spot_price_history.call_args
+        self.assertEqual(kwargs['start_time'], datetime.utcfromtimestamp(self.NOW-100).isoformat())
+        self.assertEqual(len(history.series(None, 'm1.small', 'Linux/UNIX')), 4)
+        self.assertEqual((low, high), (0.01, 12.0))
+
+        # samples older than the window are dropped, along with their low/high, except the
+        # one still in effect at the window start.
+        conn.get_spot_price_history.return_value = []
+        low, high, avg = history.get_price_info(conn, None, 'm1.small', 'Linux/UNIX',
+                                                now=self.NOW-150+24*3600)
+        self.assertEqual((low, high), (0.01, 0.05))
+        self.assertEqual(history.series(None, 'm1.small', 'Linux/UNIX').samples[0],
+                         (self.NOW-150, 0.01, 'us-east-1a'))
+
+    def test_unchanged_market(self):
+        # the only sample is the one in effect at the start of the window.
+        conn = Mock()
+        conn.get_spot_price_history.return_value = [_item(self.NOW-3*24*3600, 0.03),
+                                                    _item(self.NOW-2*24*3600, 0.05, 'us-east-1b')]
+        history = PriceHistory(window_days=1, refresh_secs=0)
+        self.assertEqual(history.get_price_info(conn, None, 'm1.small', 'Linux/UNIX', now=self.NOW),
+                         (0.03, 0.05, 0.04))
+        series = history.series(None, 'm1.small', 'Linux/UNIX')
+        self.assertEqual(sorted(series.samples), [(self.NOW-24*3600, 0.03, 'us-east-1a'),
+                                                  (self.NOW-24*3600, 0.05, 'us-east-1b')])
+
+        # and it stays in effect as the window moves on.
+        low, high, avg = history.get_price_info(conn, None, 'm1.small', 'Linux/UNIX', days=0.5,
+                                                now=self.NOW+3600)
+        self.assertEqual((low, high), (0.03, 0.05))
+        self.assertEqual(series.since(self.NOW), [(self.NOW, 0.03, 'us-east-1a'),
+                                                  (self.NOW, 0.05, 'us-east-1b')])
+
+    def test_refresh_interval(self):
+        conn = Mock()
+        conn.get_spot_price_history.return_value = [_item(self.NOW-100, 0.03)]
+        history = PriceHistory(window_days=1, refresh_secs=60)
+        history.get_price_info(conn, None, 'm1.small', 'Linux/UNIX', now=self.NOW)
+        history.get_price_info(conn, None, 'm1.small', 'Linux/UNIX', now=self.NOW+30)
+        self.assertEqual(conn.get_spot_price_history.call_count, 1)
+
+    def test_persistence(self):
+        tmpdir = tempfile.mkdtemp()
+        try:
+            path = os.path.join(tmpdir, 'prices.json')
+            conn = Mock()
+            conn.get_spot_price_history.return_value = [_item(self.NOW-100, 0.03)]
+            PriceHistory(path, window_days=1).get_price_info(conn, None, 'm1.small', 'Linux/UNIX',
+                                                             now=self.NOW)
+
+            history = PriceHistory(path, window_days=1)
+            series = history.series(None, 'm1.small', 'Linux/UNIX')
+            self.assertEqual(series.newest, self.NOW-100)
+            self.assertEqual(series.stats(), (0.03, 0.03, 0.03))
+        finally:
+            shutil.rmtree(tmpdir)
+
+
+if __name__ == '__main__':
+    unittest.main()
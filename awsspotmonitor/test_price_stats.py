@@ -0,0 +1,47 @@
+from __future__ import absolute_import
+
+# standard
+import unittest
+
+# pypi
+import numpy as np
+
+# package
+from .price_stats import *
+
+
+class PriceStats_test(unittest.TestCase):
+    def test_time_weighted(self):
+        # 0.01 for 90s, then 20.0 (above the old hard-coded low) for 10s.
+        samples = [(0.0, 0.01, 'us-east-1a'), (90.0, 20.0, 'us-east-1a')]
+        stats = compute_stats(samples, end=100.0, halflife=1e9)
+        self.assertEqual((stats.low, stats.high), (0.01, 20.0))
+        self.assertAlmostEqual(stats.mean, 0.9*0.01 + 0.1*20.0)
+        self.assertAlmostEqual(stats.ewma, stats.mean, places=5)
+        self.assertEqual((stats.p50, stats.p90, stats.p99), (0.01, 0.01, 20.0))
+
+    def test_zones_weighted_separately(self):
+        samples = [(0.0, 1.0, 'a'), (50.0, 3.0, 'b'), (60.0, 2.0, 'a')]
+        times, prices, weights = to_arrays(samples, end=100.0)
+        self.assertEqual(list(weights), [60.0, 50.0, 40.0])
+        self.assertAlmostEqual(time_above(prices, weights, 1.5), 90.0/150.0)
+
+    def test_batch(self):
+        rng = np.random.RandomState(1)
+        groups = []
+        for n in (0, 1, 1000):
+            samples = sorted((float(t), float(p), 'a')
+                             for t, p in zip(rng.uniform(0, 1000, n), rng.uniform(0.01, 1.0, n)))
+            groups.append(to_arrays(samples, end=1000.0))
+        stats = batch_stats(groups, end=1000.0)
+        self.assertIsNone(stats[0])
+        self.assertEqual(stats[1].low, stats[1].high)
+        self.assertEqual(stats[1].p90, stats[1].low)
+        single = batch_stats([groups[2]], end=1000.0)[0]
+        self.assertEqual(stats[2], single)
+        self.assertTrue(single.low <= single.p50 <= single.p90 <= single.p99 <= single.high)
+        self.assertAlmostEqual(single.mean, np.average(groups[2][1], weights=groups[2][2]))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,43 @@
+from __future__ import absolute_import
+
+# standard
+from mock import Mock
+import unittest
+
+# pypi
+from boto.exception import EC2ResponseError
+
+# package
+from .query import *
+
+
+class Query_test(unittest.TestCase):
+    def test_spot_requests_filters(self):
+        conn = Mock()
+        get_spot_requests(conn, status_codes=('fulfilled',), tag=('monitor', 'web'))
+        conn.get_all_spot_instance_requests.assert_called_once_with(
+            filters={'status-code': ['fulfilled'], 'tag:monitor': 'web'})
+
+    def test_spot_instances_by_id(self):
+        conn = Mock()
+        self.assertEqual(get_spot_instances(conn, []), [])
+        self.assertFalse(conn.get_all_instances.called)
+
+        instance = Mock(id='i-1')
+        conn.get_all_instances.return_value = [Mock(instances=[instance])]
+        self.assertEqual(get_spot_instances(conn, ['i-1']), [instance])
+        _, kwargs = conn.get_all_instances.call_args
+        self.assertEqual(kwargs['instance_ids'], ['i-1'])
+        self.assertEqual(kwargs['filters']['instance-lifecycle'], 'spot')
+
+    def test_spot_instances_unknown_id(self):
+        instance = Mock(id='i-1')
+        error = EC2ResponseError(400, 'Bad Request')
+        error.error_code = 'InvalidInstanceID.NotFound'
+        conn = Mock()
+        conn.get_all_instances.side_effect = [error, [Mock(instances=[instance, Mock(id='i-3')])]]
+        self.assertEqual(get_spot_instances(conn, ['i-1', 'i-2']), [instance])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,36 @@
+from __future__ import absolute_import
+
+# standard
+import threading
+import time
+import unittest
+
+# package
+from .scheduler import *
+
+
+class PollScheduler_test(unittest.TestCase):
+    def test_backoff(self):
+        scheduler = PollScheduler(min_secs=10, max_secs=60, backoff=2.0, jitter=0)
+        self.assertEqual([scheduler.next_delay(False) for _ in range(4)], [20, 40, 60, 60])
+        self.assertEqual(scheduler.next_delay(True), 10)
+        self.assertEqual(scheduler.next_delay(False), 20)
+
+    def test_jitter(self):
+        scheduler = PollScheduler(min_secs=10, jitter=0.1)
+        for _ in range(100):
+            self.assertTrue(9 <= scheduler.next_delay(True) <= 11)
+
+    def test_wake(self):
+        scheduler = PollScheduler(min_secs=10, jitter=0)
+        scheduler.next_delay(False)
+        threading.Timer(0.05, scheduler.wake).start()
+        start = time.time()
+        self.assertTrue(scheduler.sleep(5))
+        self.assertLess(time.time() - start, 1)
+        self.assertFalse(scheduler.sleep(0.01))
+        self.assertEqual(scheduler.next_delay(False), 20)
+
+
+if __name__ == '__main__':
+    unittest.main()
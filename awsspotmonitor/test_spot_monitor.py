@@ -1,14 +1,311 @@
 from __future__ import absolute_import
 
 # standard
+from datetime import datetime
+from mock import Mock
+import threading
+import time
 import unittest
 
 # package
+from .fake_ec2 import FakeEC2Connection
 from .spot_monitor import *
+from .spot_monitor import Request, RequestIndex
+
+
+def _request(id, code, instance_id=None, price=0.02, tags=None):
+    return Mock(id=id, state='active', status=Mock(code=code), instance_id=instance_id,
+                price=price, tags=tags if tags is not None else {'req_date': '2013-01-01T00:00:00'})
+
+
+def _conn(requests, instances):
+    conn = Mock()
+    conn.get_all_spot_instance_requests.return_value = requests
+    conn.get_all_instances.return_value = [Mock(instances=instances)]
+    conn.get_spot_price_history.return_value = [
+        Mock(timestamp=datetime.utcnow().strftime('%Y-%m-%dT%H:%M:%S.000Z'), price=0.02,
+             availability_zone='us-east-1a')]
+    conn.request_spot_instances.side_effect = lambda price, count, **kwargs: \
+        [Mock(id='sir-new{0}'.format(i), state='open') for i in range(count)]
+    return conn
+
+
+class Request_test(unittest.TestCase):
+    def test_state(self):
+        State = Request.State
+        for code, state in (('marked-for-termination', State.Marked),
+                            ('marked', State.Dead),
+                            ('instance-terminated-by-price', State.Terminated),
+                            ('instance-terminated-by-user', State.Terminated),
+                            ('instance-terminated-by-experiment', State.Terminated),
+                            ('instance-stopped-by-experiment', State.Terminated),
+                            ('marked-for-stop-by-experiment', State.Marked),
+                            ('price-too-low', State.Holding),
+                            ('limit-exceeded', State.Holding),
+                            ('request-canceled-and-instance-running', State.Fulfilled),
+                            ('pending-evaluation', State.Pending),
+                            ('canceled-before-fulfillment', State.Dead),
+                            ('something-new', State.Dead)):
+            self.assertEqual(Request(_request('sir-1', code)).state(), state, code)
+
+    def test_slots(self):
+        self.assertFalse(hasattr(Request(_request('sir-1', 'fulfilled')), '__dict__'))
+
+
+class RequestIndex_test(unittest.TestCase):
+    def test_transitions(self):
+        index = RequestIndex()
+        events = []
+        index.subscribe(events.append)
+
+        index.update([_request('sir-1', 'pending-evaluation'), _request('sir-2', 'fulfilled', 'i-2')])
+        self.assertEqual([(e.kind, e.request_id) for e in events], [('new', 'sir-1'), ('new', 'sir-2')])
+        wrapper = index.get('sir-2')
+
+        del events[:]
+        self.assertEqual(index.update([_request('sir-1', 'fulfilled', 'i-1'),
+                                       _request('sir-2', 'fulfilled', 'i-2')]), events)
+        self.assertEqual([(e.kind, e.request_id, e.previous) for e in events],
+                         [('changed', 'sir-1', ('pending-evaluation', 0.02, None))])
+        self.assertIs(index.get('sir-2'), wrapper)
+
+        del events[:]
+        index.update([_request('sir-1', 'fulfilled', 'i-1')])
+        self.assertEqual([(e.kind, e.request_id) for e in events], [('gone', 'sir-2')])
+        self.assertNotIn('sir-2', index)
+        self.assertEqual(len(index), 1)
 
 
 class AwsSpotMonitor_test(unittest.TestCase):
-    pass
+    def test_shortfall_single_request(self):
+        conn = _conn([_request('sir-1', 'fulfilled', 'i-1'),
+                      _request('sir-2', 'marked-for-termination', 'i-2'),
+                      _request('sir-3', 'pending-evaluation')],
+                     [Mock(id='i-1'), Mock(id='i-2')])
+        monitor = AwsSpotMonitor(dict(target_capacity=4), conn=conn)
+        monitor.check_requests()
+
+        # 4 wanted - 1 running (i-2 is marked) - 1 pending = 2, in one call.
+        self.assertEqual(conn.request_spot_instances.call_count, 1)
+        _, kwargs = conn.request_spot_instances.call_args
+        self.assertEqual(kwargs['count'], 2)
+
+    def test_process_fulfilled_once(self):
+        conn = _conn([_request('sir-1', 'fulfilled', 'i-1', tags={})], [Mock(id='i-1')])
+        monitor = AwsSpotMonitor(dict(target_capacity=1, hook_workers=0), conn=conn)
+        monitor.process_fulfilled = Mock(side_effect=[RuntimeError('boom'), None])
+
+        # called during the check, a failure is retried next check; once processed, an unchanged request isn't
+        # looked at again, even before its tag shows up.
+        with self.assertRaises(RuntimeError):
+            monitor.check_requests()
+        monitor.check_requests()
+        monitor.check_requests()
+        self.assertEqual(monitor.process_fulfilled.call_count, 2)
+        self.assertEqual(conn.create_tags.call_count, 1)
+
+    def test_process_fulfilled_hooks(self):
+        conn = _conn([_request('sir-1', 'fulfilled', 'i-1', tags={})], [Mock(id='i-1')])
+        monitor = AwsSpotMonitor(dict(target_capacity=1, hook_retry_secs=0), conn=conn)
+        release = threading.Event()
+        calls = []
+        finished = []
+
+        def bootstrap(req):
+            calls.append(req.id)
+            if len(calls) == 1:
+                raise RuntimeError('boom')
+            release.wait(5)
+            finished.append(req.id)
+
+        # checks go on while the hook runs; the request is tagged only once it succeeds.
+        monitor.process_fulfilled = bootstrap
+        deadline = time.time() + 2
+        while len(calls) < 2 and time.time() < deadline:
+            monitor.check_requests()
+            time.sleep(0.01)
+        monitor.check_requests()
+        self.assertEqual(finished, [])
+        self.assertEqual(calls, ['sir-1', 'sir-1'])
+        self.assertFalse(conn.create_tags.called)
+        self.assertTrue(monitor._is_busy(monitor.check_requests()))
+
+        release.set()
+        monitor._hooks.shutdown(wait=True)
+        monitor.check_requests()
+        self.assertEqual(conn.create_tags.call_count, 1)
+        self.assertEqual(len(calls), 2)
+
+    def test_no_overprovision(self):
+        conn = _conn([_request('sir-1', 'fulfilled', 'i-1'),
+                      _request('sir-2', 'pending-fulfillment')],
+                     [Mock(id='i-1')])
+        monitor = AwsSpotMonitor(dict(target_capacity=2), conn=conn)
+        monitor.check_requests()
+        self.assertFalse(conn.request_spot_instances.called)
+
+
+class AwsSpotMonitorFake_test(unittest.TestCase):
+    def setUp(self):
+        self.conn = FakeEC2Connection(volatility=0, seed=1)
+        self.monitor = AwsSpotMonitor(dict(target_capacity=2, monitor_tag=('pool', 'test'),
+                                           price_strategy='high', hook_workers=0),
+                                      conn=self.conn)
+
+    def test_replaces_lost_capacity(self):
+        self.monitor.check_requests()
+        self.assertEqual(len(self.conn.requests), 2)
+        self.conn.step()
+        self.monitor.check_requests()
+        self.assertEqual(self.conn.calls['request_spot_instances'], 1)
+
+        # both fulfilled requests were processed and tagged once.
+        for req in self.conn.requests.values():
+            self.assertIn('req_date', req.tags)
+            self.assertEqual(req.tags['pool'], 'test')
+
+        self.conn.interrupt(list(self.conn.instances)[0])
+        self.monitor.check_requests()
+        self.assertEqual(len(self.conn.requests), 3)
+
+    def test_parallel_fetch(self):
+        self.conn.latency = 0.2
+        self.monitor.check_requests()
+        self.conn.step()
+        self.monitor.check_requests()
+
+        # requests and instances (by the IDs seen last check) are read in parallel, then the
+        # replacement is submitted and tagged.
+        self.monitor.notice(list(self.conn.instances)[0])
+        calls = sum(self.conn.calls.values())
+        self.conn.spans.clear()
+        self.monitor.check_requests()
+        spans = dict((name, (start, end)) for name, start, end in self.conn.spans)
+        requests, instances = spans['get_all_spot_instance_requests'], spans['get_all_instances']
+        self.assertLess(requests[0], instances[1])
+        self.assertLess(instances[0], requests[1])
+        self.assertEqual(len(self.conn.requests), 3)
+        self.assertEqual(self.conn.calls['get_all_instances'], 2)
+        self.assertEqual(sum(self.conn.calls.values()) - calls, 4)
+
+    def test_tag_retried(self):
+        create_tags = self.conn.create_tags
+        self.conn.create_tags = Mock(side_effect=self.conn.error(
+            400, 'InvalidSpotInstanceRequestID.NotFound', 'not yet'))
+
+        # the submission stands; the tag is put on next check, so nothing is submitted twice.
+        self.monitor.check_requests()
+        self.assertEqual(len(self.conn.requests), 2)
+        self.conn.create_tags.side_effect = create_tags
+        self.monitor.check_requests()
+        self.assertEqual(len(self.conn.requests), 2)
+        for req in self.conn.requests.values():
+            self.assertEqual(req.tags['pool'], 'test')
+
+    def test_drain_hung_hook(self):
+        release = threading.Event()
+        self.addCleanup(release.set)
+        config = dict(target_capacity=1, price_strategy='high', monitor_tag=('pool', 'test'),
+                      hook_timeout_secs=0.2, hook_retries=0)
+        monitor = AwsSpotMonitor(config, conn=self.conn)
+        monitor.process_fulfilled = lambda req: release.wait()
+        monitor.check_requests()
+        self.conn.step()
+        monitor.check_requests()
+
+        # the hook never returns: drain() gives up on it once it times out.
+        drained = threading.Thread(target=monitor.drain)
+        drained.daemon = True
+        drained.start()
+        drained.join(5)
+        self.assertFalse(drained.is_alive())
+        self.assertEqual(monitor._hooks.abandoned, 1)
+        self.assertEqual(len(monitor._hooks), 0)
+
+    def test_drain_one_shot(self):
+        # cron-style runs: a fresh monitor per run, with process_fulfilled() on the workers.
+        calls = []
+
+        def bootstrap(req):
+            time.sleep(0.05)
+            calls.append(req.id)
+
+        config = dict(target_capacity=1, price_strategy='high', monitor_tag=('pool', 'test'))
+        for _ in range(3):
+            monitor = AwsSpotMonitor(config, conn=self.conn)
+            monitor.process_fulfilled = bootstrap
+            monitor.check_requests()
+            monitor.drain()
+            self.conn.step()
+        req, = self.conn.requests.values()
+        self.assertEqual(calls, [req.id])
+        self.assertIn('req_date', req.tags)
+
+    def test_warm_replacement(self):
+        monitor = AwsSpotMonitor(dict(target_capacity=1, price_strategy='high', warm_replacement=True,
+                                      price_refresh_secs=0, hook_workers=0), conn=self.conn)
+        zone = self.conn.zones[0]
+        self.conn.step()
+        for z in self.conn.zones:
+            self.conn.set_price(z, 0.01)
+        monitor.check_requests()
+        self.conn.step()
+        monitor.check_requests()
+        original, = self.conn.requests.values()
+        self.assertEqual(original.launched_availability_zone, zone)
+
+        # the price nears the bid: a replacement is requested before the instance is lost.
+        self.conn.set_price(zone, 0.019)
+        monitor.check_requests()
+        self.assertEqual(len(self.conn.requests), 2)
+        self.conn.step()
+        monitor.check_requests()
+        self.assertEqual(len(self.conn.requests), 2)
+        self.assertEqual(sum(1 for i in self.conn.instances.values() if i.state != 'terminated'), 2)
+
+        # the price falls back: the replacement is the surplus.
+        self.conn.step()
+        self.conn.set_price(zone, 0.01)
+        monitor.check_requests()
+        live = [i for i in self.conn.instances.values() if i.state != 'terminated']
+        self.assertEqual([i.id for i in live], [original.instance_id])
+
+    def test_warm_replacement_resumed(self):
+        config = dict(target_capacity=1, price_strategy='high', warm_replacement=True,
+                      price_refresh_secs=0, hook_workers=0)
+        monitor = AwsSpotMonitor(config, conn=self.conn)
+        zone = self.conn.zones[0]
+        self.conn.step()
+        for z in self.conn.zones:
+            self.conn.set_price(z, 0.01)
+        monitor.check_requests()
+        self.conn.step()
+        monitor.check_requests()
+        original, = self.conn.requests.values()
+        self.conn.set_price(zone, 0.019)
+        monitor.check_requests()
+        warm, = [r for r in self.conn.requests.values() if r is not original]
+        self.assertEqual(warm.tags[Request.WARM_TAG], original.instance_id)
+
+        # a restarted monitor reads the replacement back from its tag.
+        self.conn.step()
+        monitor = AwsSpotMonitor(config, conn=self.conn)
+        monitor.check_requests()
+        self.assertEqual(monitor._warm, {warm.id: [original.instance_id]})
+
+        # once the instance it replaces is gone, it's an ordinary request, watched for risk.
+        self.conn.terminate_instances([original.instance_id])
+        self.conn.set_price(warm.launched_availability_zone, 0.02)
+        self.conn.step()
+        monitor.check_requests()
+        self.assertEqual(monitor._at_risk, 1)
+        self.assertEqual(list(monitor._warm.values()), [[warm.instance_id]])
+
+    def test_ignores_foreign_requests(self):
+        self.conn.populate(100, live=5)
+        self.monitor.check_requests()
+        reqs = self.monitor._bucket_requests()
+        self.assertEqual(sum(len(v) for v in reqs.values()), 2)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,102 @@
+from __future__ import absolute_import
+
+# standard
+import time
+import unittest
+
+# pypi
+from boto.exception import EC2ResponseError
+from mock import Mock
+
+# package
+from .fake_ec2 import FakeEC2Connection
+from .metrics import Registry
+from .spot_monitor import AwsSpotMonitor
+from .throttle import *
+
+
+def _error(code):
+    error = EC2ResponseError(400, 'Bad Request')
+    error.error_code = code
+    return error
+
+
+class Throttle_test(unittest.TestCase):
+    def test_classify(self):
+        self.assertEqual(classify(_error('RequestLimitExceeded')), 'retryable')
+        self.assertEqual(classify(_error('InsufficientInstanceCapacity')), 'actionable')
+        self.assertEqual(classify(_error('AuthFailure')), 'fatal')
+
+    def test_token_bucket(self):
+        bucket = TokenBucket(rate=50, burst=2)
+        start = time.time()
+        waits = [bucket.acquire() for _ in range(4)]
+        self.assertEqual(waits[:2], [0, 0])
+        self.assertGreater(time.time() - start, 0.03)
+
+    def test_retries_within_budget(self):
+        registry = Registry()
+        fake = FakeEC2Connection(throttle_rate=0.5, seed=3)
+        conn = ThrottledConnection(fake, base_delay=0.001, max_retries=10, budget=100, registry=registry)
+        for _ in range(10):
+            conn.get_all_instances()
+        self.assertGreater(fake.throttled['get_all_instances'], 0)
+        self.assertEqual(registry.get('awsspotmonitor_ec2_retries_total', action='get_all_instances'),
+                         fake.throttled['get_all_instances'])
+
+        # once the cycle's budget is spent, throttling errors are raised.
+        fake.throttle_rate = 1.0
+        conn.budget = 2
+        conn.new_cycle()
+        with self.assertRaises(EC2ResponseError):
+            conn.get_all_instances()
+        self.assertEqual(registry.get('awsspotmonitor_ec2_retries_total', action='get_all_instances'),
+                         fake.throttled['get_all_instances'] - 1)
+
+    def test_actionable_not_retried(self):
+        raw = Mock()
+        raw.request_spot_instances.side_effect = _error('SpotMaxPriceTooLow')
+        conn = ThrottledConnection(raw, registry=Registry())
+        with self.assertRaises(EC2ResponseError):
+            conn.request_spot_instances(0.01)
+        self.assertEqual(raw.request_spot_instances.call_count, 1)
+
+    def test_bounded_submission(self):
+        fake = FakeEC2Connection(volatility=0, seed=1)
+        fake.request_spot_instances = Mock(side_effect=_error('SpotMaxPriceTooLow'))
+        monitor = AwsSpotMonitor(dict(price_strategy='average', submit_attempts=3), conn=fake,
+                                 metrics=Registry())
+        self.assertEqual(monitor.request_instances(1), [])
+        self.assertEqual(fake.request_spot_instances.call_count, 3)
+
+        fake.request_spot_instances.side_effect = _error('AuthFailure')
+        with self.assertRaises(EC2ResponseError):
+            monitor.request_instances(1)
+        self.assertEqual(fake.request_spot_instances.call_count, 4)
+
+    def test_loop_survives_throttling(self):
+        registry = Registry()
+        fake = FakeEC2Connection(throttle_rate=1.0, seed=1)
+        monitor = AwsSpotMonitor(dict(ec2_retry_budget=0), conn=fake, metrics=registry)
+        monitor._scheduler.sleep = Mock(side_effect=[None, None, KeyboardInterrupt])
+        monitor.loop()
+        self.assertEqual(registry.get('awsspotmonitor_check_failures_total', pool=monitor.name), 3)
+
+        # the next checks are backed off.
+        delays = [args[0] for args, _ in monitor._scheduler.sleep.call_args_list]
+        self.assertLess(delays[0], delays[1])
+
+    def test_shared_connection(self):
+        shared = ThrottledConnection(FakeEC2Connection(seed=1), registry=Registry())
+        monitors = [AwsSpotMonitor(dict(pool_name=name), conn=shared, metrics=Registry()) for name in 'ab']
+        for monitor in monitors:
+            monitor.check_requests()
+        # both pools' calls go through the one shared bucket per action.
+        self.assertIs(monitors[0].conn._conn, shared)
+        self.assertIs(monitors[1].conn._conn, shared)
+        self.assertIn('get_all_spot_instance_requests', vars(shared))
+        self.assertIsNone(monitors[0]._throttle)
+
+
+if __name__ == '__main__':
+    unittest.main()
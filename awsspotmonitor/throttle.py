@@ -0,0 +1,155 @@
+from __future__ import absolute_import
+
+# standard
+import random
+import threading
+import time
+
+# package
+from .metrics import REGISTRY
+
+
+__all__ = ['ACTIONABLE_CODES', 'RETRYABLE_CODES', 'ThrottledConnection', 'TokenBucket', 'classify']
+
+
+# error codes of calls that may succeed if simply tried again later: throttling, and
+# transient server-side failures.
+RETRYABLE_CODES = frozenset([
+    'RequestLimitExceeded',
+    'Throttling',
+    'ThrottlingException',
+    'RequestThrottled',
+    'InternalError',
+    'ServiceUnavailable',
+    'Unavailable'])
+
+# error codes of spot requests that won't succeed as they are, but may with a higher bid
+# or in another availability zone.
+ACTIONABLE_CODES = frozenset([
+    'SpotMaxPriceTooLow',
+    'InsufficientInstanceCapacity',
+    'InsufficientCapacity',
+    'InsufficientFreeAddressesInSubnet',
+    'Unsupported'])
+
+
+def classify(error):
+    """Classifies an EC2ResponseError.
+
+    :param error: boto.exception.EC2ResponseError
+    :return: 'retryable' (throttled or transient: try again later), 'actionable' (change the
+             bid or zone) or 'fatal'.
+    """
+    code = getattr(error, 'error_code', None)
+    if code in RETRYABLE_CODES or (code is None and getattr(error, 'status', None) in (500, 503)):
+        return 'retryable'
+    if code in ACTIONABLE_CODES:
+        return 'actionable'
+    return 'fatal'
+
+
+class TokenBucket(object):
+    """A token bucket: allows rate calls per second on average, and bursts of up to burst.
+
+    Thread-safe: acquire() blocks the calling thread until a token is available.
+    """
+    def __init__(self, rate, burst):
+        self.rate = float(rate)
+        self.burst = float(burst)
+        self._tokens = self.burst
+        self._stamp = time.time()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Takes a token, waiting for one if need be.
+
+        :return: the seconds waited.
+        """
+        with self._lock:
+            now = time.time()
+            self._tokens = min(self.burst, self._tokens + (now - self._stamp)*self.rate)
+            self._stamp = now
+            self._tokens -= 1
+            wait = -self._tokens/self.rate if self._tokens < 0 else 0
+        if wait:
+            time.sleep(wait)
+        return wait
+
+
+class ThrottledConnection(object):
+    """Wraps an EC2 connection, rate-limiting every API call and retrying throttled ones.
+
+    Each action (method) has its own token bucket: rates maps actions to calls per second,
+    and others get rate. A call that fails with a retryable error (see classify()) is
+    retried after an exponential backoff with full jitter (a random delay of up to
+    base_delay*2**attempt, capped at max_delay secs), at most max_retries times. All calls
+    share a retry budget, reset by new_cycle() (the monitor calls it every check), so a
+    throttled account gets at most budget retries per cycle rather than a retry storm;
+    once the budget is spent, retryable errors are raised.
+
+    Waits for tokens, throttled calls and retries are counted per action in
+    awsspotmonitor_ec2_throttle_wait_seconds_total, awsspotmonitor_ec2_throttled_total and
+    awsspotmonitor_ec2_retries_total. Attributes that aren't methods are passed through.
+    """
+    def __init__(self, conn, rate=20, burst=100, rates=None, max_retries=4, base_delay=0.5,
+                 max_delay=20, budget=10, registry=REGISTRY, **labels):
+        self.budget = budget
+        self._conn = conn
+        self._rate = rate
+        self._burst = burst
+        self._rates = rates or {}
+        self._max_retries = max_retries
+        self._base_delay = base_delay
+        self._max_delay = max_delay
+        self._registry = registry
+        self._labels = labels
+        self._lock = threading.Lock()
+        self._retries = 0
+
+    def __getattr__(self, name):
+        attr = getattr(self._conn, name)
+        if not callable(attr) or name.startswith('_'):
+            return attr
+
+        # the wrapped connection is a boto connection (or a stand-in), so boto's loaded.
+        from boto.exception import EC2ResponseError
+        with self._lock:
+            # another thread may have made the wrapper meanwhile: share its bucket.
+            if name in self.__dict__:
+                return self.__dict__[name]
+            bucket = TokenBucket(self._rates.get(name, self._rate), self._burst)
+        registry, labels = self._registry, self._labels
+
+        def call(*args, **kwargs):
+            attempt = 0
+            while True:
+                waited = bucket.acquire()
+                if waited:
+                    registry.inc('awsspotmonitor_ec2_throttle_wait_seconds_total', waited, action=name, **labels)
+                try:
+                    return attr(*args, **kwargs)
+                except EC2ResponseError as e:
+                    if classify(e) != 'retryable':
+                        raise
+                    registry.inc('awsspotmonitor_ec2_throttled_total', action=name, **labels)
+                    if attempt >= self._max_retries or not self._spend_retry():
+                        raise
+                registry.inc('awsspotmonitor_ec2_retries_total', action=name, **labels)
+                time.sleep(random.uniform(0, min(self._max_delay, self._base_delay*2**attempt)))
+                attempt += 1
+
+        # cache the wrapper (and its bucket), so later lookups don't come through __getattr__.
+        with self._lock:
+            return self.__dict__.setdefault(name, call)
+
+    def new_cycle(self):
+        """Resets the retry budget."""
+        with self._lock:
+            self._retries = 0
+
+    def _spend_retry(self):
+        with self._lock:
+            if self._retries >= self.budget:
+                return False
+            self._retries += 1
+            return True
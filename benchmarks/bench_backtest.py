@@ -0,0 +1,74 @@
+"""Benchmarks the backtester on a synthetic price history.
+
+Writes months of price history (a random walk with spikes, one sample every few minutes)
+to a CSV file, then times loading it and replaying a sweep over strategies, window lengths
+and bid-raise factors.
+
+usage: python benchmarks/bench_backtest.py [--months 3] [--interval 300] [--days 1,2,5,10]
+                                           [--factors 1.02,1.05,1.1,1.2]
+"""
+from __future__ import absolute_import
+from __future__ import print_function
+
+# standard
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+# pypi
+import numpy as np
+
+# package
+from awsspotmonitor.backtest import BACKTEST_STRATEGIES, Backtest, load_history
+
+
+def write_history(path, months, interval, seed=1):
+    rng = np.random.RandomState(seed)
+    n = int(months*30*24*3600/interval)
+    walk = np.exp(np.cumsum(rng.normal(0, 0.01, n)))
+    spikes = rng.random_sample(n) < 0.002
+    prices = np.round(0.02*walk*np.where(spikes, 5.0, 1.0), 4)
+    with open(path, 'w') as f:
+        f.write('timestamp,price,availability_zone\n')
+        for ts, price in zip(1.3e9 + np.arange(n)*interval, prices):
+            f.write('{0:.0f},{1},us-east-1a\n'.format(ts, price))
+    return n
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--months', type=float, default=3)
+    parser.add_argument('--interval', type=float, default=300)
+    parser.add_argument('--days', default='1,2,5,10')
+    parser.add_argument('--factors', default='1.02,1.05,1.1,1.2')
+    args = parser.parse_args(argv)
+
+    tmpdir = tempfile.mkdtemp()
+    try:
+        path = os.path.join(tmpdir, 'history.csv')
+        n = write_history(path, args.months, args.interval)
+
+        start = time.time()
+        times, prices = load_history(path)['us-east-1a']
+        load_secs = time.time() - start
+
+        start = time.time()
+        backtest = Backtest(times, prices)
+        results = backtest.run(list(BACKTEST_STRATEGIES), [float(d) for d in args.days.split(',')],
+                               [float(f) for f in args.factors.split(',')])
+        run_secs = time.time() - start
+
+        print('samples={0} file_mb={1:.1f} lanes={2} bids={3} load_secs={4:.2f} run_secs={5:.2f}'
+              .format(n, os.path.getsize(path)/1e6, len(results), sum(r['bids'] for r in results),
+                      load_secs, run_secs))
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,114 @@
+"""Benchmarks AwsSpotMonitor against the in-process fake EC2 connection.
+
+For each fleet size, runs a number of monitor cycles (market step, check_requests()) and
+reports per-cycle latency (total, and the monitor's share after subtracting the time spent
+inside the fake), API calls per cycle, and memory. Also times _bucket_requests() and
+request_instances() on their own.
+
+usage: python benchmarks/bench_check_requests.py [--sizes 10,1000,100000] [--cycles 20]
+"""
+from __future__ import absolute_import
+from __future__ import print_function
+
+# standard
+import argparse
+from contextlib import contextmanager
+import gc
+import os
+import resource
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+# package
+from awsspotmonitor.fake_ec2 import FakeEC2Connection
+from awsspotmonitor.spot_monitor import AwsSpotMonitor
+
+
+@contextmanager
+def quiet():
+    stdout = sys.stdout
+    sys.stdout = open(os.devnull, 'w')
+    try:
+        yield
+    finally:
+        sys.stdout.close()
+        sys.stdout = stdout
+
+
+def max_rss_mb():
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss/(1024.0*1024.0) if sys.platform == 'darwin' else rss/1024.0
+
+
+def timed(fn, conn):
+    server = conn.server_secs
+    start = time.time()
+    fn()
+    total = time.time() - start
+    return total, total - (conn.server_secs - server)
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values)-1, int(q*len(values)))]
+
+
+def bench_size(size, cycles, capacity, interruption_rate, throttle_rate):
+    conn = FakeEC2Connection(interruption_rate=interruption_rate, throttle_rate=throttle_rate, seed=1)
+    conn.populate(size, live=min(size, capacity))
+    monitor = AwsSpotMonitor(dict(target_capacity=capacity), conn=conn)
+    gc.collect()
+
+    totals, clients, calls = [], [], []
+    errors = 0
+    with quiet():
+        for _ in range(cycles):
+            conn.step(60)
+            before = sum(conn.calls.values())
+            try:
+                total, client = timed(monitor.check_requests, conn)
+            except Exception:
+                errors += 1
+                continue
+            totals.append(total)
+            clients.append(client)
+            calls.append(sum(conn.calls.values()) - before)
+
+        bucket, _ = timed(monitor._bucket_requests, conn)
+        request, _ = timed(lambda: monitor.request_instances(10), conn)
+
+    return dict(
+        size=size,
+        p50_ms=1000*percentile(totals, 0.5) if totals else float('nan'),
+        p99_ms=1000*percentile(totals, 0.99) if totals else float('nan'),
+        client_ms=1000*sum(clients)/len(clients) if clients else float('nan'),
+        calls=float(sum(calls))/len(calls) if calls else float('nan'),
+        bucket_ms=1000*bucket,
+        request_ms=1000*request,
+        errors=errors,
+        rss_mb=max_rss_mb())
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', default='10,1000,10000,100000')
+    parser.add_argument('--cycles', type=int, default=20)
+    parser.add_argument('--capacity', type=int, default=10)
+    parser.add_argument('--interruption-rate', type=float, default=0.01)
+    parser.add_argument('--throttle-rate', type=float, default=0.0)
+    args = parser.parse_args(argv)
+
+    columns = ('size', 'p50_ms', 'p99_ms', 'client_ms', 'calls', 'bucket_ms', 'request_ms',
+               'errors', 'rss_mb')
+    print(' '.join('{0:>10}'.format(c) for c in columns))
+    for size in [int(s) for s in args.sizes.split(',')]:
+        result = bench_size(size, args.cycles, args.capacity, args.interruption_rate,
+                            args.throttle_rate)
+        print(' '.join('{0:>10.2f}'.format(result[c]) if isinstance(result[c], float)
+                       else '{0:>10}'.format(result[c]) for c in columns))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,85 @@
+"""Benchmarks command-line startup time.
+
+Runs each command in a fresh interpreter a number of times and reports the wall time
+(min and median), and which heavy modules (boto, numpy, smtplib) the command imported.
+The status command reads a journal, so it doesn't need the network.
+
+usage: python benchmarks/bench_startup.py [--runs 10]
+"""
+from __future__ import absolute_import
+from __future__ import print_function
+
+# standard
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+
+# package
+from awsspotmonitor.journal import Journal
+
+HEAVY = ('boto', 'numpy', 'smtplib')
+
+# runs a snippet, then reports which heavy modules it imported.
+PROBE = """
+import sys
+sys.argv = ['awsspotmonitor'] + {argv!r}
+try:
+    {code}
+except SystemExit:
+    pass
+sys.stderr.write(' '.join(m for m in {heavy!r} if m in sys.modules))
+"""
+
+
+def run(code, argv, env):
+    start = time.time()
+    proc = subprocess.Popen([sys.executable, '-c', PROBE.format(code=code, argv=argv, heavy=HEAVY)],
+                            stdout=open(os.devnull, 'w'), stderr=subprocess.PIPE, env=env)
+    _, heavy = proc.communicate()
+    return time.time() - start, heavy.strip().splitlines()[-1] if heavy.strip() else ''
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=10)
+    args = parser.parse_args(argv)
+
+    tmpdir = tempfile.mkdtemp()
+    try:
+        journal = Journal(os.path.join(tmpdir, 'journal.jsonl'))
+        journal.record_request('sir-1', 'fulfilled', 'i-1', 0.02)
+        journal.record_instance('i-1', 'running')
+        journal.commit()
+        journal.close()
+        config = os.path.join(tmpdir, 'config.json')
+        with open(config, 'w') as f:
+            json.dump(dict(journal_path=journal.path), f)
+
+        env = dict(os.environ, PYTHONPATH=ROOT, AWS_ACCESS_KEY_ID='x', AWS_SECRET_ACCESS_KEY='x')
+        cases = (
+            ('python', 'pass', []),
+            ('import package', 'import awsspotmonitor', []),
+            ('--help', 'from awsspotmonitor.cli import main; main()', ['--help']),
+            ('status', 'from awsspotmonitor.cli import main; main()', ['status', config]),
+            ('import all', 'from awsspotmonitor import *', []),
+        )
+        print('{0:>16} {1:>10} {2:>10}  {3}'.format('case', 'min_ms', 'p50_ms', 'imports'))
+        for name, code, case_argv in cases:
+            results = [run(code, case_argv, env) for _ in range(args.runs)]
+            times = sorted(t for t, _ in results)
+            print('{0:>16} {1:>10.1f} {2:>10.1f}  {3}'.format(
+                name, 1000*times[0], 1000*times[len(times)//2], results[-1][1]))
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+if __name__ == '__main__':
+    main()
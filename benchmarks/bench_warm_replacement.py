@@ -0,0 +1,72 @@
+"""Compares capacity gaps with and without warm replacement, against the fake EC2 connection.
+
+Runs a monitor for a number of one-minute cycles (market step, check_requests()) on a
+volatile market, with and without warm_replacement, and reports the minutes in which fewer
+than target_capacity instances were running, the interruptions, and the instances started.
+
+usage: python benchmarks/bench_warm_replacement.py [--cycles 720] [--capacity 4] [--seeds 1,2,3]
+"""
+from __future__ import absolute_import
+from __future__ import print_function
+
+# standard
+import argparse
+from contextlib import contextmanager
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+# package
+from awsspotmonitor.fake_ec2 import FakeEC2Connection
+from awsspotmonitor.metrics import Registry
+from awsspotmonitor.spot_monitor import AwsSpotMonitor
+
+
+@contextmanager
+def quiet():
+    stdout = sys.stdout
+    sys.stdout = open(os.devnull, 'w')
+    try:
+        yield
+    finally:
+        sys.stdout.close()
+        sys.stdout = stdout
+
+
+def simulate(seed, cycles, capacity, strategy, volatility, warm):
+    conn = FakeEC2Connection(volatility=volatility, price_interval=600, seed=seed)
+    monitor = AwsSpotMonitor(dict(target_capacity=capacity, price_strategy=strategy, price_refresh_secs=0,
+                                  hook_workers=0, warm_replacement=warm), conn=conn, metrics=Registry())
+    gap = 0
+    with quiet():
+        for _ in range(cycles):
+            conn.step(60)
+            monitor.check_requests()
+            running = sum(1 for r in conn.requests.values()
+                          if r.status.code == 'fulfilled' and conn.instances[r.instance_id].state == 'running')
+            gap += running < capacity
+    interrupted = sum(1 for r in conn.requests.values() if r.status.code == 'instance-terminated-by-price')
+    return dict(gap_mins=gap, interrupted=interrupted, started=len(conn.instances))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--cycles', type=int, default=720)
+    parser.add_argument('--capacity', type=int, default=4)
+    parser.add_argument('--strategy', default='average')
+    parser.add_argument('--volatility', type=float, default=0.02)
+    parser.add_argument('--seeds', default='1,2,3')
+    args = parser.parse_args(argv)
+
+    columns = ('seed', 'warm', 'gap_mins', 'interrupted', 'started')
+    print(' '.join('{0:>12}'.format(c) for c in columns))
+    for seed in [int(s) for s in args.seeds.split(',')]:
+        for warm in (False, True):
+            result = simulate(seed, args.cycles, args.capacity, args.strategy, args.volatility, warm)
+            result.update(seed=seed, warm=warm)
+            print(' '.join('{0:>12}'.format(result[c]) for c in columns))
+
+
+if __name__ == '__main__':
+    main()
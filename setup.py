@@ -26,6 +26,14 @@ setup(
     ],
 
     install_requires=[
-        'boto >= 2.8.0'
-    ]
+        'boto >= 2.8.0',
+        'futures >= 2.1',
+        'numpy >= 1.7'
+    ],
+
+    entry_points={
+        'console_scripts': [
+            'awsspotmonitor = awsspotmonitor.cli:main'
+        ]
+    }
 )